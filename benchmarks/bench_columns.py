@@ -0,0 +1,61 @@
+"""Память и скорость агрегатов: колонки против списка dataclass-объектов.
+
+python -m benchmarks.bench_columns [rows]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from services.data_models import Transaction, TransactionColumns
+
+
+def make_rows(rows: int, seed: int = 42) -> list[tuple]:
+    rnd = random.Random(seed)
+    return [(rnd.randint(100, 50000), str(rnd.randint(10 ** 6, 10 ** 7)), rnd.choice((0, 0, 15, 30.5)))
+            for _ in range(rows)]
+
+
+def build_objects(rows: list[tuple]) -> list[Transaction]:
+    return [Transaction(amount=a, transaction_id=i, commission=c) for a, i, c in rows]
+
+
+def build_columns(rows: list[tuple]) -> TransactionColumns:
+    columns = TransactionColumns()
+    for a, i, c in rows:
+        columns.add(a, i, c)
+    return columns
+
+
+def measure(build, rows: list[tuple]):
+    tracemalloc.start()
+    result = build(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(func, repeat: int = 20) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def main(count: int):
+    rows = make_rows(count)
+    # ID-строки dataclass-варианта берутся из исходных данных и в замер не входят,
+    # а колонки копируют их в свой буфер: оценка выигрыша колонок занижена
+    objects, objects_size = measure(build_objects, rows)
+    columns, columns_size = measure(build_columns, rows)
+
+    objects_sum = timed(lambda: sum(t.commission for t in objects))
+    columns_sum = timed(columns.total_commission)
+
+    print(f"rows: {count}")
+    print(f"dataclasses: {objects_size / 1024 / 1024:.2f} MiB, commission sum {objects_sum * 1000:.2f} ms")
+    print(f"columns:     {columns_size / 1024 / 1024:.2f} MiB, commission sum {columns_sum * 1000:.2f} ms")
+    print(f"memory ratio: {objects_size / columns_size:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,86 @@
+"""Стоимость отсева повторов (DedupIndex) относительно разбора книги на ~100 тыс. ID.
+
+Замеряется ожидание проверки листа — то, на что задерживается отчет; запись ID после обработки
+выводится отдельно. Таблица масок фильтра строится заранее, как при прогреве бота. Сценарии:
+первая загрузка в пустой индекс, повторная отправка той же книги (повторов нет), другая книга
+с теми же ID (все ID — повторы) и загрузка новых ID при истории оператора в HISTORY ID.
+Код выхода 1, если проверка новых ID дороже BUDGET от времени разбора.
+
+python -m benchmarks.bench_dedup [rows]
+"""
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from services.data_models import ExcelSheetData
+from services.dedup import DedupIndex
+from services.excel_processor import ExcelProcessor
+from benchmarks.workbook import cached_workbook
+
+# ~1.3 ID на строку синтетической книги: 77 тыс. строк дают около 100 тыс. ID
+DEFAULT_ROWS = 77_000
+BUDGET = 0.05
+HISTORY = 1_000_000
+OPERATOR_ID = 1
+
+
+def history_sheet(count: int, seed: int = 7) -> ExcelSheetData:
+    rnd = random.Random(seed)
+    data = ExcelSheetData(*(None,) * 9)
+    for _ in range(count):
+        data.inflows.add(1000, f"H{rnd.randint(10 ** 11, 10 ** 12)}")
+    return data
+
+
+async def mark(index: DedupIndex, data: ExcelSheetData, upload: str) -> dict:
+    data.clear_duplicates()
+    batch = index.batch(OPERATOR_ID, upload)
+    started = time.perf_counter()
+    duplicates = await index.mark_duplicates(batch, data)
+    checked = time.perf_counter() - started
+    await index.record(batch)
+    return {"check_s": round(checked, 4), "record_s": round(time.perf_counter() - started - checked, 4),
+            "duplicates": duplicates}
+
+
+async def run(data: ExcelSheetData) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        index = DedupIndex(Path(root))
+        await index.warm_up()
+        results["empty_index"] = await mark(index, data, "book")
+        results["same_upload"] = await mark(index, data, "book")
+        results["other_upload"] = await mark(index, data, "other")
+
+    with tempfile.TemporaryDirectory() as root:
+        index = DedupIndex(Path(root))
+        await mark(index, history_sheet(HISTORY), "history")
+        # Новая копия индекса читает фильтр с диска, как после перезапуска бота
+        index = DedupIndex(Path(root))
+        results["with_history"] = await mark(index, data, "book")
+    return results
+
+
+def main(rows: int) -> bool:
+    path = cached_workbook(1, rows)
+    started = time.perf_counter()
+    data = ExcelProcessor.process_workbook(path, 3)["Agent0"]
+    parse_s = time.perf_counter() - started
+
+    results = {
+        "ids": len(data.inflows) + len(data.outflows),
+        "parse_s": round(parse_s, 3),
+        **asyncio.run(run(data)),
+        "budget": BUDGET
+    }
+    overhead = max(results["empty_index"]["check_s"], results["with_history"]["check_s"]) / parse_s
+    results["overhead"] = round(overhead, 4)
+    print(json.dumps(results, indent=2))
+    return overhead <= BUDGET
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS) else 1)
@@ -0,0 +1,98 @@
+"""Память выгрузки истории в XLSX (HistoryExporter) на 100 тыс. и 1 млн синтетических транзакций.
+
+Транзакции записываются в Postgres через TransactionStore под двумя служебными операторами, каждая
+выгрузка выполняется в отдельном процессе, и сравнивается пиковый RSS этих процессов. Код выхода 1,
+если выгрузка 1 млн строк требует больше памяти, чем выгрузка 100 тыс., плюс FLAT_TOLERANCE_MB.
+Данные удаляются после замера.
+
+python -m benchmarks.bench_history_export [rows]
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from config import BASE_DIR
+from database import create_engine, create_session_factory
+from services.history_export import HistoryExporter
+from services.persistence import TransactionStore
+from benchmarks.bench_persistence import make_sheet, cleanup
+
+SMALL_ROWS = 100_000
+DEFAULT_ROWS = 1_000_000
+ROWS_PER_SHEET = 10_000
+SHEETS_PER_SAVE = 10
+FLAT_TOLERANCE_MB = 32
+FIRST_DAY = date(2001, 1, 1)
+
+
+def operator_name(rows: int) -> str:
+    return f"benchmark_export_{rows}"
+
+
+async def seed(session_factory, rows: int):
+    """rows транзакций листами по ROWS_PER_SHEET, по смене в день начиная с FIRST_DAY"""
+    sheets = []
+    for i in range(0, rows, ROWS_PER_SHEET):
+        data = make_sheet(min(ROWS_PER_SHEET, rows - i), seed=i)
+        data.start_time = datetime.combine(FIRST_DAY, datetime.min.time()) + timedelta(days=len(sheets))
+        sheets.append(data)
+    for start in range(0, len(sheets), SHEETS_PER_SAVE):
+        async with session_factory() as session:
+            await TransactionStore.save_workbook(session, operator_name(rows), sheets[start:start + SHEETS_PER_SAVE])
+
+
+async def probe(operator: str) -> dict:
+    """Выгрузка всей истории оператора во временный файл; выполняется в отдельном процессе"""
+    engine = create_engine()
+    session_factory = create_session_factory(engine)
+    try:
+        async with session_factory() as session:
+            started = time.perf_counter()
+            async with HistoryExporter.spooled(session, FIRST_DAY, date(2100, 1, 1), operator) as (path, counts):
+                size = path.stat().st_size
+            elapsed = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+    return {
+        "rows": sum(counts.values()), "seconds": round(elapsed, 2), "file_mb": round(size / 1024 / 1024, 1),
+        # ru_maxrss в Linux — килобайты
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def run_probe(operator: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_history_export", "--probe", operator],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+async def main(rows: int) -> bool:
+    engine = create_engine()
+    session_factory = create_session_factory(engine)
+    sizes = (SMALL_ROWS, rows)
+    operators = tuple(operator_name(size) for size in sizes)
+    try:
+        await cleanup(session_factory, operators)
+        for size in sizes:
+            await seed(session_factory, size)
+        results = {str(size): await asyncio.to_thread(run_probe, operator_name(size)) for size in sizes}
+    finally:
+        await cleanup(session_factory, operators)
+        await engine.dispose()
+
+    growth = results[str(rows)]["max_rss_mb"] - results[str(SMALL_ROWS)]["max_rss_mb"]
+    print(json.dumps({**results, "rss_growth_mb": round(growth, 1), "budget_mb": FLAT_TOLERANCE_MB}, indent=2))
+    return growth <= FLAT_TOLERANCE_MB
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--probe":
+        print(json.dumps(asyncio.run(probe(sys.argv[2]))))
+        sys.exit(0)
+    ok = asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS))
+    sys.exit(0 if ok else 1)
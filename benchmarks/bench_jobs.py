@@ -0,0 +1,48 @@
+"""Пропускная способность JobQueue в зависимости от числа воркеров.
+
+Задача имитирует обработку файла: ожидание загрузки и отправок (sleep) плюс немного работы
+в цикле событий. Файлы загружают operators операторов, у каждого не больше одной задачи сразу.
+
+python -m benchmarks.bench_jobs [jobs] [operators]
+"""
+import asyncio
+import sys
+import time
+from services.jobs import FileJob, JobQueue
+
+WORKER_COUNTS = (1, 2, 4, 8, 16)
+IO_DELAY = 0.05
+
+
+async def fake_job(job: FileJob):
+    await asyncio.sleep(IO_DELAY)
+
+
+async def on_error(job: FileJob, error: Exception):
+    raise error
+
+
+async def run(workers: int, jobs: int, operators: int) -> float:
+    queue = JobQueue(fake_job, on_error, workers=workers, per_operator=1, max_pending=jobs)
+    queue.start()
+    started = time.perf_counter()
+    for i in range(jobs):
+        queue.submit(FileJob(i % operators, None, 3.0))
+    while queue.completed + queue.failed < jobs:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    return elapsed
+
+
+async def main(jobs: int, operators: int):
+    for workers in WORKER_COUNTS:
+        elapsed = await run(workers, jobs, operators)
+        print(f"{workers:>3} workers: {jobs / elapsed:7.1f} jobs/s ({elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    ))
@@ -0,0 +1,69 @@
+"""Бенчмарк массовой записи книги в Postgres: python -m benchmarks.bench_persistence [rows]"""
+import asyncio
+import random
+import sys
+import time
+from sqlalchemy import delete, select
+from database import create_engine, create_session_factory
+from models import AgentSessions, DailyRollups, Operators, Transactions
+from services.data_models import ExcelSheetData, Transaction, BaibitTransaction
+from services.persistence import TransactionStore
+
+BUDGET_SECONDS = 1.0
+OPERATOR = "benchmark_operator"
+
+
+def make_sheet(rows: int, seed: int = 42) -> ExcelSheetData:
+    rnd = random.Random(seed)
+    data = ExcelSheetData(
+        full_name="Benchmark Agent", bank="Bank", warm_up_purchases=0, warm_up_rub=0,
+        start_balance=0, stop_balance=0, start_time=None, end_time=None, operator=OPERATOR,
+        inflows=[], outflows=[], baibit=[], agent_percent=3
+    )
+    for i in range(rows):
+        kind = i % 10
+        if kind < 6:
+            data.inflows.append(Transaction(amount=rnd.randint(100, 50000), transaction_id=f"D{i}"))
+        elif kind < 9:
+            data.outflows.append(Transaction(amount=rnd.randint(100, 50000), transaction_id=f"W{i}",
+                                             commission=rnd.randint(0, 100)))
+        else:
+            data.baibit.append(BaibitTransaction(amount=rnd.randint(100, 5000), rate=rnd.uniform(90, 100)))
+    data.turnover = sum(t.amount for t in data.inflows)
+    data.calculate_payments()
+    return data
+
+
+async def cleanup(session_factory, operators: tuple = (OPERATOR,)):
+    async with session_factory() as session, session.begin():
+        operator_ids = select(Operators.id).where(Operators.username.in_(operators))
+        session_ids = select(AgentSessions.id).where(AgentSessions.operator_id.in_(operator_ids))
+        await session.execute(delete(Transactions).where(Transactions.agent_session_id.in_(session_ids)))
+        await session.execute(delete(AgentSessions).where(AgentSessions.operator_id.in_(operator_ids)))
+        await session.execute(delete(DailyRollups).where(DailyRollups.operator_id.in_(operator_ids)))
+
+
+async def main(rows: int):
+    engine = create_engine()
+    session_factory = create_session_factory(engine)
+    data = make_sheet(rows)
+    try:
+        # Прогрев пула соединений и кэша выражений
+        async with session_factory() as session:
+            await TransactionStore.save_workbook(session, OPERATOR, [make_sheet(10)])
+
+        async with session_factory() as session:
+            started = time.perf_counter()
+            await TransactionStore.save_workbook(session, OPERATOR, [data])
+            elapsed = time.perf_counter() - started
+
+        print(f"persisted {rows} rows in {elapsed:.3f}s ({rows / elapsed:,.0f} rows/s)")
+        return elapsed <= BUDGET_SECONDS
+    finally:
+        await cleanup(session_factory)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,57 @@
+"""Задержка SessionManager.get_summary по мере роста сессии и апдейта через open_session
+(как у обработчиков бота): python -m benchmarks.bench_session [agents]"""
+import asyncio
+import random
+import sys
+import time
+from config import ensure_storage_dirs
+from services.session_manager import SessionManager, open_session
+
+OPERATOR_ID = "benchmark"
+CHECKPOINTS = (100, 1000, 10000)
+UPDATES = 200
+
+
+async def open_session_updates(rnd: random.Random) -> tuple[float, float]:
+    """(первое открытие с загрузкой с диска, среднее на апдейт после него), мс"""
+    timings = []
+    for i in range(UPDATES + 1):
+        started = time.perf_counter()
+        async with open_session(OPERATOR_ID) as manager:
+            await asyncio.to_thread(manager.add_agent, f"update {i}", rnd.uniform(1000, 1_000_000), 3, "Сбер")
+        timings.append(time.perf_counter() - started)
+    return timings[0] * 1000, sum(timings[1:]) / UPDATES * 1000
+
+
+def main(agents: int):
+    ensure_storage_dirs()
+    rnd = random.Random(42)
+    manager = SessionManager(OPERATOR_ID)
+    try:
+        added = 0
+        add_elapsed = 0.0
+        for checkpoint in [c for c in CHECKPOINTS if c < agents] + [agents]:
+            started = time.perf_counter()
+            while added < checkpoint:
+                manager.add_agent(f"agent {added}", rnd.uniform(1000, 1_000_000),
+                                  rnd.choice((2, 3, 3.5)), rnd.choice(("Сбер", "Тинькофф", "Альфа")))
+                added += 1
+            add_elapsed += time.perf_counter() - started
+
+            repeat = 1000
+            summary_started = time.perf_counter()
+            for _ in range(repeat):
+                manager.get_summary()
+            summary_us = (time.perf_counter() - summary_started) / repeat * 1_000_000
+
+            print(f"{added:>6} agents: get_summary {summary_us:7.1f} us, add_agent {add_elapsed / added * 1000:.3f} ms avg")
+
+        manager.close()
+        first_ms, update_ms = asyncio.run(open_session_updates(rnd))
+        print(f"open_session: first {first_ms:.1f} ms (load from disk), then {update_ms:.3f} ms per update")
+    finally:
+        manager.finish()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,120 @@
+"""Время запуска бота: импорт стартового пути и время до ответа на первый апдейт.
+
+Импорт и создание хранилища FSM замеряются в отдельном интерпретаторе; заодно проверяется,
+что openpyxl и SQLAlchemy не загружаются до первого использования. Для первого апдейта поднимается
+поддельный Bot API (benchmarks.bench_webhook.FakeBotApi) с уже ожидающим /start, бот запускается как
+`python main.py` в polling с настройками по умолчанию и замеряется время до его sendMessage.
+Хранилище FSM по умолчанию — sql, поэтому нужна БД из .env, как для benchmarks.bench_persistence.
+Код выхода 1 при превышении бюджета.
+
+python -m benchmarks.bench_startup [runs]
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from aiohttp import web
+from config import BASE_DIR, STORAGE_DIR
+from benchmarks.bench_webhook import FakeBotApi, API_PORT, TOKEN
+
+IMPORT_BUDGET = 1.0
+FIRST_UPDATE_BUDGET = 3.0
+LAZY_MODULES = ("openpyxl", "sqlalchemy")
+USER_ID = 990000001
+
+IMPORT_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+from services import bot_handler, fsm_storage, middlewares, outbound, worker_pool
+import database
+asyncio.run(fsm_storage.create_fsm_storage(database.Database()))
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+class ReplyWatcher(FakeBotApi):
+    def __init__(self):
+        super().__init__()
+        self.replied = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.match_info["method"].lower() == "sendmessage":
+            self.replied.set()
+        return await super().handle(request)
+
+
+def bot_env() -> dict:
+    return dict(
+        os.environ, BOT_TOKEN=TOKEN, BOT_MODE="polling", WORKER_PROCESSES="2",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{API_PORT}", METRICS_ENABLED="0"
+    )
+
+
+def measure_import() -> tuple[float, list]:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(lazy=LAZY_MODULES)],
+        cwd=BASE_DIR, env=bot_env(), capture_output=True, text=True, check=True
+    )
+    probe = json.loads(result.stdout)
+    return probe["elapsed"], probe["loaded"]
+
+
+async def measure_first_update(update_id: int, timeout: float = 30) -> float:
+    api = ReplyWatcher()
+    runner = web.AppRunner(api.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+    process = None
+    try:
+        await api.publish({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()),
+                "chat": {"id": USER_ID, "type": "private"},
+                "from": {"id": USER_ID, "is_bot": False, "first_name": "op"},
+                "text": "/start"
+            }
+        })
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "main.py", cwd=BASE_DIR, env=bot_env(),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        await asyncio.wait_for(api.replied.wait(), timeout)
+        return time.perf_counter() - started
+    finally:
+        if process is not None and process.returncode is None:
+            process.terminate()
+            await process.wait()
+        await runner.cleanup()
+        for path in STORAGE_DIR.glob(f"operator_{USER_ID}.*"):
+            path.unlink(missing_ok=True)
+
+
+async def main(runs: int) -> bool:
+    imports, first_updates, loaded = [], [], set()
+    for run in range(runs):
+        elapsed, lazy_loaded = measure_import()
+        imports.append(elapsed)
+        loaded.update(lazy_loaded)
+        first_updates.append(await measure_first_update(run + 1))
+
+    results = {
+        "import_s": round(statistics.median(imports), 3),
+        "first_update_s": round(statistics.median(first_updates), 3),
+        "eagerly_loaded": sorted(loaded),
+        "budget": {"import_s": IMPORT_BUDGET, "first_update_s": FIRST_UPDATE_BUDGET}
+    }
+    print(json.dumps(results, indent=2))
+    return (results["import_s"] <= IMPORT_BUDGET and results["first_update_s"] <= FIRST_UPDATE_BUDGET
+            and not loaded)
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,173 @@
+"""Задержка от появления апдейта до вызова обработчика: polling против webhook.
+
+Поднимается поддельный Bot API (getMe/getUpdates с long polling), бот подключается к нему
+через TelegramAPIServer. В режиме webhook тот же поток апдейтов отправляется POST-запросами
+на WebhookServer, как это делает Telegram.
+
+python -m benchmarks.bench_webhook [updates] [interval_ms]
+"""
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from services.webhook import WebhookServer, SECRET_HEADER
+
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+SECRET = "benchmark-secret"
+TOKEN = "42:benchmark"
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.updates = []
+        self.arrived = asyncio.Condition()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def publish(self, update: dict):
+        async with self.arrived:
+            self.updates.append(update)
+            self.arrived.notify_all()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        if method == "getme":
+            return self._ok({"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"})
+        if method == "getupdates":
+            form = await request.post()
+            offset = int(form.get("offset") or 0)
+            timeout = float(form.get("timeout") or 0)
+            async with self.arrived:
+                try:
+                    await asyncio.wait_for(
+                        self.arrived.wait_for(lambda: self._pending(offset)), timeout
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                return self._ok(self._pending(offset))
+        return self._ok(True)
+
+    def _pending(self, offset: int) -> list:
+        return [u for u in self.updates if u["update_id"] >= offset]
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "op"},
+            "text": "ping"
+        }
+    }
+
+
+def build(latencies: list, produced: dict):
+    dp = Dispatcher()
+
+    async def on_message(message):
+        latencies.append(time.perf_counter() - produced[message.message_id])
+
+    dp.message.register(on_message)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}"))
+    return dp, Bot(token=TOKEN, session=session)
+
+
+async def wait_for(latencies: list, count: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while len(latencies) < count and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def bench_polling(api: FakeBotApi, count: int, interval: float) -> list:
+    latencies, produced = [], {}
+    dp, bot = build(latencies, produced)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.5)
+
+    async def send(update):
+        await api.publish(update)
+
+    await produce_into(produced, count, interval, send)
+    await wait_for(latencies, count)
+    await dp.stop_polling()
+    await polling
+    return latencies
+
+
+async def bench_webhook(count: int, interval: float) -> list:
+    latencies, produced = [], {}
+    dp, bot = build(latencies, produced)
+    server = WebhookServer(dp, bot, secret=SECRET, path="/webhook")
+    await server.start("127.0.0.1", WEBHOOK_PORT)
+
+    async with ClientSession() as client:
+        async def post(update):
+            async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json=update,
+                                   headers={SECRET_HEADER: SECRET}) as response:
+                response.raise_for_status()
+
+        async def send(update):
+            # Как Telegram: запрос не блокирует следующий апдейт
+            asyncio.create_task(post(update))
+
+        await produce_into(produced, count, interval, send)
+        await wait_for(latencies, count)
+
+    await server.stop()
+    await bot.session.close()
+    return latencies
+
+
+async def produce_into(produced: dict, count: int, interval: float, send) -> dict:
+    rnd = random.Random(1)
+    for update_id in range(1, count + 1):
+        await asyncio.sleep(rnd.expovariate(1 / interval))
+        produced[update_id] = time.perf_counter()
+        await send(make_update(update_id))
+    return produced
+
+
+def summarize(latencies: list) -> dict:
+    ms = sorted(x * 1000 for x in latencies)
+    return {
+        "updates": len(ms),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p99_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.99))], 3),
+        "max_ms": round(ms[-1], 3)
+    }
+
+
+async def main(count: int, interval: float):
+    api = FakeBotApi()
+    runner = web.AppRunner(api.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+    try:
+        results = {
+            "polling": summarize(await bench_polling(api, count, interval)),
+            "webhook": summarize(await bench_webhook(count, interval)),
+        }
+    finally:
+        await runner.cleanup()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+                     (float(sys.argv[2]) if len(sys.argv) > 2 else 2.0) / 1000))
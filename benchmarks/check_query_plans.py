@@ -0,0 +1,80 @@
+"""Проверка планов запросов Repository через EXPLAIN: python -m benchmarks.check_query_plans [--sample]
+
+Seq scan запрещается на время проверки: если планировщик не может использовать ожидаемый индекс,
+скрипт завершается с ошибкой. На почти пустых таблицах оценки индексов agent_sessions совпадают
+и выбор между ними случаен, поэтому с --sample (так запускает тест) проверка идет в транзакции
+с синтетическими сменами, дневными итогами и их статистикой, которая затем откатывается.
+"""
+import asyncio
+import sys
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from database import create_engine
+from services.repository import Repository
+from services.rollups import RollupStore
+
+PERIOD = (datetime(2025, 1, 1), datetime(2025, 2, 1))
+SAMPLE_OPERATORS = 50
+SAMPLE_AGENTS = 500
+SAMPLE_SESSIONS = 20_000
+
+SAMPLE_SQL = [
+    f"INSERT INTO operators (username) SELECT 'plan sample ' || i FROM generate_series(1, {SAMPLE_OPERATORS}) i",
+    f"INSERT INTO agents (full_name) SELECT 'plan sample ' || i FROM generate_series(1, {SAMPLE_AGENTS}) i",
+    f"INSERT INTO agent_sessions (agent_id, operator_id, session_start) "
+    f"SELECT a.id, o.id, timestamp '2024-01-01' + i * interval '1 hour' FROM generate_series(1, {SAMPLE_SESSIONS}) i "
+    f"JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM agents "
+    f"      WHERE full_name LIKE 'plan sample %') a ON a.n = i % {SAMPLE_AGENTS} "
+    f"JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM operators "
+    f"      WHERE username LIKE 'plan sample %') o ON o.n = i % {SAMPLE_OPERATORS}",
+    "INSERT INTO daily_rollups SELECT s.operator_id, s.session_start::date, s.agent_id, count(*), 0, 0, 0, 0, 0, 0, 0 "
+    "FROM agent_sessions s JOIN agents a ON a.id = s.agent_id WHERE a.full_name LIKE 'plan sample %' "
+    "GROUP BY 1, 2, 3",
+    # ANALYZE в транзакции видит ее строки, а его статистика откатывается вместе с ней
+    "ANALYZE operators, agents, agent_sessions, daily_rollups",
+]
+
+EXPECTED_PLANS = [
+    ("operator sessions", Repository.operator_sessions_query(1, *PERIOD),
+     ["ix_agent_sessions_operator_id_session_start"]),
+    ("agent sessions", Repository.agent_sessions_query(1, *PERIOD),
+     ["ix_agent_sessions_agent_id_session_start"]),
+    ("session transactions", Repository.session_transactions_query(1),
+     ["ix_transactions_agent_session_id_id"]),
+    ("transaction by external id", Repository.transaction_by_external_id_query("D1"),
+     ["ix_transactions_deposit_id", "ix_transactions_withdraw_id"]),
+    ("agent phones", Repository.agent_phones_query(1),
+     ["ix_agent_phones_agent_id"]),
+    ("operator period rollups", RollupStore.operator_period_query("1", date(2025, 1, 1), date(2025, 2, 1)),
+     ["daily_rollups_pkey"]),
+    ("agent period rollups", RollupStore.agent_period_query(1, date(2025, 1, 1), date(2025, 2, 1)),
+     ["ix_daily_rollups_agent_id_day"]),
+]
+
+
+async def main(sample: bool = False) -> bool:
+    engine = create_engine()
+    ok = True
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SET enable_seqscan = off"))
+            if sample:
+                for sql in SAMPLE_SQL:
+                    await connection.execute(text(sql))
+            for name, query, indexes in EXPECTED_PLANS:
+                sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+                plan = "\n".join((await connection.execute(text(f"EXPLAIN {sql}"))).scalars())
+                missing = [index for index in indexes if index not in plan]
+                status = "ok" if not missing else f"MISSING {', '.join(missing)}"
+                print(f"{name}: {status}")
+                if missing:
+                    print(plan)
+                    ok = False
+    finally:
+        await engine.dispose()
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(sample="--sample" in sys.argv[1:])) else 1)
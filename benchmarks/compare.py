@@ -0,0 +1,47 @@
+"""Сравнение двух прогонов benchmarks.suite: python -m benchmarks.compare base.json new.json [--threshold 0.1]
+
+Код выхода 1, если хотя бы один замер медленнее базового больше чем на threshold.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    """Печать таблицы изменений; возвращает имена замеров с регрессией"""
+    regressions = []
+    print(f"{'benchmark':<45} {base['commit']:>12} {new['commit']:>12}   change")
+    for name in sorted(base["results"].keys() | new["results"].keys()):
+        old, cur = base["results"].get(name), new["results"].get(name)
+        if old is None or cur is None:
+            print(f"{name:<45} {'-' if old is None else 'ok':>12} {'-' if cur is None else 'ok':>12}   missing")
+            continue
+        change = cur["seconds"] / old["seconds"] - 1
+        mark = ""
+        if change > threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<45} {old['seconds'] * 1000:10.2f}ms {cur['seconds'] * 1000:10.2f}ms {change:+8.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    regressions = compare(load(args.base), load(args.new), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Набор бенчмарков с сохранением результатов в JSON для сравнения между коммитами.
+
+Замеряются ExcelProcessor.process_workbook, ReportGenerator.generate, SessionManager.add_agent/get_summary
+и сохранение файлов FileManager на синтетических книгах заданных размеров (листы x строки).
+Для каждого замера берется лучшее время из --repeat запусков.
+
+python -m benchmarks.suite [--sizes 1x100,10x1000] [--repeat 3] [--output results/<commit>.json]
+Сравнение: python -m benchmarks.compare base.json new.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from config import ensure_storage_dirs, USER_FILES_DIR, REPORTS_DIR, DOWNLOAD_CHUNK_SIZE
+from services.excel_processor import ExcelProcessor
+from services.file_manager import FileManager
+from services.report_generator import ReportGenerator
+from services.session_manager import SessionManager
+from benchmarks.workbook import cached_workbook
+
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_SIZES = "1x100,10x1000,40x5000"
+# Полный набор, включая книгу на 5 млн строк (генерация и разбор занимают минуты)
+ALL_SIZES = "1x100,10x1000,40x5000,100x50000"
+SESSION_AGENTS = (100, 1000, 10000)
+BENCHMARK_USER = "benchmark"
+
+
+def parse_sizes(value: str) -> list[tuple[int, int]]:
+    return [tuple(int(n) for n in size.split("x")) for size in value.split(",") if size]
+
+
+def best_of(func, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - started)
+    return {"seconds": min(runs), "runs": runs}
+
+
+def bench_workbook(results: dict, sheets: int, rows: int, repeat: int):
+    path = cached_workbook(sheets, rows)
+    size = f"{sheets}x{rows}"
+
+    parsed = {}
+
+    def parse():
+        parsed.clear()
+        parsed.update(ExcelProcessor.process_workbook(path, 3))
+
+    result = best_of(parse, repeat)
+    result["rows_per_second"] = sheets * rows / result["seconds"]
+    results[f"excel.process_workbook[{size}]"] = result
+
+    for sheet_name, sheet_data in parsed.items():
+        sheet_data.sheet_name = sheet_name
+    result = best_of(lambda: [ReportGenerator.generate(sheet_data) for sheet_data in parsed.values()], repeat)
+    result["rows_per_second"] = sheets * rows / result["seconds"]
+    results[f"report.generate[{size}]"] = result
+
+    content = path.read_bytes()
+    report = ReportGenerator.generate(next(iter(parsed.values())))
+
+    def save_user_file():
+        # Повторная загрузка того же содержимого не пишет файл: каждый замер с пустого каталога
+        shutil.rmtree(USER_FILES_DIR / BENCHMARK_USER, ignore_errors=True)
+        asyncio.run(FileManager.save_user_file(BENCHMARK_USER, iter_chunks(content)))
+
+    results[f"file_manager.save_user_file[{size}]"] = best_of(save_user_file, repeat)
+    results[f"file_manager.save_report[{size}]"] = best_of(
+        lambda: asyncio.run(FileManager.save_report(BENCHMARK_USER, "Agent0", report)), repeat
+    )
+
+
+async def iter_chunks(content: bytes):
+    for offset in range(0, len(content), DOWNLOAD_CHUNK_SIZE):
+        yield content[offset:offset + DOWNLOAD_CHUNK_SIZE]
+
+
+def bench_session(results: dict, repeat: int):
+    for agents in SESSION_AGENTS:
+        manager = SessionManager(BENCHMARK_USER)
+        try:
+            def add():
+                for i in range(agents):
+                    manager.add_agent(f"agent {i}", 1000 + i * 37 % 100_000, (2, 3, 3.5)[i % 3],
+                                      ("Сбер", "Тинькофф", "Альфа")[i % 3])
+
+            # Один проход: повтор добавил бы агентов в ту же сессию
+            result = best_of(add, 1)
+            result["per_call_seconds"] = result["seconds"] / agents
+            results[f"session.add_agent[{agents}]"] = result
+
+            result = best_of(lambda: [manager.get_summary() for _ in range(100)], repeat)
+            result["per_call_seconds"] = result["seconds"] / 100
+            results[f"session.get_summary[{agents}]"] = result
+        finally:
+            manager.finish()
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"листы x строки через запятую, все: {ALL_SIZES}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="JSON с результатами (по умолчанию results/<commit>.json)")
+    args = parser.parse_args()
+
+    ensure_storage_dirs()
+    commit = current_commit()
+    results = {}
+    try:
+        for sheets, rows in parse_sizes(args.sizes):
+            # Книга на 5 млн строк разбирается минутами: один проход
+            bench_workbook(results, sheets, rows, 1 if sheets * rows >= 1_000_000 else args.repeat)
+        bench_session(results, args.repeat)
+    finally:
+        shutil.rmtree(USER_FILES_DIR / BENCHMARK_USER, ignore_errors=True)
+        shutil.rmtree(REPORTS_DIR / BENCHMARK_USER, ignore_errors=True)
+
+    for name, result in results.items():
+        print(f"{name:<45} {result['seconds'] * 1000:10.2f} ms")
+
+    output = args.output or RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }, indent=2, ensure_ascii=False))
+    print(f"saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Генератор синтетических книг в формате, который разбирает ExcelProcessor.
+
+Строка 1 — заголовки колонок, со строки 2 — транзакции: A..B входные (сумма, ID), C..E выходные
+(сумма, ID, комиссия), F..G Байбит (сумма, курс). Шапка агента — K2..T2. Содержимое ячеек
+полностью определяется seed, поэтому результаты разных запусков сравнимы.
+
+python -m benchmarks.workbook sheets rows [path]
+"""
+import random
+import sys
+from pathlib import Path
+from openpyxl import Workbook
+
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+TITLES = (
+    "Вход", "ID", "Выход", "ID", "Комиссия", "Байбит", "Курс", None, None, None,
+    "ФИО", "Банк", "Прогревы", "Прогревы, руб", None, "Оператор", "Старт баланс", "Стоп баланс", "Старт", "Стоп"
+)
+BANKS = ("Сбер", "Тинькофф", "Альфа", "ВТБ", "Райффайзен")
+NAMES = ("Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Новиков")
+
+
+def iter_sheet_rows(rnd: random.Random, index: int, rows: int):
+    header = (
+        f"{rnd.choice(NAMES)} Агент {index}", rnd.choice(BANKS), rnd.randint(0, 20), rnd.randint(0, 5000), None,
+        f"@operator{rnd.randint(1, 5)}", rnd.randint(0, 100_000), rnd.randint(0, 100_000),
+        f"{rnd.randint(8, 11)}:00", f"{rnd.randint(17, 22)}:00"
+    )
+    for i in range(rows):
+        row = [None] * 7
+        if rnd.random() < 0.8:
+            row[0:2] = rnd.randint(100, 50_000), f"D{rnd.randint(10 ** 9, 10 ** 10)}"
+        if rnd.random() < 0.5:
+            row[2:5] = rnd.randint(100, 50_000), f"W{rnd.randint(10 ** 9, 10 ** 10)}", rnd.choice((0, 0, 15, 30.5))
+        if rnd.random() < 0.05:
+            row[5:7] = rnd.randint(100, 5_000), round(rnd.uniform(90, 100), 2)
+        yield row + ([None] * 3 + list(header) if i == 0 else [])
+
+
+def generate_workbook(path: Path, sheets: int, rows: int, seed: int = 42) -> Path:
+    """Книга из sheets листов по rows строк транзакций; пишется потоково (write-only)"""
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for index in range(sheets):
+        ws = wb.create_sheet(f"Agent{index}")
+        ws.append(TITLES)
+        for row in iter_sheet_rows(rnd, index, rows):
+            ws.append(row)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".part")
+    wb.save(tmp_path)
+    tmp_path.replace(path)
+    return path
+
+
+def cached_workbook(sheets: int, rows: int, seed: int = 42) -> Path:
+    """Книга из кэша benchmarks/.cache: большие размеры генерируются минутами"""
+    path = CACHE_DIR / f"workbook_{sheets}x{rows}_{seed}.xlsx"
+    if not path.exists():
+        generate_workbook(path, sheets, rows, seed)
+    return path
+
+
+if __name__ == "__main__":
+    sheets, rows = int(sys.argv[1]), int(sys.argv[2])
+    target = Path(sys.argv[3]) if len(sys.argv) > 3 else CACHE_DIR / f"workbook_{sheets}x{rows}_42.xlsx"
+    print(generate_workbook(target, sheets, rows))
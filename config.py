@@ -5,13 +5,24 @@ BASE_DIR = Path(__file__).parent
 STORAGE_DIR = BASE_DIR / "storage"
 USER_FILES_DIR = STORAGE_DIR / "user_files"
 REPORTS_DIR = STORAGE_DIR / "reports"
+PARSE_CACHE_DIR = STORAGE_DIR / "parse_cache"
+PROFILES_DIR = STORAGE_DIR / "profiles"
+DEDUP_DIR = STORAGE_DIR / "dedup"
 
-for dir_path in [USER_FILES_DIR, REPORTS_DIR]:
-    dir_path.mkdir(parents=True, exist_ok=True)
+
+def ensure_storage_dirs():
+    """Каталоги storage/ создаются при запуске бота или CLI, а не при импорте конфигурации"""
+    for dir_path in [USER_FILES_DIR, REPORTS_DIR, PARSE_CACHE_DIR, DEDUP_DIR]:
+        dir_path.mkdir(parents=True, exist_ok=True)
 
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "FAKE_TOKEN_FOR_LOCAL") #Чтение из окружения
+# Адрес Bot API (локальный telegram-bot-api сервер или стенд); пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Загрузка файлов потоком: в памяти держится только одна часть
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+DOWNLOAD_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "60"))
 OPERATOR_PERCENT = float(os.getenv("OPERATOR_PERCENT", "0.5"))
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -19,3 +30,97 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "mydatabase")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "secret")
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Пул соединений асинхронного движка
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# Получение апдейтов: polling (разработка) или webhook (aiohttp-сервер, несколько копий за балансировщиком)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес; пусто — webhook регистрируется вне бота
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "40"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+# Хранилище FSM: sql — таблица fsm_states (основная БД или FSM_STORAGE_URL), redis — REDIS_URL,
+# local — в памяти процесса (одна копия бота)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sql")
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL", "")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Срок жизни незавершенного диалога, секунды (0 — без ограничения)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "0"))
+
+# Пул процессов для разбора книг и генерации отчетов
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+WORKER_MAX_QUEUE = int(os.getenv("WORKER_MAX_QUEUE", "16"))
+WORKER_JOB_TIMEOUT = float(os.getenv("WORKER_JOB_TIMEOUT", "120"))
+# Книги с таким числом листов и больше разбираются параллельно (0 — отключено)
+PARALLEL_SHEETS_THRESHOLD = int(os.getenv("PARALLEL_SHEETS_THRESHOLD", "8"))
+
+# Кэш результатов разбора повторно загруженных книг
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Отсев транзакций, уже учтенных в прошлых загрузках оператора (индекс ID в DEDUP_DIR), включается явно;
+# DEDUP_CAPACITY — число ID оператора, на которое рассчитан фильтр Блума до перестройки,
+# DEDUP_FALSE_POSITIVE_RATE — доля его ложных срабатываний (каждое стоит запроса к SQLite)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "0") == "1"
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "1000000"))
+DEDUP_FALSE_POSITIVE_RATE = float(os.getenv("DEDUP_FALSE_POSITIVE_RATE", "0.001"))
+
+# Сессия оператора: снимок состояния после такого числа событий журнала
+SESSION_SNAPSHOT_EVERY = int(os.getenv("SESSION_SNAPSHOT_EVERY", "100"))
+TOP_AGENTS_K = int(os.getenv("TOP_AGENTS_K", "10"))
+
+# Обслуживание storage/: сжатие старых отчетов, квоты с вытеснением давно не использованных файлов
+STORAGE_COMPRESS_AFTER_DAYS = float(os.getenv("STORAGE_COMPRESS_AFTER_DAYS", "7"))
+STORAGE_USER_QUOTA_BYTES = int(os.getenv("STORAGE_USER_QUOTA_MB", "500")) * 1024 * 1024
+STORAGE_GLOBAL_QUOTA_BYTES = int(os.getenv("STORAGE_GLOBAL_QUOTA_MB", "10240")) * 1024 * 1024
+STORAGE_EVICT_GRACE = float(os.getenv("STORAGE_EVICT_GRACE", "3600"))
+STORAGE_MAINTENANCE_INTERVAL = float(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "3600"))
+
+# Формат отчета по файлу: messages — текстом в чат, xlsx/csv — одним документом
+REPORT_OUTPUT_MODE = os.getenv("REPORT_OUTPUT_MODE", "messages")
+
+# Исходящие сообщения: лимиты Telegram (30 сообщений/с на бота, ~1/с в чат)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "16"))
+SEND_QUEUE_LIMIT = int(os.getenv("SEND_QUEUE_LIMIT", "1000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+
+# Фоновая обработка загруженных файлов: загрузка → разбор → отчет → сохранение в БД
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_PER_OPERATOR = int(os.getenv("JOB_PER_OPERATOR", "1"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "200"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# Правка сообщения с ходом обработки не чаще раза в столько секунд
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "2"))
+
+# Выгрузка истории в XLSX (/export): строк из курсора за одну пачку, одновременных выгрузок на копию бота,
+# предельный размер документа (Bot API принимает до 50 МБ, локальный сервер Bot API — больше)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "1"))
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_MB", "50")) * 1024 * 1024
+
+# Метрики этапов обработки в формате Prometheus на METRICS_HOST:METRICS_PORT/metrics (выключены по умолчанию)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Администраторы бота: команды /profile и /profiles
+ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+
+# Профилирование загрузок (cProfile + tracemalloc) с дампами в PROFILES_DIR: всех (PROFILE_UPLOADS=1)
+# или только операторов из PROFILE_OPERATORS; хранятся последние PROFILE_KEEP загрузок
+PROFILE_UPLOADS = os.getenv("PROFILE_UPLOADS", "0") == "1"
+PROFILE_OPERATORS = {int(i) for i in os.getenv("PROFILE_OPERATORS", "").split(",") if i.strip()}
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
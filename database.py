@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING, Optional
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+
+def create_engine(url: str = DATABASE_URL) -> "AsyncEngine":
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+def create_session_factory(engine: "AsyncEngine") -> "async_sessionmaker[AsyncSession]":
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    # expire_on_commit=False: объекты остаются читаемыми после commit без повторного запроса
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+class Database:
+    """Движок и фабрика сессий, создаваемые при первом обращении: запуск бота
+    не ждет импорта SQLAlchemy и драйвера, если БД нужна не сразу"""
+
+    def __init__(self, url: str = DATABASE_URL):
+        self.url = url
+        self._engine: Optional["AsyncEngine"] = None
+        self._session_factory: Optional["async_sessionmaker[AsyncSession]"] = None
+
+    @property
+    def engine(self) -> "AsyncEngine":
+        if self._engine is None:
+            self._engine = create_engine(self.url)
+        return self._engine
+
+    def session(self) -> "AsyncSession":
+        """Новая сессия; вызывается так же, как async_sessionmaker"""
+        if self._session_factory is None:
+            self._session_factory = create_session_factory(self.engine)
+        return self._session_factory()
+
+    async def warm_up(self):
+        """Открыть первое соединение пула заранее, чтобы его не ждал первый запрос"""
+        async with self.engine.connect():
+            pass
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
@@ -1,60 +1,121 @@
+import time
+
+# Время запуска отсчитывается до импорта зависимостей
+STARTED = time.perf_counter()
+
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
-from config import BOT_TOKEN
-from services.bot_handler import BotHandler, Form
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os 
+from config import BOT_TOKEN, BOT_MODE, METRICS_ENABLED, TELEGRAM_API_URL, ensure_storage_dirs
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
-async def main():
-    try:
-        db_user = os.getenv("DB_USER", "postgres")
-        db_password = os.getenv("DB_PASSWORD", "secret")
-        db_name = os.getenv("DB_NAME", "mydatabase")
-        db_host = os.getenv("DB_HOST", "localhost")
-        db_port = os.getenv("DB_PORT", "5432")
-        bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher()
-        handler = BotHandler(bot)
+# aiogram и сервисы импортируются внутри функций: процессы пула (spawn) импортируют этот модуль
+# заново и не должны тянуть за собой бота. openpyxl и SQLAlchemy загружаются при первом использовании.
 
-        # Ваша база моделей
-        Base = declarative_base()
 
+def create_bot():
+    from aiogram import Bot
+    if not TELEGRAM_API_URL:
+        return Bot(token=BOT_TOKEN)
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    return Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
 
-        # Создание объекта движка
-        full_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        engine = create_engine(f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
 
-        # Создание всех таблиц
-        Base.metadata.create_all(engine)
+async def warm_up(pool, db, storage, dedup, background: set):
+    """Прогрев после начала приема апдейтов: процессы пула, соединение с БД, хранилище FSM,
+    таблица масок фильтра повторов, обслуживание storage/"""
+    from services.storage_maintenance import StorageMaintainer
+    maintenance = asyncio.create_task(StorageMaintainer().run_periodically())
+    background.add(maintenance)
+    steps = [("worker pool", pool.warm_up), ("database", db.warm_up), ("fsm storage", storage.warm_up)]
+    if dedup is not None:
+        steps.append(("dedup index", dedup.warm_up))
+    for name, warm in steps:
+        try:
+            await warm()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
 
-        # Создание фабрики сессий
-        Session = sessionmaker(bind=engine)
 
-        # Создание экземпляра сессии
-        session = Session()
+async def main():
+    from aiogram import Dispatcher, F
+    from aiogram.filters import Command
+    from services.bot_handler import BotHandler, Form, SUMMARY_PERIODS
+    from services.fsm_storage import create_fsm_storage
+    from services.middlewares import DbSessionMiddleware
+    from services.outbound import OutboundDispatcher
+    from services.worker_pool import WorkerPool
+    from database import Database
+
+    ensure_storage_dirs()
+    pool = WorkerPool()
+    outbound = OutboundDispatcher()
+    background = set()
+    dp = None
+    handler = None
+    metrics_runner = None
+    # Схема создается миграциями Alembic; движок создается при первом обращении и сразу не подключается
+    db = Database()
+    try:
+        bot = create_bot()
+        # Состояние диалогов во внешнем хранилище: переживает перезапуск, общее для копий бота
+        dp = Dispatcher(storage=await create_fsm_storage(db))
+        pool.start()
+        outbound.start()
+        if METRICS_ENABLED:
+            from services import metrics
+            metrics_runner = await metrics.start_server()
+        handler = BotHandler(bot, pool, outbound, db.session)
+        handler.jobs.start()
+
+        # Сессия БД для обработчиков, которым она нужна
+        dp.message.middleware(DbSessionMiddleware(db.session))
 
         # Регистрируем обработчики
         dp.message.register(handler.handle_start, Command("start"))
+        dp.message.register(handler.handle_cancel, Command("cancel"))
+        dp.message.register(handler.handle_profile, Command("profile"))
+        dp.message.register(handler.handle_profiles, Command("profiles"))
+        dp.message.register(handler.handle_period_summary, Command(*SUMMARY_PERIODS))
+        dp.message.register(handler.handle_export, Command("export"))
         dp.message.register(handler.handle_file_request, F.text == "📂 Отправить файл Excel")
         dp.message.register(handler.handle_finish_work, F.text == "⏹ Завершить работу")
         dp.message.register(handler.handle_agent_percent, Form.waiting_for_percent)
         dp.message.register(handler.handle_file, Form.waiting_for_file, F.document)
 
-        logger.info("Bot started")
-        await dp.start_polling(bot)
+        async def on_startup():
+            # Тяжелая инициализация идет в фоне, апдейты уже принимаются
+            background.add(asyncio.create_task(warm_up(pool, db, dp.storage, handler.dedup, background)))
+            logger.info(f"Bot started ({BOT_MODE}) in {time.perf_counter() - STARTED:.2f}s")
+
+        dp.startup.register(on_startup)
+        if BOT_MODE == "webhook":
+            from services.webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            # getUpdates не работает, пока установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Bot crashed: {e}")
     finally:
+        for task in background:
+            task.cancel()
+        # Выполняющиеся задачи дорабатывают, пока очередь отправки и пул еще открыты
+        if handler is not None:
+            await handler.jobs.stop()
+        await outbound.stop()
+        if dp is not None:
+            await dp.storage.close()
+        pool.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await db.dispose()
         logger.info("Bot stopped")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
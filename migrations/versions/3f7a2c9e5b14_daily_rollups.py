@@ -0,0 +1,45 @@
+"""Daily rollups
+
+Revision ID: 3f7a2c9e5b14
+Revises: 8d4f1b6c2a90
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7a2c9e5b14'
+down_revision: Union[str, None] = '8d4f1b6c2a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema. История заполняется отдельно: python -m services.rollups rebuild"""
+    op.create_table('daily_rollups',
+    sa.Column('operator_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('sessions', sa.Integer(), nullable=False),
+    sa.Column('turnover', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('agent_payment', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('operator_payment', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('commissions', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('inflow_count', sa.Integer(), nullable=False),
+    sa.Column('outflow_count', sa.Integer(), nullable=False),
+    sa.Column('baibit_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['agent_id'], ['agents.id'], ),
+    sa.ForeignKeyConstraint(['operator_id'], ['operators.id'], ),
+    sa.PrimaryKeyConstraint('operator_id', 'day', 'agent_id')
+    )
+    op.create_index('ix_daily_rollups_agent_id_day', 'daily_rollups', ['agent_id', 'day'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_daily_rollups_agent_id_day', table_name='daily_rollups')
+    op.drop_table('daily_rollups')
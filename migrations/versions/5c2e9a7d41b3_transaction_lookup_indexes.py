@@ -0,0 +1,50 @@
+"""Transaction lookup indexes
+
+Revision ID: 5c2e9a7d41b3
+Revises: 181b053b221f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e9a7d41b3'
+down_revision: Union[str, None] = '181b053b221f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_agents_full_name', 'agents', ['full_name'], unique=False)
+    op.create_index('ix_agent_phones_agent_id', 'agent_phones', ['agent_id'], unique=False)
+    op.create_index('ix_agent_bank_accounts_agent_id', 'agent_bank_accounts', ['agent_id'], unique=False)
+    op.create_index('ix_agent_sessions_agent_id_session_start', 'agent_sessions',
+                    ['agent_id', 'session_start'], unique=False)
+    op.create_index('ix_agent_sessions_operator_id_session_start', 'agent_sessions',
+                    ['operator_id', 'session_start'], unique=False)
+    op.create_index('ix_agent_sessions_session_start', 'agent_sessions', ['session_start'], unique=False)
+    # id во втором столбце: выборка транзакций сессии сразу в порядке вставки
+    op.create_index('ix_transactions_agent_session_id_id', 'transactions', ['agent_session_id', 'id'], unique=False)
+    # Частичные индексы: у каждой строки заполнен только один из внешних ID
+    op.create_index('ix_transactions_deposit_id', 'transactions', ['deposit_id'], unique=False,
+                    postgresql_where=sa.text('deposit_id IS NOT NULL'))
+    op.create_index('ix_transactions_withdraw_id', 'transactions', ['withdraw_id'], unique=False,
+                    postgresql_where=sa.text('withdraw_id IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_withdraw_id', table_name='transactions')
+    op.drop_index('ix_transactions_deposit_id', table_name='transactions')
+    op.drop_index('ix_transactions_agent_session_id_id', table_name='transactions')
+    op.drop_index('ix_agent_sessions_session_start', table_name='agent_sessions')
+    op.drop_index('ix_agent_sessions_operator_id_session_start', table_name='agent_sessions')
+    op.drop_index('ix_agent_sessions_agent_id_session_start', table_name='agent_sessions')
+    op.drop_index('ix_agent_bank_accounts_agent_id', table_name='agent_bank_accounts')
+    op.drop_index('ix_agent_phones_agent_id', table_name='agent_phones')
+    op.drop_index('ix_agents_full_name', table_name='agents')
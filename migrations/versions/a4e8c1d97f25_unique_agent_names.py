@@ -0,0 +1,55 @@
+"""Unique agent names
+
+Revision ID: a4e8c1d97f25
+Revises: 3f7a2c9e5b14
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e8c1d97f25'
+down_revision: Union[str, None] = '3f7a2c9e5b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SUM_COLUMNS = (
+    "sessions", "turnover", "agent_payment", "operator_payment", "commissions",
+    "inflow_count", "outflow_count", "baibit_count"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema. Агенты с одинаковым full_name, созданные одновременными сохранениями,
+    сливаются в агента с наименьшим id"""
+    op.execute(
+        "CREATE TEMPORARY TABLE agent_merge ON COMMIT DROP AS "
+        "SELECT id, keep FROM (SELECT id, min(id) OVER (PARTITION BY full_name) AS keep FROM agents) AS a "
+        "WHERE id <> keep"
+    )
+    for table in ("agent_sessions", "agent_phones", "agent_bank_accounts"):
+        op.execute(f"UPDATE {table} SET agent_id = m.keep FROM agent_merge AS m WHERE {table}.agent_id = m.id")
+    # Ключ daily_rollups включает agent_id: итоги двойника прибавляются к строке оставшегося агента
+    op.execute(
+        f"INSERT INTO daily_rollups (operator_id, day, agent_id, {', '.join(SUM_COLUMNS)}) "
+        f"SELECT r.operator_id, r.day, m.keep, {', '.join(f'sum(r.{c})' for c in SUM_COLUMNS)} "
+        f"FROM daily_rollups AS r JOIN agent_merge AS m ON m.id = r.agent_id "
+        f"GROUP BY r.operator_id, r.day, m.keep "
+        f"ON CONFLICT (operator_id, day, agent_id) DO UPDATE SET "
+        f"{', '.join(f'{c} = daily_rollups.{c} + excluded.{c}' for c in SUM_COLUMNS)}"
+    )
+    op.execute("DELETE FROM daily_rollups USING agent_merge AS m WHERE daily_rollups.agent_id = m.id")
+    op.execute("DELETE FROM agents USING agent_merge AS m WHERE agents.id = m.id")
+
+    op.drop_index('ix_agents_full_name', table_name='agents')
+    op.create_index('ix_agents_full_name', 'agents', ['full_name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_agents_full_name', table_name='agents')
+    op.create_index('ix_agents_full_name', 'agents', ['full_name'], unique=False)
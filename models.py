@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, Numeric, ForeignKey, Date, DateTime, Boolean, Index, text
 import datetime
 
 Base = declarative_base()
@@ -10,7 +10,8 @@ class Agents(Base):
     __tablename__ = 'agents'
 
     id = Column(Integer, primary_key=True)
-    full_name = Column(String(255), nullable=False)
+    # Уникальное имя: одновременные сохранения книг не создают двойников агента
+    full_name = Column(String(255), nullable=False, unique=True, index=True)
 
     sessions = relationship("AgentSessions", back_populates="agent")
     phones = relationship("AgentPhones", back_populates="agent", cascade="all, delete-orphan")
@@ -33,6 +34,11 @@ class Operators(Base):
 
 class AgentSessions(Base):
     __tablename__ = 'agent_sessions'
+    __table_args__ = (
+        Index('ix_agent_sessions_agent_id_session_start', 'agent_id', 'session_start'),
+        Index('ix_agent_sessions_operator_id_session_start', 'operator_id', 'session_start'),
+        Index('ix_agent_sessions_session_start', 'session_start'),
+    )
 
     id = Column(Integer, primary_key=True)
     agent_id = Column(Integer, ForeignKey('agents.id'), nullable=False)
@@ -55,6 +61,11 @@ class AgentSessions(Base):
 
 class Transactions(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        Index('ix_transactions_agent_session_id_id', 'agent_session_id', 'id'),
+        Index('ix_transactions_deposit_id', 'deposit_id', postgresql_where=text('deposit_id IS NOT NULL')),
+        Index('ix_transactions_withdraw_id', 'withdraw_id', postgresql_where=text('withdraw_id IS NOT NULL')),
+    )
 
     id = Column(Integer, primary_key=True)
     agent_session_id = Column(Integer, ForeignKey('agent_sessions.id'), nullable=False)
@@ -74,7 +85,7 @@ class AgentPhones(Base):
     __tablename__ = 'agent_phones'
 
     id = Column(Integer, primary_key=True)
-    agent_id = Column(Integer, ForeignKey('agents.id'), nullable=False)
+    agent_id = Column(Integer, ForeignKey('agents.id'), nullable=False, index=True)
     phone_number = Column(String(30), nullable=False)
     is_primary = Column(Boolean, default=False)
 
@@ -85,11 +96,41 @@ class AgentBankAccounts(Base):
     __tablename__ = 'agent_bank_accounts'
 
     id = Column(Integer, primary_key=True)
-    agent_id = Column(Integer, ForeignKey('agents.id'), nullable=False)
+    agent_id = Column(Integer, ForeignKey('agents.id'), nullable=False, index=True)
     bank_name = Column(String(255), nullable=False)
     card_number = Column(String(50), nullable=False)
     account_number = Column(String(100), nullable=True)
     iban = Column(String(100), nullable=True)
     is_active = Column(Boolean, default=True)
 
-    agent = relationship("Agents", back_populates="bank_accounts")
\ No newline at end of file
+    agent = relationship("Agents", back_populates="bank_accounts")
+
+class FsmStates(Base):
+    """Хранилище FSM aiogram: ключ-значение с необязательным сроком жизни"""
+    __tablename__ = 'fsm_states'
+
+    key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=True)
+
+
+class DailyRollups(Base):
+    """Итоги оператора по агенту за день; обновляются в транзакции сохранения книги,
+    чтобы сводки за период не читали agent_sessions и transactions"""
+    __tablename__ = 'daily_rollups'
+    __table_args__ = (
+        Index('ix_daily_rollups_agent_id_day', 'agent_id', 'day'),
+    )
+
+    # Порядок ключа: сводка оператора за период — диапазон по (operator_id, day)
+    operator_id = Column(Integer, ForeignKey('operators.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    agent_id = Column(Integer, ForeignKey('agents.id'), primary_key=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    turnover = Column(Numeric(18, 2), nullable=False, default=0)
+    agent_payment = Column(Numeric(18, 2), nullable=False, default=0)
+    operator_payment = Column(Numeric(18, 2), nullable=False, default=0)
+    commissions = Column(Numeric(18, 2), nullable=False, default=0)
+    inflow_count = Column(Integer, nullable=False, default=0)
+    outflow_count = Column(Integer, nullable=False, default=0)
+    baibit_count = Column(Integer, nullable=False, default=0)
@@ -1,19 +1,42 @@
+import asyncio
+import html
 import logging
+import time
+from contextlib import aclosing
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, AsyncIterator, Callable
 from aiogram import Bot, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from config import MAX_FILE_SIZE, OPERATOR_PERCENT
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BufferedInputFile, FSInputFile
+from aiogram.filters import CommandObject
+from config import (
+    MAX_FILE_SIZE, OPERATOR_PERCENT, PARALLEL_SHEETS_THRESHOLD, REPORT_OUTPUT_MODE, JOB_PROGRESS_INTERVAL,
+    ADMIN_IDS, DEDUP_ENABLED, TOP_AGENTS_K, EXPORT_CONCURRENCY, EXPORT_MAX_BYTES
+)
+from services import metrics
+from services.dedup import DedupIndex
 from services.file_manager import FileManager
-from services.excel_processor import ExcelProcessor
+from services.jobs import FileJob, JobQueue, QueueFullError
 from services.report_generator import ReportGenerator
-from services.session_manager import SessionManager
-
-
+from services.session_manager import open_session
+from services.excel_processor import ExcelProcessor
+from services.parse_cache import ParseCache
+from services.profiler import Profiler, profile_call
+from services.message_chunker import MessageChunker
+from services.outbound import OutboundDispatcher, Priority
+from services.report_exporter import ReportExporter
+from services.worker_pool import WorkerPool, PoolBusyError, parse_workbook, load_cached, render_report, split_sheets
 from pathlib import Path
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
 logger = logging.getLogger(__name__)
 
+# Команды сводок за период и их периоды в services.rollups.period_bounds
+SUMMARY_PERIODS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
 
 class Form(StatesGroup):
     waiting_for_percent = State()
@@ -22,11 +45,18 @@ class Form(StatesGroup):
 
 
 class BotHandler:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, pool: WorkerPool, outbound: OutboundDispatcher,
+                 session_factory: Callable[[], "AsyncSession"]):
         self.bot = bot
-        self.current_agent_percent = None
-        self.total_operator_payment = 0
-        self.session_manager = None
+        self.pool = pool
+        self.outbound = outbound
+        self.session_factory = session_factory
+        self.parse_cache = ParseCache()
+        self.profiler = Profiler()
+        self.dedup = DedupIndex() if DEDUP_ENABLED else None
+        self.export_slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+        # Файлы обрабатываются в фоне, обработчик апдейта только ставит задачу в очередь
+        self.jobs = JobQueue(self._run_file_job, self._file_job_failed)
 
         # Основная клавиатура
         self.main_keyboard = ReplyKeyboardMarkup(
@@ -39,17 +69,18 @@ class BotHandler:
 
     async def handle_start(self, message: types.Message, state: FSMContext):
         """Обработчик команды /start"""
-        # Инициализируем session_manager при старте
-        if not hasattr(self, 'session_manager'):
-            self.session_manager = SessionManager(message.from_user.id)
-
+        # Данные рабочей сессии (процент агента) живут в хранилище FSM оператора, итоги — в его сессии
         await state.clear()
-        self._reset_work_data()
-        await message.answer("Выберите действие:", reply_markup=self.main_keyboard)
+        # Сессия начинается или продолжается с диска
+        async with open_session(message.from_user.id):
+            pass
+        await state.update_data(session_active=True)
+        await self.outbound.answer(message, "Выберите действие:", reply_markup=self.main_keyboard)
 
     async def handle_file_request(self, message: types.Message, state: FSMContext):
         """Обработчик запроса на отправку файла"""
-        await message.answer(
+        await self.outbound.answer(
+            message,
             "Введите процент для агента (например, 3 для 3%):",
             reply_markup=ReplyKeyboardRemove()
         )
@@ -62,136 +93,501 @@ class BotHandler:
             if not 0 < percent <= 100:
                 raise ValueError
 
-            self.current_agent_percent = percent
-            await message.answer(
+            await state.update_data(agent_percent=percent)
+            await self.outbound.answer(
+                message,
                 f"Установлен процент агента: {percent}%\n"
                 "Теперь отправьте Excel-файл для обработки."
             )
             await state.set_state(Form.waiting_for_file)
 
         except (ValueError, TypeError):
-            await message.answer("Пожалуйста, введите корректный процент (например, 3.5 для 3.5%)")
+            await self.outbound.answer(message, "Пожалуйста, введите корректный процент (например, 3.5 для 3.5%)")
 
     async def handle_file(self, message: types.Message, state: FSMContext):
-        """Обработчик получения Excel-файла"""
+        """Обработчик получения Excel-файла: проверка и постановка в очередь обработки"""
         if not message.document:
-            await message.answer("Пожалуйста, отправьте файл.", reply_markup=self.main_keyboard)
+            await self.outbound.answer(message, "Пожалуйста, отправьте файл.", reply_markup=self.main_keyboard)
             return
 
         if message.document.mime_type != "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
-            await message.answer("Пожалуйста, отправьте файл в формате .xlsx", reply_markup=self.main_keyboard)
+            await self.outbound.answer(message, "Пожалуйста, отправьте файл в формате .xlsx", reply_markup=self.main_keyboard)
             return
 
         if message.document.file_size > MAX_FILE_SIZE:
-            await message.answer(
+            await self.outbound.answer(
+                message,
                 f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // 1024 // 1024}MB",
                 reply_markup=self.main_keyboard
             )
             return
 
+        data = await state.get_data()
+        job = FileJob(message.from_user.id, message, data.get("agent_percent"))
+        ahead = len(self.jobs.operator_jobs(job.operator_id))
+        progress = await self.outbound.answer(
+            message,
+            "⏳ Файл принят в обработку" + (f", перед ним в очереди: {ahead}" if ahead else "") +
+            ".\nОтменить: /cancel",
+            reply_markup=self.main_keyboard
+        )
+        job.progress_message_id = progress.message_id
+        job.progress_text = progress.text
+
         try:
-            # Загрузка и сохранение файла
-            file = await self.bot.get_file(message.document.file_id)
-            file_data = await self.bot.download_file(file.file_path)
-            file_path = FileManager.save_user_file(message.from_user.id, file_data)
-
-            # Парсинг и обработка данных
-            sheets_data = ExcelProcessor.process_workbook(file_path, self.current_agent_percent)
-
-            full_report = ""
-            file_operator_total = 0
-            file_turnover_total = 0
-
-            # Генерация отчетов
-            for sheet_name, sheet_data in sheets_data.items():
-                sheet_data.sheet_name = sheet_name
-                report_text = ReportGenerator.generate(sheet_data)
-                FileManager.save_report(message.from_user.id, sheet_name, report_text)
-                full_report += f"\n\n{report_text}"
-
-                # Суммирование выплат
-                file_operator_total += sheet_data.operator_payment
-                file_turnover_total += sheet_data.turnover
-
-            # Обновление общей суммы
-            self.total_operator_payment += file_operator_total
-
-            # Формирование итогов по файлу
-            file_summary = (
-                    "\n\n=== ИТОГИ ПО ФАЙЛУ ==="
-                    f"\nОбщий оборот: {ReportGenerator.format_number(file_turnover_total)}"
-                    f"\nОплата оператора (0.5%): {ReportGenerator.format_number(file_operator_total)}"
-                    "\n" + "=" * 40
+            self.jobs.submit(job)
+        except QueueFullError:
+            logger.warning("Job queue is full, file rejected")
+            await self._update_progress(
+                job, "Сервер сейчас загружен. Пожалуйста, отправьте файл еще раз через минуту.", force=True
             )
+            return
+
+        # Процент сбрасывается для следующего файла, задача уже получила свой
+        await state.update_data(agent_percent=None)
+        await state.set_state(Form.ready_to_finish)
+
+    async def handle_cancel(self, message: types.Message):
+        """Отмена обработки файлов оператора: ожидающие снимаются, текущая прерывается"""
+        cancelled = self.jobs.cancel(message.from_user.id)
+        if not cancelled:
+            await self.outbound.answer(message, "Нет файлов в обработке.", reply_markup=self.main_keyboard)
+            return
 
-            # Отправка отчета
+        for job in cancelled:
+            await self._update_progress(job, "🚫 Обработка отменена.", force=True)
+        await self.outbound.answer(
+            message,
+            f"Отменено файлов: {len(cancelled)}. Уже отправленная часть отчета остается в сессии.",
+            reply_markup=self.main_keyboard
+        )
+
+    async def _run_file_job(self, job: FileJob):
+        """Обработка файла в фоне; для выбранных операторов — под профилировщиком"""
+        with self.profiler.profile(job.operator_id, job.id) as profile_dir:
+            job.profile_dir = profile_dir
+            await self._process_file(job)
+
+    async def _process_file(self, job: FileJob):
+        """Загрузка → разбор → отчет → сохранение в БД"""
+        message = job.message
+        await self._update_progress(job, "⏬ Загрузка файла...", force=True)
+        file = await self.bot.get_file(message.document.file_id)
+        file_path = await FileManager.save_user_file(
+            job.operator_id, FileManager.iter_telegram_file(self.bot, file.file_path)
+        )
+        await self._update_progress(job, force=True)
+        if self.dedup is not None:
+            # Повтор задачи проверяет книгу заново
+            job.dedup = self.dedup.batch(job.operator_id, file_path.stem)
+            job.recorded = await self.dedup.recorded(job.dedup)
+            if job.recorded:
+                logger.info(f"Workbook {file_path.stem} already recorded for operator {job.operator_id}")
+
+        # Разбор в пуле процессов, отчет уходит сообщениями по мере готовности листов
+        sheets_data = []
+        if REPORT_OUTPUT_MODE == "messages":
             await self._send_report(
                 message,
-                full_report.strip() + file_summary,
+                self._report_chunks(job, file_path, sheets_data),
                 reply_markup=self.main_keyboard
             )
+        else:
+            await self._send_report_document(message, job, file_path, sheets_data)
+
+        if not job.recorded:
+            async with self.session_factory() as session:
+                await self._persist_workbook(session, job.operator_id, sheets_data)
+
+        if job.dedup is not None:
+            # ID учтены только теперь: отмененная или упавшая задача не оставляет их в индексе
+            await self.dedup.record(job.dedup)
+        metrics.FILES.inc()
+        done = f"✅ Обработано листов: {len(sheets_data)}"
+        if job.recorded:
+            done += "\nФайл уже был учтен: в итоги смены и БД повторно не записан."
+        await self._update_progress(job, done, force=True)
+
+    async def _file_job_failed(self, job: FileJob, error: Exception):
+        if isinstance(error, PoolBusyError):
+            text = "Сервер сейчас загружен. Пожалуйста, отправьте файл еще раз через минуту."
+        elif isinstance(error, asyncio.TimeoutError):
+            text = "Обработка файла заняла слишком много времени. Попробуйте разбить файл на части."
+        else:
+            text = "Произошла ошибка при обработке файла. Пожалуйста, проверьте файл и попробуйте еще раз."
+        await self._update_progress(job, "❌ Файл не обработан.", force=True)
+        await self.outbound.answer(job.message, text, reply_markup=self.main_keyboard)
+
+    async def _update_progress(self, job: FileJob, text: str = None, force: bool = False):
+        """Правка сообщения о ходе обработки; промежуточные правки не чаще JOB_PROGRESS_INTERVAL"""
+        if text is None:
+            # Число листов известно, когда книга взята из кэша или открыта для разбора
+            text = (f"⚙️ Обработка: лист {job.sheets_done}/{job.sheets_total}" if job.sheets_total
+                    else "⚙️ Разбор файла...")
+        now = time.monotonic()
+        if job.progress_message_id is None or text == job.progress_text:
+            return
+        if not force and now - job.progress_edited < JOB_PROGRESS_INTERVAL:
+            return
+        job.progress_text, job.progress_edited = text, now
 
-            # Сбрасываем процент для следующего файла
-            self.current_agent_percent = None
-            await state.set_state(Form.ready_to_finish)
+        chat_id, message_id = job.message.chat.id, job.progress_message_id
+        delivery = await self.outbound.submit(
+            chat_id, lambda: self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        )
+        # Задача не ждет правки; сбой правки не влияет на обработку
+        delivery.add_done_callback(self._log_progress_failure)
 
-        except Exception as e:
-            logger.error(f"Error processing file: {e}", exc_info=True)
-            await message.answer(
-                "Произошла ошибка при обработке файла. Пожалуйста, проверьте файл и попробуйте еще раз.",
-                reply_markup=self.main_keyboard
-            )
+    @staticmethod
+    def _log_progress_failure(delivery: asyncio.Future):
+        if not delivery.cancelled() and delivery.exception() is not None:
+            logger.warning(f"Error updating job progress: {delivery.exception()}")
+
+    async def handle_profile(self, message: types.Message, command: CommandObject):
+        """/profile <id оператора> on|off — профилирование загрузок оператора (только для администраторов)"""
+        if message.from_user.id not in ADMIN_IDS:
+            return
+        try:
+            operator_id, mode = (command.args or "").split()
+            operator_id = int(operator_id)
+            if mode not in ("on", "off"):
+                raise ValueError
+        except ValueError:
+            await self.outbound.answer(message, "Использование: /profile <id оператора> on|off")
+            return
+
+        await asyncio.to_thread(self.profiler.set_operator, operator_id, mode == "on")
+        await self.outbound.answer(
+            message, f"Профилирование загрузок оператора {operator_id} {'включено' if mode == 'on' else 'выключено'}."
+        )
+
+    async def handle_profiles(self, message: types.Message, command: CommandObject):
+        """/profiles [N] — самые горячие функции и места выделения памяти за последние N профилей"""
+        if message.from_user.id not in ADMIN_IDS:
+            return
+        try:
+            count = int(command.args) if command.args else 5
+        except ValueError:
+            await self.outbound.answer(message, "Использование: /profiles [число загрузок]")
+            return
+
+        summary = await asyncio.to_thread(self.profiler.summary, count)
+        if not summary["uploads"]:
+            await self.outbound.answer(message, "Профилей пока нет.")
+            return
+
+        lines = [f"Профили: {len(summary['uploads'])} (последний {summary['uploads'][0]})",
+                 f"Пик памяти: {summary['peak'] / 1024 / 1024:.1f} MiB", "", "Функции (собственное время):"]
+        lines.extend(
+            f"{f['tottime']:.3f}s / {f['cumtime']:.3f}s  {f['calls']}×  {f['function']}" for f in summary["functions"]
+        )
+        lines += ["", "Выделение памяти:"]
+        lines.extend(f"{size / 1024:.0f} KiB  {site}" for site, size in summary["allocations"])
+
+        chunker = MessageChunker()
+        for chunk in [*chunker.feed(lines), *chunker.flush()]:
+            await self.outbound.answer(message, chunk)
+
+    async def handle_period_summary(self, message: types.Message, command: CommandObject, session: "AsyncSession"):
+        """/daily, /weekly, /monthly [ГГГГ-ММ-ДД] — итоги оператора за день, неделю или месяц,
+        содержащие дату (по умолчанию сегодня). Читаются только дневные итоги"""
+        from services.rollups import RollupStore, period_bounds
+        try:
+            day = date.fromisoformat(command.args.strip()) if command.args else date.today()
+        except ValueError:
+            await self.outbound.answer(message, f"Использование: /{command.command} [ГГГГ-ММ-ДД]")
+            return
+
+        date_from, date_to = period_bounds(SUMMARY_PERIODS[command.command], day)
+        summary = await RollupStore.operator_summary(session, str(message.from_user.id), date_from, date_to)
+        period = f"{date_from:%d.%m.%Y}"
+        if date_to - date_from > timedelta(days=1):
+            period += f" – {date_to - timedelta(days=1):%d.%m.%Y}"
+        if not summary["agents"]:
+            await self.outbound.answer(message, f"ℹ️ За {period} сохраненных данных нет.")
+            return
+
+        lines = [
+            f"📅 <b>Итоги за {period}</b>",
+            f"• Агентов: {len(summary['agents'])}, смен: {summary['sessions']}",
+            f"• Оборот: {ReportGenerator.format_number(summary['turnover'])} ₽",
+            f"• Оплата агентов: {ReportGenerator.format_number(summary['agent_payment'])} ₽",
+            f"• Ваша выплата ({OPERATOR_PERCENT}%): {ReportGenerator.format_number(summary['operator_payment'])} ₽",
+            f"• Комиссии: {ReportGenerator.format_number(summary['commissions'])}",
+            f"• Транзакции: входных {summary['inflow_count']}, выходных {summary['outflow_count']}, "
+            f"Байбит {summary['baibit_count']}",
+            "\n🔝 Топ агентов:"
+        ]
+        lines.extend(
+            f"{i}. {html.escape(str(agent['full_name']))} — {ReportGenerator.format_number(agent['turnover'])} ₽"
+            for i, agent in enumerate(summary["agents"][:TOP_AGENTS_K], 1)
+        )
+        await self.outbound.answer(message, "\n".join(lines), parse_mode="HTML")
+
+    async def handle_export(self, message: types.Message, command: CommandObject, session: "AsyncSession"):
+        """/export [ГГГГ-ММ-ДД ГГГГ-ММ-ДД] — смены и транзакции за период (по умолчанию текущий месяц)
+        документом XLSX; администраторы получают данные всех операторов"""
+        from services.history_export import HistoryExporter
+        from services.rollups import period_bounds
+        try:
+            args = (command.args or "").split()
+            if not args:
+                date_from, date_to = period_bounds("month", date.today())
+            elif len(args) == 2:
+                date_from, date_to = date.fromisoformat(args[0]), date.fromisoformat(args[1]) + timedelta(days=1)
+            else:
+                raise ValueError
+        except ValueError:
+            await self.outbound.answer(message, "Использование: /export [ГГГГ-ММ-ДД ГГГГ-ММ-ДД]")
+            return
+
+        if self.export_slots.locked():
+            await self.outbound.answer(message, "⏳ Сейчас формируется другая выгрузка, попробуйте позже.")
+            return
+
+        operator = None if message.from_user.id in ADMIN_IDS else str(message.from_user.id)
+        period = f"{date_from:%d.%m.%Y} – {date_to - timedelta(days=1):%d.%m.%Y}"
+        await self.outbound.answer(message, f"⏳ Формирую выгрузку за {period}...")
+        async with self.export_slots:
+            try:
+                async with HistoryExporter.spooled(session, date_from, date_to, operator) as (path, counts):
+                    size = path.stat().st_size
+                    if size > EXPORT_MAX_BYTES:
+                        await self.outbound.answer(
+                            message, f"⚠️ Выгрузка занимает {size / 1024 / 1024:.0f} МБ — больше допустимого. "
+                                     f"Выберите период короче.")
+                        return
+                    caption = ", ".join(f"{title}: {count}" for title, count in counts.items())
+                    # Файл отдается с диска потоком и удаляется после отправки
+                    await self.outbound.answer_document(
+                        message,
+                        FSInputFile(path, filename=f"export_{date_from:%Y%m%d}_{date_to - timedelta(days=1):%Y%m%d}.xlsx"),
+                        caption=f"Выгрузка за {period}\n{caption}"
+                    )
+            except Exception as e:
+                logger.error(f"Error exporting history: {e}", exc_info=True)
+                await self.outbound.answer(message, "⚠️ Не удалось сформировать выгрузку.")
 
     async def handle_finish_work(self, message: types.Message, state: FSMContext):
         """Гарантированно стабильное формирование отчёта"""
         try:
-            if not hasattr(self, 'session_manager'):
-                await message.answer("ℹ️ Сессия не была начата. Отправьте /start")
+            if not (await state.get_data()).get("session_active"):
+                await self.outbound.answer(message, "ℹ️ Сессия не была начата. Отправьте /start")
                 return
 
-            summary = self.session_manager.get_summary()
+            async with open_session(message.from_user.id) as session_manager:
+                summary = session_manager.get_summary()
+                seq = session_manager.data["seq"]
 
             # Формируем отчёт частями для надёжности
             report_parts = [
-                "📊 *Итоги сессии оператора*",
+                "📊 <b>Итоги сессии оператора</b>",
                 f"• Начало: {summary['start_time']}",
                 f"• Обработано агентов: {summary['agents_count']}",
                 f"• Общий оборот: {ReportGenerator.format_number(summary['total_turnover'])} ₽",
                 f"• Ваша выплата ({OPERATOR_PERCENT}%): {ReportGenerator.format_number(summary['operator_payment'])} ₽",
                 "\n🔝 Топ агентов:"
             ]
+            report_parts.extend(
+                f"{i}. {html.escape(str(agent['name']))} — "
+                f"{ReportGenerator.format_number(agent['turnover'])} ₽ ({agent['percent']}%)"
+                for i, agent in enumerate(summary["top_agents"], 1)
+            )
 
-
+            await self.outbound.answer(message, "\n".join(report_parts), parse_mode="HTML", reply_markup=self.main_keyboard)
+            async with open_session(message.from_user.id) as session_manager:
+                # Агенты, добавленные задачей во время отправки итогов, не попали в них: сессия остается
+                if session_manager.data["seq"] == seq:
+                    await asyncio.to_thread(session_manager.finish)
+                else:
+                    logger.info(f"Session of operator {message.from_user.id} changed while finishing, kept")
 
         except Exception as e:
             logger.error(f"Ошибка формирования отчёта: {str(e)}", exc_info=True)
-            await message.answer(
+            await self.outbound.answer(
+                message,
                 "⚠️ Произошла ошибка при формировании отчёта. Данные сохранены и будут доступны при следующем завершении.")
         finally:
-            if hasattr(self, 'session_manager'):
-                del self.session_manager
+            # Незавершенная сессия остается на диске и будет загружена при следующем /start
             await state.clear()
 
-    def _reset_work_data(self):
-        """Сброс данных рабочей сессии"""
-        self.current_agent_percent = None
-        self.total_operator_payment = 0
-
+    async def _report_chunks(self, job: FileJob, file_path: Path, sheets_data: list) -> AsyncIterator[str]:
+        """Сообщения отчета по файлу; разобранные листы складываются в sheets_data"""
+        chunker = MessageChunker()
+        file_operator_total = 0
+        file_turnover_total = 0
+
+        async for sheet_name, sheet_data in self._iter_sheets(job, file_path):
+            sheets_data.append((sheet_name, sheet_data))
+
+            # Отчет строится в пуле уже с отметками повторов
+            with metrics.stage("render"):
+                report_lines = await self.pool.run(render_report, sheet_data)
+            for chunk in chunker.feed(report_lines):
+                yield chunk
+            await FileManager.save_report(job.operator_id, sheet_name, "\n".join(report_lines))
+
+            # Суммирование выплат
+            file_operator_total += sheet_data.operator_payment
+            file_turnover_total += sheet_data.turnover
+
+            if not job.recorded:
+                await self._record_agent(job.operator_id, sheet_name, sheet_data)
+
+        # Формирование итогов по файлу
+        for chunk in chunker.feed(ReportGenerator.file_summary_lines(file_turnover_total, file_operator_total)):
+            yield chunk
+        for chunk in chunker.flush():
+            yield chunk
+
+    async def _send_report_document(self, message: types.Message, job: FileJob, file_path: Path, sheets_data: list):
+        """Отчет по файлу одним документом (REPORT_OUTPUT_MODE=xlsx/csv) с кратким итогом в подписи"""
+        async for sheet_name, sheet_data in self._iter_sheets(job, file_path):
+            sheets_data.append((sheet_name, sheet_data))
+            if not job.recorded:
+                await self._record_agent(job.operator_id, sheet_name, sheet_data)
+
+        with metrics.stage("render"):
+            content = await self.pool.run(ReportExporter.export, sheets_data, REPORT_OUTPUT_MODE)
+        filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{REPORT_OUTPUT_MODE}"
+        await FileManager.save_report_file(job.operator_id, filename, content)
+
+        header = [f"Листов: {len(sheets_data)}"]
+        bad_cells = sum(len(sheet_data.bad_cells) for _, sheet_data in sheets_data)
+        if bad_cells:
+            header.append(f"⚠️ Нечисловые суммы, строки не учтены: {bad_cells}")
+        caption = "\n".join(header + ReportGenerator.file_summary_lines(
+            sum(sheet_data.turnover for _, sheet_data in sheets_data),
+            sum(sheet_data.operator_payment for _, sheet_data in sheets_data)
+        ))
+        await self.outbound.answer_document(
+            message,
+            BufferedInputFile(content, filename=filename),
+            caption=caption,
+            reply_markup=self.main_keyboard
+        )
 
+    @staticmethod
+    async def _record_agent(operator_id: int, sheet_name: str, sheet_data):
+        # Сессия блокируется только на запись агента: /start и завершение не ждут конца задачи
+        async with open_session(operator_id) as session_manager:
+            # Запись журнала с fsync и периодический снимок — в потоке, пока сессия заблокирована
+            await asyncio.to_thread(
+                session_manager.add_agent, sheet_data.full_name or sheet_name, sheet_data.turnover,
+                sheet_data.agent_percent, sheet_data.bank
+            )
 
-    async def _send_report(self, message: types.Message, text: str, reply_markup=None):
-        """Внутренний метод для отправки отчетов"""
+    async def _iter_sheets(self, job: FileJob, file_path: Path) -> AsyncIterator[tuple]:
+        """Листы книги по порядку с обновлением хода обработки задачи"""
+        # Разбор идет в процессах пула, поэтому этап замеряется здесь: ожидание очередного листа
+        async for result in metrics.timed_aiter("parse", self._load_sheets(job, file_path)):
+            sheet_data = result[1]
+            if job.dedup is not None:
+                # Повторы прошлых загрузок помечаются до отчета и сохранения в сессию и БД
+                duplicates = await self.dedup.mark_duplicates(job.dedup, sheet_data)
+                if duplicates:
+                    logger.info(f"Sheet {result[0]!r}: {duplicates} transactions already counted")
+            metrics.SHEETS.inc()
+            metrics.ROWS.inc(amount=len(sheet_data.inflows) + len(sheet_data.outflows) + len(sheet_data.baibit))
+            # С первого листа отчет попадает в сессию и в чат: повтор задачи продублировал бы его
+            job.retriable = False
+            job.sheets_done += 1
+            await self._update_progress(job)
+            yield result
+
+    async def _load_sheets(self, job: FileJob, file_path: Path) -> AsyncIterator[tuple]:
+        """Листы книги по порядку; повторные загрузки берутся из кэша по хэшу содержимого,
+        не открывая книгу. Профилируемая загрузка разбирается заново, чтобы в профиль попал разбор"""
+        digest = file_path.stem
+        if job.profile_dir is None:
+            if await asyncio.to_thread(self.parse_cache.contains, digest):
+                try:
+                    cached = await self.pool.run(load_cached, self.parse_cache.path_for(digest), job.agent_percent)
+                except (FileNotFoundError, EOFError):
+                    logger.warning("Parse cache entry vanished, parsing workbook again")
+                else:
+                    self.parse_cache.record(hit=True)
+                    logger.info(f"Parse cache hit: {self.parse_cache.stats()}")
+                    job.sheets_total = len(cached)
+                    for result in cached:
+                        yield result
+                    return
+            self.parse_cache.record(hit=False)
+
+        parsed = []
+        async for result in self._parse_workbook(job, file_path):
+            parsed.append(result)
+            yield result
+        await asyncio.to_thread(self.parse_cache.store, digest, parsed)
+
+    async def _persist_workbook(self, session: "AsyncSession", operator_id: int, sheets_data: list):
+        """Сохранение транзакций в БД; сбой записи не мешает работе с отчетом"""
+        # Слой БД (SQLAlchemy, модели) загружается при первом сохранении, а не при запуске
+        from services.persistence import TransactionStore
         try:
-            if len(text) <= 4096:
-                await message.answer(text, reply_markup=reply_markup)
-            else:
-                parts = [text[i:i + 4096] for i in range(0, len(text), 4096)]
-                for part in parts[:-1]:
-                    await message.answer(part)
-                await message.answer(parts[-1], reply_markup=reply_markup)
+            with metrics.stage("persist"):
+                await TransactionStore.save_workbook(
+                    session, str(operator_id), [sheet_data for _, sheet_data in sheets_data]
+                )
         except Exception as e:
-            logger.error(f"Error sending report: {e}")
-            await message.answer(
+            logger.error(f"Error persisting workbook: {e}", exc_info=True)
+
+    async def _parse_workbook(self, job: FileJob, file_path: Path) -> AsyncIterator[tuple]:
+        """Многолистовые книги раскладываются по всем процессам пула; группы листов
+        отдаются по порядку, как только разобраны. С профилем загрузки каждая часть профилируется
+        в своем процессе и пишет дамп parse-N"""
+        groups = [None]
+        if PARALLEL_SHEETS_THRESHOLD and self.pool.workers > 1:
+            sheet_names = await self.pool.run(ExcelProcessor.get_sheet_names, file_path)
+            job.sheets_total = len(sheet_names)
+            if len(sheet_names) >= PARALLEL_SHEETS_THRESHOLD:
+                groups = split_sheets(sheet_names, self.pool.workers)
+
+        args_list = [(file_path, job.agent_percent, names) for names in groups]
+        func = parse_workbook
+        profile_dir = job.profile_dir
+        if profile_dir is not None:
+            func = profile_call
+            args_list = [(str(profile_dir / f"parse-{i}"), parse_workbook, *args) for i, args in enumerate(args_list)]
+
+        if len(args_list) > 1:
+            async for chunk in self.pool.imap(func, args_list):
+                for result in chunk:
+                    yield result
+            return
+
+        results = await self.pool.run(func, *args_list[0])
+        job.sheets_total = len(results)
+        for result in results:
+            yield result
+
+
+
+    async def _send_report(self, message: types.Message, chunks: AsyncIterator[str], reply_markup=None):
+        """Отправка отчета по мере готовности сообщений; последнее уходит с клавиатурой.
+        Части ставятся в очередь отправки без ожидания, порядок внутри чата сохраняется"""
+        deliveries = []
+        pending = None
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if pending is not None:
+                    deliveries.append(await self._submit_chunk(message, pending))
+                pending = chunk
+
+        if pending is not None:
+            deliveries.append(await self._submit_chunk(message, pending, reply_markup))
+
+        # После сбоя отправки отчет все равно дочитан: сохранение и итоги не пропадают
+        errors = [e for e in await asyncio.gather(*deliveries, return_exceptions=True) if isinstance(e, Exception)]
+        if errors:
+            logger.error(f"Error sending report: {errors[0]}")
+            await self.outbound.answer(
+                message,
                 "Произошла ошибка при отправке отчета.",
                 reply_markup=reply_markup
-            )
\ No newline at end of file
+            )
+
+    async def _submit_chunk(self, message: types.Message, text: str, reply_markup=None) -> asyncio.Future:
+        return await self.outbound.submit(
+            message.chat.id, lambda: message.answer(text, reply_markup=reply_markup), Priority.BULK
+        )
@@ -1,5 +1,10 @@
-from dataclasses import dataclass
-from typing import List, Tuple
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Union
+
+# Доля оператора от оборота (0.5%)
+OPERATOR_SHARE = 0.005
 
 @dataclass
 class Transaction:
@@ -12,6 +17,200 @@ class BaibitTransaction:
     amount: float
     rate: float
 
+
+# Флаги целых значений: массивы хранят double, а в отчете 5 и 5.0 выводятся по-разному
+_AMOUNT_INT = 1
+_SECOND_INT = 2
+
+
+def _restore(value: float, flags: int, mask: int) -> Union[int, float]:
+    return int(value) if flags & mask else value
+
+
+# Число в текстовой ячейке: знак, цифры с разделителями, необязательная валюта
+_NUMBER = re.compile(r"([-+]?)(\d[\d.,]*)(?:р\.?|руб\.?|₽|rub|\$|usdt?)?", re.IGNORECASE)
+# Группы по три цифры после первой: "1.000.000", "10,000"
+_GROUPED = re.compile(r"[1-9]\d{0,2}(?:X\d{3})+")
+_SPACES = str.maketrans("", "", " \u00a0\u202f")
+
+
+def _number(value) -> Union[int, float]:
+    """Число из ячейки. Текст разбирается, если его значение однозначно: "1000", "92,5", "1 000,50",
+    "1.000,50", "1,000.50", "500 р". Для всего остального (текст без числа, "1.000" — тысяча или
+    единица, дата, логическое значение) — ValueError: ячейка не попадает в итоги молча"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"not a number: {value!r}")
+    match = _NUMBER.fullmatch(value.strip().translate(_SPACES))
+    if match is None:
+        raise ValueError(f"not a number: {value!r}")
+    sign, digits = match.groups()
+
+    separators = [c for c in digits if c in ".,"]
+    if not separators:
+        return int(sign + digits)
+    decimal = separators[-1]
+    if separators.count(decimal) == 1:
+        # Последний разделитель встречается один раз — дробная часть, остальные разделяют тысячи
+        whole, fraction = digits.rsplit(decimal, 1)
+        thousands = "," if decimal == "." else "."
+        if not fraction or (thousands in whole and not _GROUPED.fullmatch(whole.replace(thousands, "X"))):
+            raise ValueError(f"not a number: {value!r}")
+        if len(separators) == 1 and len(fraction) == 3 and _GROUPED.fullmatch(whole + "X" + fraction):
+            raise ValueError(f"ambiguous thousands separator: {value!r}")
+        return float(f"{sign}{whole.replace(thousands, '')}.{fraction}")
+    # Один и тот же разделитель несколько раз — разделитель тысяч
+    if len(set(separators)) == 1 and _GROUPED.fullmatch(digits.replace(decimal, "X")):
+        return int(sign + digits.replace(decimal, ""))
+    raise ValueError(f"not a number: {value!r}")
+
+
+def _flags(amount, second) -> int:
+    return (_AMOUNT_INT if isinstance(amount, int) else 0) | (_SECOND_INT if isinstance(second, int) else 0)
+
+
+class TransactionColumns:
+    """Колоночное хранение транзакций: параллельные массивы сумм и комиссий вместо объекта на строку.
+
+    ID хранятся одним буфером UTF-8 с массивом смещений: строка Python на каждый ID
+    занимает в несколько раз больше самих символов.
+    """
+    __slots__ = ("amounts", "commissions", "flags", "id_data", "id_offsets")
+
+    def __init__(self, transactions: Iterable[Transaction] = ()):
+        self.amounts = array('d')
+        self.commissions = array('d')
+        self.flags = array('B')
+        self.id_data = bytearray()
+        self.id_offsets = array('I', [0])
+        for t in transactions:
+            self.append(t)
+
+    def add(self, amount, transaction_id: str, commission=0):
+        amount, commission = _number(amount), _number(commission)
+        self.amounts.append(amount)
+        self.commissions.append(commission)
+        self.flags.append(_flags(amount, commission))
+        self.id_data += transaction_id.encode()
+        self.id_offsets.append(len(self.id_data))
+
+    def append(self, t: Transaction):
+        self.add(t.amount, t.transaction_id, t.commission)
+
+    def transaction_id(self, i: int) -> str:
+        return self.id_data[self.id_offsets[i]:self.id_offsets[i + 1]].decode()
+
+    def ids(self) -> Iterator[str]:
+        data, offsets = self.id_data, self.id_offsets
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode()
+
+    def total_amount(self) -> float:
+        return sum(self.amounts)
+
+    def total_commission(self) -> float:
+        return sum(self.commissions)
+
+    def __getitem__(self, i: int) -> Transaction:
+        if i < 0:
+            i += len(self)
+        flags = self.flags[i]
+        return Transaction(
+            amount=_restore(self.amounts[i], flags, _AMOUNT_INT),
+            transaction_id=self.transaction_id(i),
+            commission=_restore(self.commissions[i], flags, _SECOND_INT)
+        )
+
+    def __iter__(self) -> Iterator[Transaction]:
+        for amount, transaction_id, commission, flags in zip(self.amounts, self.ids(), self.commissions, self.flags):
+            yield Transaction(
+                amount=_restore(amount, flags, _AMOUNT_INT),
+                transaction_id=transaction_id,
+                commission=_restore(commission, flags, _SECOND_INT)
+            )
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TransactionColumns):
+            return (self.amounts == other.amounts and self.commissions == other.commissions
+                    and self.flags == other.flags and self.id_data == other.id_data
+                    and self.id_offsets == other.id_offsets)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TransactionColumns({len(self)} rows)"
+
+    def __getstate__(self):
+        return self.amounts, self.commissions, self.flags, self.id_data, self.id_offsets
+
+    def __setstate__(self, state):
+        self.amounts, self.commissions, self.flags, self.id_data, self.id_offsets = state
+
+
+class BaibitColumns:
+    """Колоночное хранение выводов Байбит: массивы сумм и курсов"""
+    __slots__ = ("amounts", "rates", "flags")
+
+    def __init__(self, transactions: Iterable[BaibitTransaction] = ()):
+        self.amounts = array('d')
+        self.rates = array('d')
+        self.flags = array('B')
+        for t in transactions:
+            self.append(t)
+
+    def add(self, amount, rate):
+        amount, rate = _number(amount), _number(rate)
+        self.amounts.append(amount)
+        self.rates.append(rate)
+        self.flags.append(_flags(amount, rate))
+
+    def append(self, t: BaibitTransaction):
+        self.add(t.amount, t.rate)
+
+    def total_amount(self) -> float:
+        return sum(self.amounts)
+
+    def weighted_average_rate(self) -> float:
+        total = sum(self.amounts)
+        return sum(map(float.__mul__, self.amounts, self.rates)) / total if total else 0.0
+
+    def __getitem__(self, i: int) -> BaibitTransaction:
+        if i < 0:
+            i += len(self)
+        flags = self.flags[i]
+        return BaibitTransaction(
+            amount=_restore(self.amounts[i], flags, _AMOUNT_INT),
+            rate=_restore(self.rates[i], flags, _SECOND_INT)
+        )
+
+    def __iter__(self) -> Iterator[BaibitTransaction]:
+        for amount, rate, flags in zip(self.amounts, self.rates, self.flags):
+            yield BaibitTransaction(
+                amount=_restore(amount, flags, _AMOUNT_INT),
+                rate=_restore(rate, flags, _SECOND_INT)
+            )
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, BaibitColumns):
+            return self.amounts == other.amounts and self.rates == other.rates and self.flags == other.flags
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"BaibitColumns({len(self)} rows)"
+
+    def __getstate__(self):
+        return self.amounts, self.rates, self.flags
+
+    def __setstate__(self, state):
+        self.amounts, self.rates, self.flags = state
+
+
 @dataclass
 class ExcelSheetData:
     full_name: str
@@ -23,14 +222,53 @@ class ExcelSheetData:
     start_time: str
     end_time: str
     operator: str
-    inflows: List[Transaction]
-    outflows: List[Transaction]
-    baibit: List[BaibitTransaction]
+    inflows: TransactionColumns = field(default_factory=TransactionColumns)
+    outflows: TransactionColumns = field(default_factory=TransactionColumns)
+    baibit: BaibitColumns = field(default_factory=BaibitColumns)
     turnover: float = 0
     agent_percent: float = 0
     agent_payment: float = 0
     operator_payment: float = 0
+    # Номера транзакций с уже учтенными ID (прошлые загрузки оператора, повтор в листе):
+    # в отчете помечаются, в итоги и БД не входят
+    inflow_duplicates: set = field(default_factory=set)
+    outflow_duplicates: set = field(default_factory=set)
+    # Ячейки сумм, которые не удалось прочитать как число: (адрес, значение). Их строки
+    # не входят в итоги и перечисляются в отчете
+    bad_cells: list = field(default_factory=list)
+
+    def __post_init__(self):
+        # Списки объектов (старый формат) переводятся в колонки
+        if not isinstance(self.inflows, TransactionColumns):
+            self.inflows = TransactionColumns(self.inflows)
+        if not isinstance(self.outflows, TransactionColumns):
+            self.outflows = TransactionColumns(self.outflows)
+        if not isinstance(self.baibit, BaibitColumns):
+            self.baibit = BaibitColumns(self.baibit)
+
+    def mark_duplicates(self, inflows: set, outflows: set):
+        """Исключить повторы из оборота и пересчитать выплаты"""
+        self.clear_duplicates()
+        self.inflow_duplicates, self.outflow_duplicates = inflows, outflows
+        if inflows:
+            self.turnover = sum(amount for i, amount in enumerate(self.inflows.amounts) if i not in inflows)
+        self.calculate_payments()
+
+    def clear_duplicates(self):
+        """Вернуть повторы в оборот (закэшированный разбор проверяется заново)"""
+        if self.inflow_duplicates:
+            self.turnover = self.inflows.total_amount()
+        self.inflow_duplicates, self.outflow_duplicates = set(), set()
+
+    def duplicate_amount(self) -> float:
+        amounts = self.inflows.amounts
+        return sum(amounts[i] for i in self.inflow_duplicates)
+
+    def total_commission(self) -> float:
+        """Комиссии выходных транзакций без повторов"""
+        commissions = self.outflows.commissions
+        return self.outflows.total_commission() - sum(commissions[i] for i in self.outflow_duplicates)
 
     def calculate_payments(self):
         self.agent_payment = self.turnover * self.agent_percent / 100
-        self.operator_payment = self.turnover * 0.005  # 0.5% для оператора
\ No newline at end of file
+        self.operator_payment = self.turnover * OPERATOR_SHARE
@@ -0,0 +1,371 @@
+"""Индекс учтенных транзакций оператора: повтор ID из прошлых загрузок не попадает в оборот.
+
+На оператора — точное хранилище SQLite (DEDUP_DIR/operator_<id>.sqlite) и фильтр Блума перед ним
+(operator_<id>.bloom). Почти все ID листа новые, и для них фильтр отвечает без обращения к диску;
+в SQLite проверяются только его срабатывания, поэтому ложное срабатывание стоит запроса, но не
+теряет транзакцию.
+
+Проверка листов только читает индекс. Принятые ID копятся в DedupBatch загрузки и записываются
+(record) после того, как задача довела отчет до конца: отмененная или упавшая загрузка ничего
+не оставляет в индексе. ID помнят загрузку (хэш содержимого книги), которая их учла, поэтому
+та же книга, отправленная заново (другой процент, сбой на середине), повторами не считается.
+Книга, которую уже записала завершенная загрузка (recorded), получает отчет, но второй раз
+в сессию и БД не сохраняется.
+"""
+import asyncio
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import struct
+import sys
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import closing, contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from config import DEDUP_DIR, DEDUP_CAPACITY, DEDUP_FALSE_POSITIVE_RATE
+from services import metrics
+from .data_models import ExcelSheetData, TransactionColumns
+
+logger = logging.getLogger(__name__)
+
+INFLOW = 0
+OUTFLOW = 1
+KIND_NAMES = {INFLOW: "inflow", OUTFLOW: "outflow"}
+
+# Срабатывания фильтра проверяются в SQLite запросами IN не длиннее LOOKUP_CHUNK
+LOOKUP_CHUNK = 500
+# Кэш страниц соединения: при вставке в индекс с долгой историей страницы B-дерева не читаются заново
+SQLITE_CACHE_KB = 64 * 1024
+
+# Заголовок файла фильтра: метка, число бит маски, емкость, число блоков, число ключей
+_HEADER = struct.Struct("<4sB3xQQQ")
+_MAGIC = b"BLM2"
+_INDEX_MASK = (1 << 48) - 1
+_MASK_COUNT = 1 << 16
+_MAX_HASHES = 16
+
+
+@lru_cache(maxsize=None)
+def _masks(k: int) -> array:
+    """Маски блока: k разных бит из 64. Строятся из blake2b номера маски, а не из random,
+    чтобы сохраненный фильтр читался любой версией Python"""
+    masks, pack = array('Q'), struct.Struct("<IBB").pack
+    for i in range(_MASK_COUNT):
+        mask, bits, counter = 0, 0, 0
+        while bits < k:
+            for byte in hashlib.blake2b(pack(i, k, counter), digest_size=32).digest():
+                bit = 1 << (byte & 63)
+                if not mask & bit:
+                    mask |= bit
+                    bits += 1
+                    if bits == k:
+                        break
+            counter += 1
+        masks.append(mask)
+    return masks
+
+
+def _false_positive_rate(bits_per_key: float, k: int) -> float:
+    """Доля ложных срабатываний блочного фильтра при заполнении до емкости: число ключей в блоке
+    распределено по Пуассону, в блоке с j ключами маска из k бит занята с вероятностью (1-(1-k/64)^j)^k"""
+    lam = 64 / bits_per_key
+    p, rate = math.exp(-lam), 0.0
+    for j in range(int(lam * 4) + 40):
+        if j:
+            p *= lam / j
+        rate += p * (1 - (1 - k / 64) ** j) ** k
+    return rate
+
+
+@lru_cache(maxsize=None)
+def plan(rate: float) -> tuple[float, int]:
+    """(бит на ключ, число бит маски) — наименьший фильтр с долей ложных срабатываний не выше rate"""
+    best = None
+    for k in range(1, _MAX_HASHES + 1):
+        bits_per_key = 4.0
+        while bits_per_key < 64 and _false_positive_rate(bits_per_key, k) > rate:
+            bits_per_key += 0.25
+        if best is None or bits_per_key < best[0]:
+            best = (bits_per_key, k)
+    return best
+
+
+def _hasher(kind: int):
+    # Копия заранее настроенного blake2b быстрее нового объекта с параметрами на каждый ключ
+    return hashlib.blake2b(digest_size=8, person=bytes([kind]))
+
+
+class BloomFilter:
+    """Блочный фильтр Блума с блоком в одно 64-битное слово: проверка и добавление ключа —
+    одно обращение к массиву.
+
+    Размер и число бит маски подбираются по доле ложных срабатываний rate при заполнении
+    до capacity (plan); для rate=0.001 это около 25 бит на ключ. Хэш — 64 бита blake2b:
+    младшие 48 выбирают блок, старшие 16 — маску из заранее построенной таблицы.
+    """
+    __slots__ = ("words", "k", "capacity", "count")
+
+    def __init__(self, capacity: int, rate: float = DEDUP_FALSE_POSITIVE_RATE,
+                 words: Optional[array] = None, k: Optional[int] = None, count: int = 0):
+        if words is None:
+            bits_per_key, k = plan(rate)
+            words = array('Q', bytes(8 * max(1, math.ceil(capacity * bits_per_key / 64))))
+        self.words = words
+        self.k = k
+        self.capacity = capacity
+        self.count = count
+
+    def update(self, kind: int, keys: Iterable[bytes]):
+        words, masks, nblocks = self.words, _masks(self.k), len(self.words)
+        base, from_bytes = _hasher(kind), int.from_bytes
+        added = 0
+        for key in keys:
+            hasher = base.copy()
+            hasher.update(key)
+            h = from_bytes(hasher.digest(), "little")
+            words[(h & _INDEX_MASK) % nblocks] |= masks[h >> 48]
+            added += 1
+        self.count += added
+
+    def hits(self, kind: int, keys: list) -> list[int]:
+        """Номера ключей, на которые фильтр срабатывает (возможно виденные)"""
+        words, masks, nblocks = self.words, _masks(self.k), len(self.words)
+        base, from_bytes = _hasher(kind), int.from_bytes
+        hits = []
+        for i, key in enumerate(keys):
+            hasher = base.copy()
+            hasher.update(key)
+            h = from_bytes(hasher.digest(), "little")
+            mask = masks[h >> 48]
+            if words[(h & _INDEX_MASK) % nblocks] & mask == mask:
+                hits.append(i)
+        return hits
+
+    def dump(self, path: Path):
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        words = self.words
+        if sys.byteorder != "little":
+            words = array('Q', words)
+            words.byteswap()
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.k, self.capacity, len(words), self.count))
+            words.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BloomFilter":
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size or header[:4] != _MAGIC:
+                raise ValueError(f"Not a bloom filter file: {path}")
+            _, k, capacity, nblocks, count = _HEADER.unpack(header)
+            words = array('Q')
+            words.frombytes(f.read())
+        if len(words) != nblocks or not 0 < k <= _MAX_HASHES:
+            raise ValueError(f"Truncated bloom filter file: {path}")
+        if sys.byteorder != "little":
+            words.byteswap()
+        return cls(capacity, words=words, k=k, count=count)
+
+
+def _keys(columns: TransactionColumns) -> list[bytes]:
+    # ID берутся байтами прямо из буфера колонок, без декодирования в str
+    data, offsets = bytes(columns.id_data), columns.id_offsets
+    return [data[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+class DedupBatch:
+    """ID одной загрузки, проверенные, но еще не записанные в индекс.
+
+    accepted — учтенные загрузкой (повтор внутри загрузки по ним тоже отсеивается),
+    known — из них уже записанные раньше той же книгой: при записи они пропускаются.
+    """
+    __slots__ = ("operator_id", "upload", "accepted", "known")
+
+    def __init__(self, operator_id: int, upload: str):
+        self.operator_id = operator_id
+        self.upload = upload
+        self.accepted = {INFLOW: set(), OUTFLOW: set()}
+        self.known = {INFLOW: set(), OUTFLOW: set()}
+
+    def fresh(self) -> dict[int, list]:
+        return {kind: sorted(self.accepted[kind] - self.known[kind]) for kind in self.accepted}
+
+
+class DedupIndex:
+    def __init__(self, root: Path = DEDUP_DIR, capacity: int = DEDUP_CAPACITY,
+                 rate: float = DEDUP_FALSE_POSITIVE_RATE):
+        self.root = root
+        self.capacity = capacity
+        self.rate = rate
+        # Фильтр оператора в памяти и отметка его файла: перечитывается, только если файл изменила другая копия
+        self._filters: dict[int, tuple[tuple, BloomFilter]] = {}
+        self._locks = defaultdict(threading.Lock)
+
+    async def warm_up(self):
+        """Построить таблицу масок заранее, чтобы ее не ждала проверка первого листа"""
+        await asyncio.to_thread(_masks, plan(self.rate)[1])
+
+    @staticmethod
+    def batch(operator_id: int, upload: str) -> DedupBatch:
+        """Пустой набор ID загрузки; upload — хэш содержимого книги"""
+        return DedupBatch(operator_id, upload)
+
+    async def mark_duplicates(self, batch: DedupBatch, data: ExcelSheetData) -> int:
+        """Отметить в data транзакции, уже учтенные у оператора другими загрузками или раньше
+        в этой, и исключить их из итогов; возвращает число повторов. Индекс не меняется"""
+        keys = {INFLOW: _keys(data.inflows), OUTFLOW: _keys(data.outflows)}
+        with metrics.stage("dedup"):
+            duplicates = await asyncio.to_thread(self._check, batch, keys)
+        data.mark_duplicates(duplicates[INFLOW], duplicates[OUTFLOW])
+        for kind, indices in duplicates.items():
+            metrics.DUPLICATES.inc(KIND_NAMES[kind], amount=len(indices))
+        return len(duplicates[INFLOW]) + len(duplicates[OUTFLOW])
+
+    async def record(self, batch: DedupBatch):
+        """Записать ID загрузки в индекс; вызывается, когда задача завершилась"""
+        await asyncio.to_thread(self._record, batch)
+
+    async def recorded(self, batch: DedupBatch) -> bool:
+        """Записана ли уже книга batch завершенной загрузкой оператора"""
+        return await asyncio.to_thread(self._recorded, batch)
+
+    def _recorded(self, batch: DedupBatch) -> bool:
+        with self._locked(batch.operator_id), closing(self._connect(batch.operator_id)) as db:
+            return db.execute("SELECT 1 FROM uploads WHERE digest = ?", (batch.upload,)).fetchone() is not None
+
+    def _check(self, batch: DedupBatch, keys: dict) -> dict[int, set]:
+        with self._locked(batch.operator_id), closing(self._connect(batch.operator_id)) as db:
+            bloom = self._filter(batch.operator_id, db)
+            row = db.execute("SELECT id FROM uploads WHERE digest = ?", (batch.upload,)).fetchone()
+            upload = row[0] if row is not None else None
+            return {kind: self._split(db, bloom, batch, kind, kind_keys, upload)
+                    for kind, kind_keys in keys.items()}
+
+    @staticmethod
+    def _split(db: sqlite3.Connection, bloom: BloomFilter, batch: DedupBatch, kind: int,
+               keys: list, upload: Optional[int]) -> set:
+        """Номера повторов; остальные ID попадают в batch"""
+        candidates = list({keys[i] for i in bloom.hits(kind, keys)})
+        # ID, записанные раньше, и загрузка, которая их учла. Срабатывание фильтра, не найденное
+        # здесь, — ложное: такой ID новый
+        found = {}
+        for start in range(0, len(candidates), LOOKUP_CHUNK):
+            chunk = candidates[start:start + LOOKUP_CHUNK]
+            found.update(db.execute(
+                f"SELECT id, upload FROM counted WHERE kind = ? AND id IN ({','.join('?' * len(chunk))})",
+                (kind, *chunk)
+            ))
+
+        accepted, known = batch.accepted[kind], batch.known[kind]
+        if not found and accepted.isdisjoint(keys):
+            # Обычный случай — все ID новые и без повторов внутри листа: без прохода по ключам в Python
+            unique = set(keys)
+            if len(unique) == len(keys):
+                accepted |= unique
+                return set()
+        duplicates = set()
+        for i, key in enumerate(keys):
+            if key in accepted:
+                duplicates.add(i)
+                continue
+            owner = found.get(key)
+            if owner is not None:
+                if owner != upload:
+                    duplicates.add(i)
+                    continue
+                known.add(key)
+            accepted.add(key)
+        return duplicates
+
+    def _record(self, batch: DedupBatch):
+        fresh = batch.fresh()
+        with self._locked(batch.operator_id), closing(self._connect(batch.operator_id)) as db:
+            bloom = None
+            if any(fresh.values()):
+                # Фильтр на диске всегда шире SQLite: сохраняется до вставки
+                bloom = self._filter(batch.operator_id, db)
+                for kind, keys in fresh.items():
+                    bloom.update(kind, keys)
+                self._save_filter(batch.operator_id, bloom)
+
+            with db:
+                # Загрузка записывается и без новых ID: по ней узнается повторная отправка книги
+                db.execute("INSERT OR IGNORE INTO uploads (digest) VALUES (?)", (batch.upload,))
+                upload = db.execute("SELECT id FROM uploads WHERE digest = ?", (batch.upload,)).fetchone()[0]
+                for kind, keys in fresh.items():
+                    # По возрастанию ключа вставка в B-дерево идет по соседним страницам
+                    db.executemany("INSERT OR IGNORE INTO counted VALUES (?, ?, ?)",
+                                   ((kind, key, upload) for key in keys))
+            if bloom is not None and bloom.count > bloom.capacity:
+                self._save_filter(batch.operator_id, self._rebuild(db))
+
+    @contextmanager
+    def _locked(self, operator_id: int) -> Iterator[None]:
+        # flock держится на открытом файле: потоки одной копии разделяет threading.Lock
+        with self._locks[operator_id], open(self.root / f"operator_{operator_id}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _connect(self, operator_id: int) -> sqlite3.Connection:
+        db = sqlite3.connect(self.root / f"operator_{operator_id}.sqlite")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        db.execute("CREATE TABLE IF NOT EXISTS uploads (id INTEGER PRIMARY KEY, digest TEXT NOT NULL UNIQUE)")
+        db.execute("CREATE TABLE IF NOT EXISTS counted (kind INTEGER NOT NULL, id BLOB NOT NULL, "
+                   "upload INTEGER NOT NULL, PRIMARY KEY (kind, id)) WITHOUT ROWID")
+        return db
+
+    def _filter_path(self, operator_id: int) -> Path:
+        return self.root / f"operator_{operator_id}.bloom"
+
+    @staticmethod
+    def _stamp(path: Path) -> Optional[tuple]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _filter(self, operator_id: int, db: sqlite3.Connection) -> BloomFilter:
+        path = self._filter_path(operator_id)
+        stamp = self._stamp(path)
+        cached = self._filters.get(operator_id)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        bloom = None
+        if stamp is not None:
+            try:
+                bloom = BloomFilter.load(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Rebuilding dedup filter of operator {operator_id}: {e}")
+        if bloom is None:
+            # Нет файла (первая загрузка, потерянный каталог) — фильтр строится по SQLite. На диск его
+            # сохранит record: проверка листа файл не пишет
+            bloom = self._rebuild(db)
+        self._filters[operator_id] = (stamp, bloom)
+        return bloom
+
+    def _save_filter(self, operator_id: int, bloom: BloomFilter):
+        path = self._filter_path(operator_id)
+        bloom.dump(path)
+        self._filters[operator_id] = (self._stamp(path), bloom)
+
+    def _rebuild(self, db: sqlite3.Connection) -> BloomFilter:
+        """Фильтр по всем ID из SQLite с запасом вдвое"""
+        count = db.execute("SELECT count(*) FROM counted").fetchone()[0]
+        bloom = BloomFilter(max(self.capacity, count * 2), self.rate)
+        for kind in KIND_NAMES:
+            bloom.update(kind, (key for key, in db.execute("SELECT id FROM counted WHERE kind = ?", (kind,))))
+        return bloom
@@ -1,53 +1,117 @@
-from openpyxl import load_workbook
+import logging
 from pathlib import Path
-from .data_models import ExcelSheetData, Transaction, BaibitTransaction
+from typing import Iterable, Iterator, Optional, Tuple
+from .data_models import ExcelSheetData, _number
+
+logger = logging.getLogger(__name__)
+
+# Ширина строки, которую читает парсер: A..G — транзакции, K..T — шапка листа
+ROW_WIDTH = 20
+HEADER_ROW = 2
 
 
 class ExcelProcessor:
     @staticmethod
     def process_workbook(file_path: Path, agent_percent: float) -> dict[str, ExcelSheetData]:
-        wb = load_workbook(file_path)
-        sheets_data = {}
-
-        for sheet_name in wb.sheetnames:
-            sheet = wb[sheet_name]
-            data = ExcelSheetData(
-                full_name=sheet['K2'].value,
-                bank=sheet['L2'].value,
-                warm_up_purchases=sheet['M2'].value,
-                warm_up_rub=sheet['N2'].value,
-                start_balance=sheet['Q2'].value,
-                stop_balance=sheet['R2'].value,
-                start_time=sheet['S2'].value,
-                end_time=sheet['T2'].value,
-                operator=sheet['P2'].value,
-                inflows=[],
-                outflows=[],
-                baibit=[],
-                agent_percent=agent_percent
-            )
-
-            # Обработка строк
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if row[0] and row[1]:  # Входные транзакции
-                    data.inflows.append(Transaction(amount=row[0], transaction_id=str(row[1])))
-                    data.turnover += row[0]
-
-                if row[2] and row[3]:  # Выходные транзакции
-                    commission = row[4] if len(row) > 4 and row[4] else 0
-                    data.outflows.append(Transaction(
-                        amount=row[2],
-                        transaction_id=str(row[3]),
-                        commission=commission
-                    ))
-
-                if row[5] and row[6]:  # Байбит транзакции
-                    data.baibit.append(BaibitTransaction(
-                        amount=row[5],
-                        rate=row[6]
-                    ))
-
-            data.calculate_payments()
-            sheets_data[sheet_name] = data
-
-        return sheets_data
\ No newline at end of file
+        return dict(ExcelProcessor.iter_workbook(file_path, agent_percent))
+
+    @staticmethod
+    def get_sheet_names(file_path: Path) -> list[str]:
+        # openpyxl импортируется при первом разборе: запуск бота его не ждет
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path, read_only=True)
+        try:
+            return wb.sheetnames
+        finally:
+            wb.close()
+
+    @staticmethod
+    def iter_workbook(file_path: Path, agent_percent: float,
+                      sheet_names: Optional[list[str]] = None) -> Iterator[Tuple[str, ExcelSheetData]]:
+        """Потоковый разбор книги: листы читаются построчно в read-only режиме"""
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path, read_only=True)
+        try:
+            for sheet_name in (wb.sheetnames if sheet_names is None else sheet_names):
+                ws = wb[sheet_name]
+                # Read-only лист читается по объявленному в файле размеру: неверный размер обрезал бы
+                # строки и колонки шапки K..T. Без него читаются все строки, а max_col дополняет их до T
+                ws.reset_dimensions()
+                yield sheet_name, ExcelProcessor.parse_rows(
+                    ws.iter_rows(min_row=HEADER_ROW, max_col=ROW_WIDTH, values_only=True),
+                    agent_percent
+                )
+        finally:
+            wb.close()
+
+    @staticmethod
+    def parse_rows(rows: Iterable[tuple], agent_percent: float) -> ExcelSheetData:
+        """Разбор строк листа, начиная со второй (строка шапки K2..T2)"""
+        data = None
+
+        for row_number, row in enumerate(rows, HEADER_ROW):
+            # В read-only режиме хвостовые пустые ячейки могут отсутствовать
+            if len(row) < ROW_WIDTH:
+                row = tuple(row) + (None,) * (ROW_WIDTH - len(row))
+
+            if data is None:
+                data = ExcelProcessor._create_sheet_data(row, agent_percent)
+
+            ExcelProcessor._parse_row(data, row, row_number)
+
+        if data is None:
+            data = ExcelProcessor._create_sheet_data((None,) * ROW_WIDTH, agent_percent)
+        elif data.bad_cells:
+            logger.warning(f"Sheet {data.full_name!r}: {len(data.bad_cells)} non-numeric amount cells skipped, "
+                           f"first {data.bad_cells[0]}")
+
+        data.calculate_payments()
+        return data
+
+    @staticmethod
+    def _create_sheet_data(header: tuple, agent_percent: float) -> ExcelSheetData:
+        return ExcelSheetData(
+            full_name=header[10],  # K2
+            bank=header[11],  # L2
+            warm_up_purchases=header[12],  # M2
+            warm_up_rub=header[13],  # N2
+            start_balance=header[16],  # Q2
+            stop_balance=header[17],  # R2
+            start_time=header[18],  # S2
+            end_time=header[19],  # T2
+            operator=header[15],  # P2
+            agent_percent=agent_percent
+        )
+
+    @staticmethod
+    def _parse_row(data: ExcelSheetData, row: tuple, row_number: int):
+        if row[0] and row[1]:  # Входные транзакции
+            try:
+                data.inflows.add(row[0], str(row[1]))
+            except ValueError:
+                ExcelProcessor._reject(data, row, row_number, (0,))
+            else:
+                # Сумма уже приведена к числу: текстовая ячейка ("500 р") не ломает оборот
+                data.turnover += data.inflows.amounts[-1]
+
+        if row[2] and row[3]:  # Выходные транзакции
+            commission = row[4] if row[4] else 0
+            try:
+                data.outflows.add(row[2], str(row[3]), commission)
+            except ValueError:
+                ExcelProcessor._reject(data, row, row_number, (2, 4))
+
+        if row[5] and row[6]:  # Байбит транзакции
+            try:
+                data.baibit.add(row[5], row[6])
+            except ValueError:
+                ExcelProcessor._reject(data, row, row_number, (5, 6))
+
+    @staticmethod
+    def _reject(data: ExcelSheetData, row: tuple, row_number: int, columns: tuple):
+        """Транзакция с нечисловой суммой не учитывается; ячейка попадает в отчет"""
+        for column in columns:
+            try:
+                _number(row[column] or 0)
+            except ValueError:
+                data.bad_cells.append((f"{chr(ord('A') + column)}{row_number}", str(row[column])))
@@ -1,44 +1,83 @@
+import asyncio
+import hashlib
+import os
 import shutil
+import uuid
 from pathlib import Path
 from datetime import datetime
+from typing import AsyncIterable, AsyncIterator
 import logging
-from config import USER_FILES_DIR, REPORTS_DIR
+import aiofiles
+import aiofiles.os
+from aiogram import Bot
+from services import metrics
+from services.storage_maintenance import ReportManifest
+from config import USER_FILES_DIR, REPORTS_DIR, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
 
 class FileManager:
     @staticmethod
-    def save_user_file(user_id: int, file_bytes: bytes) -> Path:
+    async def iter_telegram_file(bot: Bot, file_path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Содержимое файла Telegram частями, без сборки в памяти (как Bot.download_file, но без буфера)"""
+        api = bot.session.api
+        if api.is_local:
+            async with aiofiles.open(api.wrap_local_file.to_local(file_path), 'rb') as f:
+                while chunk := await f.read(chunk_size):
+                    yield chunk
+            return
+
+        async for chunk in bot.session.stream_content(
+            url=api.file_url(bot.token, file_path),
+            timeout=DOWNLOAD_TIMEOUT,
+            chunk_size=chunk_size,
+            raise_for_status=True
+        ):
+            yield chunk
+
+    @staticmethod
+    @metrics.timed("download")
+    async def save_user_file(user_id: int, chunks: AsyncIterable[bytes]) -> Path:
+        """Потоковое сохранение файла под именем sha256 содержимого: запись во временный файл
+        с подсчетом хэша и атомарное переименование; повторная загрузка не пишет копию"""
+        user_dir = USER_FILES_DIR / str(user_id)
+        tmp_path = user_dir / f".{uuid.uuid4().hex}.part"
         try:
-            user_dir = USER_FILES_DIR / str(user_id)
-            user_dir.mkdir(exist_ok=True)
+            user_dir.mkdir(parents=True, exist_ok=True)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_path = user_dir / f"file_{timestamp}.xlsx"
+            digest = hashlib.sha256()
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    await f.write(chunk)
 
-            with open(file_path, 'wb') as f:
-                if hasattr(file_bytes, 'read'):
-                    f.write(file_bytes.read())
-                else:
-                    f.write(file_bytes)
+            file_path = user_dir / f"{digest.hexdigest()}.xlsx"
+            if await aiofiles.os.path.exists(file_path):
+                await aiofiles.os.remove(tmp_path)
+                await aiofiles.os.wrap(os.utime)(file_path)
+                return file_path
 
+            await aiofiles.os.replace(tmp_path, file_path)
             return file_path
         except Exception as e:
             logger.error(f"Error saving file: {e}")
+            tmp_path.unlink(missing_ok=True)
             raise
 
     @staticmethod
-    def save_report(user_id: int, sheet_name: str, content: str) -> Path:
+    @metrics.timed("disk_write")
+    async def save_report(user_id: int, sheet_name: str, content: str) -> Path:
         try:
             reports_dir = REPORTS_DIR / str(user_id)
-            reports_dir.mkdir(exist_ok=True)
+            reports_dir.mkdir(parents=True, exist_ok=True)
 
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             report_path = reports_dir / f"report_{timestamp}_{sheet_name}.txt"
 
-            with open(report_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            async with aiofiles.open(report_path, 'w', encoding='utf-8') as f:
+                await f.write(content)
+            await asyncio.to_thread(ReportManifest(reports_dir).append, report_path)
 
             return report_path
         except Exception as e:
@@ -46,11 +85,27 @@ class FileManager:
             raise
 
     @staticmethod
-    def get_user_reports(user_id: int) -> list[Path]:
+    @metrics.timed("disk_write")
+    async def save_report_file(user_id: int, filename: str, content: bytes) -> Path:
         try:
             reports_dir = REPORTS_DIR / str(user_id)
-            return sorted(reports_dir.glob("*.txt"), key=lambda f: f.stat().st_mtime,
-                          reverse=True) if reports_dir.exists() else []
+            reports_dir.mkdir(parents=True, exist_ok=True)
+
+            report_path = reports_dir / filename
+            async with aiofiles.open(report_path, 'wb') as f:
+                await f.write(content)
+            await asyncio.to_thread(ReportManifest(reports_dir).append, report_path)
+
+            return report_path
+        except Exception as e:
+            logger.error(f"Error saving report: {e}")
+            raise
+
+    @staticmethod
+    def get_user_reports(user_id: int, offset: int = 0, limit: int = 20) -> list[Path]:
+        """Страница отчетов от новых к старым по индексу, без обхода каталога"""
+        try:
+            return ReportManifest(REPORTS_DIR / str(user_id)).page(offset, limit)
         except Exception as e:
             logger.error(f"Error getting reports: {e}")
-            return []
\ No newline at end of file
+            return []
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from models import FsmStates
+
+
+class SqlKeyValue:
+    """Ключ-значение в таблице fsm_states (PostgreSQL или SQLite)"""
+
+    def __init__(self, engine: AsyncEngine, dispose_engine: bool = False):
+        self.engine = engine
+        self.session_factory = async_sessionmaker(engine)
+        self.dispose_engine = dispose_engine
+        dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+        self._insert = dialect.insert
+
+    async def create_table(self):
+        """Для отдельной БД состояний (FSM_STORAGE_URL); основная схема создается миграциями"""
+        async with self.engine.begin() as connection:
+            await connection.run_sync(FsmStates.__table__.create, checkfirst=True)
+
+    async def get(self, name: str) -> Optional[str]:
+        async with self.session_factory() as session:
+            row = (await session.execute(
+                select(FsmStates.value, FsmStates.expires_at).where(FsmStates.key == name)
+            )).first()
+        if row is None or (row.expires_at is not None and row.expires_at <= datetime.now()):
+            return None
+        return row.value
+
+    async def set(self, name: str, value: str, ex: Optional[int] = None) -> bool:
+        expires_at = datetime.now() + timedelta(seconds=ex) if ex else None
+        stmt = self._insert(FsmStates).values(key=name, value=value, expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmStates.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at}
+        )
+        async with self.session_factory.begin() as session:
+            await session.execute(stmt)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        async with self.session_factory.begin() as session:
+            result = await session.execute(delete(FsmStates).where(FsmStates.key.in_(names)))
+        return result.rowcount
+
+    async def aclose(self) -> None:
+        if self.dispose_engine:
+            await self.engine.dispose()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Protocol, Union
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StorageKey
+from config import FSM_STORAGE, FSM_STORAGE_URL, FSM_STATE_TTL, REDIS_URL
+
+if TYPE_CHECKING:
+    from database import Database
+
+
+class KeyValueClient(Protocol):
+    """Подмножество команд Redis, которого достаточно хранилищу FSM.
+    Ему соответствует redis.asyncio.Redis, а также LocalKeyValue, LazyKeyValue и SqlKeyValue (services.fsm_sql)"""
+
+    async def get(self, name: str) -> Optional[Union[str, bytes]]: ...
+
+    async def set(self, name: str, value: str, ex: Optional[int] = None) -> Any: ...
+
+    async def delete(self, *names: str) -> int: ...
+
+    async def aclose(self) -> None: ...
+
+
+class LocalKeyValue:
+    """Redis-совместимая замена в памяти процесса: для тестов и запуска одной копии"""
+
+    def __init__(self):
+        self._values: Dict[str, tuple] = {}
+
+    async def get(self, name: str) -> Optional[str]:
+        value, expires_at = self._values.get(name, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._values[name]
+            return None
+        return value
+
+    async def set(self, name: str, value: str, ex: Optional[int] = None) -> bool:
+        self._values[name] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        return sum(self._values.pop(name, None) is not None for name in names)
+
+    async def aclose(self) -> None:
+        self._values.clear()
+
+
+class LazyKeyValue:
+    """Клиент, который создается при первой команде: хранилище FSM собирается до начала
+    приема апдейтов, а SQLAlchemy и движок БД загружаются уже после"""
+
+    def __init__(self, factory: Callable[[], Awaitable[KeyValueClient]]):
+        self._factory = factory
+        self._client: Optional[KeyValueClient] = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> KeyValueClient:
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._client = await self._factory()
+        return self._client
+
+    async def get(self, name: str) -> Optional[Union[str, bytes]]:
+        return await (await self.connect()).get(name)
+
+    async def set(self, name: str, value: str, ex: Optional[int] = None) -> Any:
+        return await (await self.connect()).set(name, value, ex=ex)
+
+    async def delete(self, *names: str) -> int:
+        return await (await self.connect()).delete(*names)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class KeyValueStorage(BaseStorage):
+    """Хранилище FSM поверх Redis-совместимого клиента: состояние и данные
+    каждого оператора под своим ключом, общие для всех копий бота"""
+
+    def __init__(self, client: KeyValueClient, key_builder: Optional[KeyBuilder] = None,
+                 ttl: Optional[int] = None):
+        self.client = client
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix="fsm")
+        self.ttl = ttl
+
+    async def set_state(self, key: StorageKey, state: Union[str, State, None] = None) -> None:
+        name = self.key_builder.build(key, "state")
+        if state is None:
+            await self.client.delete(name)
+        else:
+            await self.client.set(name, state.state if isinstance(state, State) else state, ex=self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.client.get(self.key_builder.build(key, "state"))
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        name = self.key_builder.build(key, "data")
+        if not data:
+            await self.client.delete(name)
+        else:
+            await self.client.set(name, json.dumps(data, ensure_ascii=False), ex=self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self.client.get(self.key_builder.build(key, "data"))
+        return json.loads(value) if value else {}
+
+    async def warm_up(self) -> None:
+        """Создать ленивый клиент заранее, чтобы его не ждал первый апдейт"""
+        if isinstance(self.client, LazyKeyValue):
+            await self.client.connect()
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def _create_sql_client(db: "Database") -> KeyValueClient:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from services.fsm_sql import SqlKeyValue
+    if FSM_STORAGE_URL:
+        # Отдельная БД состояний, например sqlite+aiosqlite:///storage/fsm.db
+        client = SqlKeyValue(create_async_engine(FSM_STORAGE_URL), dispose_engine=True)
+        await client.create_table()
+        return client
+    return SqlKeyValue(db.engine)
+
+
+async def create_fsm_storage(db: "Database") -> BaseStorage:
+    """Хранилище FSM по FSM_STORAGE: sql (по умолчанию), redis или local.
+    В режиме sql SQLAlchemy импортируется и движок db создается при первом обращении к хранилищу"""
+    ttl = FSM_STATE_TTL or None
+    if FSM_STORAGE == "sql":
+        return KeyValueStorage(LazyKeyValue(lambda: _create_sql_client(db)), ttl=ttl)
+    if FSM_STORAGE == "redis":
+        # Необязательная зависимость: нужна только при FSM_STORAGE=redis
+        from redis.asyncio import Redis
+        return KeyValueStorage(Redis.from_url(REDIS_URL), ttl=ttl)
+    if FSM_STORAGE == "local":
+        return KeyValueStorage(LocalKeyValue(), ttl=ttl)
+    raise ValueError(f"Unknown FSM storage: {FSM_STORAGE}")
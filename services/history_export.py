@@ -0,0 +1,160 @@
+"""Выгрузка истории (AgentSessions и Transactions) за период в XLSX.
+
+Строки читаются курсором на стороне сервера (AsyncSession.stream + yield_per) пачками по
+EXPORT_BATCH_ROWS и пишутся в книгу openpyxl в режиме write-only, которая сохраняется во временный
+файл: память не растет с числом строк. Пачка пишется в потоке, пока из курсора читается следующая.
+
+python -m services.history_export --from 2025-01-01 --to 2026-01-01 [--operator <id>] output.xlsx
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import EXPORT_BATCH_ROWS
+from models import Agents, AgentSessions, Operators, Transactions
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_TITLE = "Смены"
+SESSIONS_HEADER = [
+    "ID смены", "Оператор", "Агент", "Начало", "Конец", "Стартовый баланс", "Стоп баланс",
+    "Процент агента", "Оплата агента", "Оборот"
+]
+TRANSACTIONS_TITLE = "Транзакции"
+TRANSACTIONS_HEADER = [
+    "ID смены", "Начало смены", "Оператор", "Агент", "Тип", "ID входа", "Сумма входа",
+    "ID выхода", "Сумма выхода", "Комиссия", "Курс"
+]
+
+
+def _append_rows(ws, rows):
+    for row in rows:
+        ws.append(row)
+
+
+class HistoryExporter:
+    @staticmethod
+    def sessions_query(date_from: date, date_to: date, operator_username: Optional[str] = None) -> Select:
+        query = (
+            select(AgentSessions.id, Operators.username, Agents.full_name, AgentSessions.session_start,
+                   AgentSessions.session_end, AgentSessions.start_balance, AgentSessions.stop_balance,
+                   AgentSessions.agent_percent, AgentSessions.agent_payment, AgentSessions.turnover)
+            .join(Operators, Operators.id == AgentSessions.operator_id)
+            .join(Agents, Agents.id == AgentSessions.agent_id)
+            .order_by(AgentSessions.session_start, AgentSessions.id)
+        )
+        return HistoryExporter._filter(query, date_from, date_to, operator_username)
+
+    @staticmethod
+    def transactions_query(date_from: date, date_to: date, operator_username: Optional[str] = None) -> Select:
+        # Строки смены идут подряд в порядке ix_transactions_agent_session_id_id
+        query = (
+            select(Transactions.agent_session_id, AgentSessions.session_start, Operators.username, Agents.full_name,
+                   Transactions.transaction_type, Transactions.deposit_id, Transactions.deposit_amount,
+                   Transactions.withdraw_id, Transactions.withdraw_amount, Transactions.commission,
+                   Transactions.exchange_rate)
+            .join(AgentSessions, AgentSessions.id == Transactions.agent_session_id)
+            .join(Operators, Operators.id == AgentSessions.operator_id)
+            .join(Agents, Agents.id == AgentSessions.agent_id)
+            .order_by(AgentSessions.session_start, Transactions.agent_session_id, Transactions.id)
+        )
+        return HistoryExporter._filter(query, date_from, date_to, operator_username)
+
+    @staticmethod
+    def _filter(query: Select, date_from: date, date_to: date, operator_username: Optional[str]) -> Select:
+        query = query.where(AgentSessions.session_start >= datetime.combine(date_from, time.min),
+                            AgentSessions.session_start < datetime.combine(date_to, time.min))
+        if operator_username is not None:
+            query = query.where(Operators.username == operator_username)
+        return query
+
+    @staticmethod
+    async def export(session: AsyncSession, path: Path, date_from: date, date_to: date,
+                     operator_username: Optional[str] = None) -> dict:
+        """Смены и транзакции за [date_from, date_to) в path; возвращает число строк по листам"""
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        counts = {}
+        with metrics.stage("export"):
+            for title, header, query in (
+                (SESSIONS_TITLE, SESSIONS_HEADER, HistoryExporter.sessions_query),
+                (TRANSACTIONS_TITLE, TRANSACTIONS_HEADER, HistoryExporter.transactions_query),
+            ):
+                ws = wb.create_sheet(title)
+                ws.append(header)
+                counts[title] = await HistoryExporter._stream_rows(
+                    session, query(date_from, date_to, operator_username), ws
+                )
+            # Листы write-only книги уже лежат во временных файлах openpyxl, save собирает из них архив
+            await asyncio.to_thread(wb.save, path)
+        return counts
+
+    @staticmethod
+    async def _stream_rows(session: AsyncSession, query: Select, ws) -> int:
+        count = 0
+        writing = None
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        try:
+            async for rows in result.partitions():
+                # В памяти не больше двух пачек: записываемая и только что прочитанная
+                if writing is not None:
+                    await writing
+                writing = asyncio.ensure_future(asyncio.to_thread(_append_rows, ws, rows))
+                count += len(rows)
+        finally:
+            if writing is not None:
+                await writing
+            await result.close()
+        return count
+
+    @staticmethod
+    @asynccontextmanager
+    async def spooled(session: AsyncSession, date_from: date, date_to: date,
+                      operator_username: Optional[str] = None) -> AsyncIterator[tuple[Path, dict]]:
+        """Выгрузка во временный файл, который удаляется при выходе из блока"""
+        fd, name = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+        os.close(fd)
+        path = Path(name)
+        try:
+            counts = await HistoryExporter.export(session, path, date_from, date_to, operator_username)
+            yield path, counts
+        finally:
+            path.unlink(missing_ok=True)
+
+
+async def run_export(path: Path, date_from: date, date_to: date, operator_username: Optional[str]) -> dict:
+    from database import Database
+    db = Database()
+    try:
+        async with db.session() as session:
+            return await HistoryExporter.export(session, path, date_from, date_to, operator_username)
+    finally:
+        await db.dispose()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Выгрузка смен и транзакций за период в XLSX")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True,
+                        help="первый день, ГГГГ-ММ-ДД")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True,
+                        help="день после последнего")
+    parser.add_argument("--operator", help="id оператора в Telegram (по умолчанию все)")
+    parser.add_argument("output", type=Path)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    counts = asyncio.run(run_export(args.output, args.date_from, args.date_to, args.operator))
+    print(json.dumps(counts, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque, defaultdict
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+import aiohttp
+from aiogram.exceptions import TelegramNetworkError
+from config import JOB_WORKERS, JOB_PER_OPERATOR, JOB_MAX_PENDING, JOB_MAX_RETRIES, JOB_RETRY_DELAY
+from . import metrics
+from .worker_pool import PoolBusyError
+
+logger = logging.getLogger(__name__)
+
+# Сбои, после которых задачу имеет смысл повторить, если она еще ничего не успела отправить
+TRANSIENT_ERRORS = (PoolBusyError, TelegramNetworkError, aiohttp.ClientError, ConnectionError)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class FileJob:
+    operator_id: int
+    message: Any  # сообщение с документом: из него берутся файл и чат для ответов
+    agent_percent: float
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    status: JobStatus = JobStatus.QUEUED
+    attempts: int = 0
+    # Сбрасывается, как только задача начала отправлять отчет: повтор продублировал бы сообщения
+    retriable: bool = True
+    created: float = field(default_factory=time.monotonic)
+
+    # Сообщение с ходом обработки, которое редактируется по мере разбора листов
+    progress_message_id: Optional[int] = None
+    progress_text: str = ""
+    progress_edited: float = 0.0
+    sheets_done: int = 0
+    sheets_total: int = 0
+    # Каталог профиля загрузки, если она профилируется (services.profiler)
+    profile_dir: Optional[Path] = None
+    # ID транзакций загрузки, которые запишутся в индекс повторов после обработки (services.dedup)
+    dedup: Any = None
+    # Книгу уже записала прошлая загрузка оператора: отчет строится, в сессию и БД она не пишется
+    recorded: bool = False
+
+
+class JobQueue:
+    """Очередь обработки файлов в фоне.
+
+    workers задач выполняются одновременно, у одного оператора — не больше per_operator;
+    задачи оператора идут в порядке загрузки, операторы обслуживаются по очереди.
+    Упавшая на временном сбое задача повторяется с нарастающей паузой, пока retriable.
+    """
+
+    def __init__(self, run: Callable[[FileJob], Awaitable], on_error: Callable[[FileJob, Exception], Awaitable],
+                 workers: int = JOB_WORKERS, per_operator: int = JOB_PER_OPERATOR,
+                 max_pending: int = JOB_MAX_PENDING, max_retries: int = JOB_MAX_RETRIES,
+                 retry_delay: float = JOB_RETRY_DELAY):
+        self.run = run
+        self.on_error = on_error
+        self.workers = workers
+        self.per_operator = per_operator
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self._pending: dict[int, deque] = defaultdict(deque)
+        # Сколько раз оператор стоит в _ready или обрабатывается прямо сейчас
+        self._scheduled: dict[int, int] = defaultdict(int)
+        self._ready: Optional[asyncio.Queue] = None
+        self._running: dict[str, tuple] = {}  # id -> (job, task)
+        self._workers = []
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self._ready = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        metrics.JOBS_IN_FLIGHT.set_function(lambda: len(self._running))
+        metrics.JOBS_PENDING.set_function(self.pending_count)
+
+    async def stop(self, timeout: float = 30.0):
+        """Дождаться выполняющихся задач (не дольше timeout); ожидающие отменяются"""
+        for jobs in self._pending.values():
+            for job in jobs:
+                job.status = JobStatus.CANCELLED
+            jobs.clear()
+        if self._running:
+            await asyncio.wait([task for _, task in self._running.values()], timeout=timeout)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: FileJob) -> int:
+        """Поставить задачу в очередь; возвращает число задач оператора перед ней"""
+        if self.pending_count() >= self.max_pending:
+            raise QueueFullError(f"{self.max_pending} jobs pending")
+        ahead = len(self._pending[job.operator_id]) + len(self.operator_jobs(job.operator_id, JobStatus.RUNNING))
+        self._pending[job.operator_id].append(job)
+        self._schedule(job.operator_id)
+        return ahead
+
+    def cancel(self, operator_id: int) -> list[FileJob]:
+        """Отменить все задачи оператора: ожидающие снимаются, выполняющиеся прерываются"""
+        cancelled = list(self._pending.pop(operator_id, ()))
+        for job in cancelled:
+            job.status = JobStatus.CANCELLED
+        for job, task in list(self._running.values()):
+            if job.operator_id == operator_id:
+                job.status = JobStatus.CANCELLED
+                task.cancel()
+                cancelled.append(job)
+        return cancelled
+
+    def operator_jobs(self, operator_id: int, status: Optional[JobStatus] = None) -> list[FileJob]:
+        jobs = list(self._pending.get(operator_id, ()))
+        jobs += [job for job, _ in self._running.values() if job.operator_id == operator_id]
+        return [job for job in jobs if status is None or job.status == status]
+
+    def pending_count(self) -> int:
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending_count(),
+            "running": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    def _schedule(self, operator_id: int):
+        if self._pending.get(operator_id) and self._scheduled[operator_id] < self.per_operator:
+            self._scheduled[operator_id] += 1
+            self._ready.put_nowait(operator_id)
+
+    async def _worker(self):
+        while True:
+            operator_id = await self._ready.get()
+            try:
+                jobs = self._pending.get(operator_id)
+                if jobs:
+                    job = jobs.popleft()
+                    if not jobs:
+                        del self._pending[operator_id]
+                    await self._execute(job)
+            finally:
+                self._scheduled[operator_id] -= 1
+                if not self._scheduled[operator_id]:
+                    del self._scheduled[operator_id]
+                self._schedule(operator_id)
+
+    async def _execute(self, job: FileJob):
+        delay = 0.0
+        while True:
+            task = asyncio.create_task(self._attempt(job, delay))
+            self._running[job.id] = (job, task)
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if job.status == JobStatus.CANCELLED:
+                    logger.info(f"Job {job.id} cancelled")
+                    return
+                # Остановка воркера: задачу тоже прерываем
+                task.cancel()
+                raise
+            except Exception as e:
+                if isinstance(e, TRANSIENT_ERRORS) and job.retriable and job.attempts <= self.max_retries:
+                    delay = self.retry_delay * 2 ** (job.attempts - 1)
+                    logger.warning(f"Job {job.id} failed ({e!r}), retry {job.attempts} in {delay:.0f}s")
+                    continue
+                job.status = JobStatus.FAILED
+                self.failed += 1
+                logger.error(f"Job {job.id} failed: {e}", exc_info=e)
+                await self._report_error(job, e)
+                return
+            else:
+                job.status = JobStatus.DONE
+                self.completed += 1
+                return
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _attempt(self, job: FileJob, delay: float):
+        if delay:
+            # Пауза перед повтором внутри задачи: ее так же можно отменить
+            await asyncio.sleep(delay)
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        with metrics.stage("job"):
+            await self.run(job)
+
+    async def _report_error(self, job: FileJob, error: Exception):
+        try:
+            await self.on_error(job, error)
+        except Exception as e:
+            logger.error(f"Error reporting job {job.id} failure: {e}")
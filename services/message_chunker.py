@@ -0,0 +1,82 @@
+from itertools import chain
+from typing import Iterable, Iterator
+
+# Telegram ограничивает длину текста в единицах UTF-16, а не в символах Python
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MessageChunker:
+    """Упаковка отчета в сообщения Telegram: строки не разрываются,
+    секция (отчет по листу) не делится, если помещается в одно сообщение.
+    Секции разделяются пустой строкой.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_MESSAGE_LIMIT):
+        self.limit = limit
+        self._lines = []
+        self._size = 0
+
+    def feed(self, lines: Iterable[str]) -> Iterator[str]:
+        """Добавить секцию; отдает сообщения по мере их заполнения"""
+        lines = iter(lines)
+        buffered, size = [], -1
+        for line in lines:
+            buffered.append(line)
+            size += utf16_len(line) + 1
+            if size > self.limit:
+                break
+        else:
+            if not buffered:
+                return
+            # Секция помещается в одно сообщение: переносим ее целиком, если не влезает в текущее
+            if self._lines and self._size + 2 + size > self.limit:
+                yield from self.flush()
+            self._push_separator()
+            for line in buffered:
+                self._push(line)
+            return
+
+        # Секция длиннее сообщения: упаковка по строкам
+        self._push_separator()
+        for line in chain(buffered, lines):
+            for piece in self._split(line):
+                if self._lines and self._size + 1 + utf16_len(piece) > self.limit:
+                    yield from self.flush()
+                self._push(piece)
+
+    def flush(self) -> Iterator[str]:
+        text = "\n".join(self._lines).strip("\n")
+        self._lines = []
+        self._size = 0
+        if text:
+            yield text
+
+    def _push_separator(self):
+        if self._lines:
+            self._push("")
+
+    def _push(self, line: str):
+        length = utf16_len(line)
+        self._size += length + 1 if self._lines else length
+        self._lines.append(line)
+
+    def _split(self, line: str) -> Iterator[str]:
+        """Строка длиннее сообщения режется по переводам строк, а затем по символам"""
+        if utf16_len(line) <= self.limit:
+            yield line
+            return
+
+        for part in line.split("\n"):
+            piece, size = [], 0
+            for char in part:
+                width = utf16_len(char)
+                if size + width > self.limit:
+                    yield "".join(piece)
+                    piece, size = [], 0
+                piece.append(char)
+                size += width
+            yield "".join(piece)
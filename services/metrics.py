@@ -0,0 +1,242 @@
+import bisect
+import functools
+import inspect
+import logging
+import time
+from contextlib import nullcontext
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Optional
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Выключенные метрики не считают ничего: каждый вызов сводится к проверке флага
+enabled = METRICS_ENABLED
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_NULL = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        _registry.append(self)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        if enabled:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Значение снимается при выдаче метрик функцией, заданной set_function"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def _samples(self) -> Iterator[str]:
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = STAGE_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._series = {}  # labels -> [счетчики по корзинам (+Inf последней), сумма]
+
+    def observe(self, value: float, *labels):
+        if not enabled:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> Iterator[str]:
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+
+
+STAGE_SECONDS = Histogram(
+    "chocolate_stage_seconds",
+    "Time spent per processing stage (download, parse, dedup, render, disk_write, session, send, persist, export, job)",
+    ("stage",)
+)
+ERRORS = Counter("chocolate_errors_total", "Errors per processing stage", ("stage",))
+FILES = Counter("chocolate_files_total", "Processed workbooks")
+SHEETS = Counter("chocolate_sheets_total", "Processed sheets")
+ROWS = Counter("chocolate_rows_total", "Parsed transactions (inflows, outflows, Baibit)")
+PARSE_CACHE = Counter("chocolate_parse_cache_lookups_total", "Parse cache lookups by result (hit, miss)", ("result",))
+DUPLICATES = Counter("chocolate_duplicates_total", "Transactions with already counted ids", ("kind",))
+JOBS_IN_FLIGHT = Gauge("chocolate_jobs_in_flight", "File jobs being processed")
+JOBS_PENDING = Gauge("chocolate_jobs_pending", "File jobs waiting in the queue")
+SEND_QUEUED = Gauge("chocolate_send_queued", "Outbound Telegram messages waiting to be sent")
+SEND_LATENCY = Histogram(
+    "chocolate_send_latency_seconds", "Time from queueing to delivery of outbound Telegram messages", ("priority",)
+)
+SEND_RESULTS = Counter("chocolate_send_results_total", "Outbound Telegram send attempts by result", ("result",))
+
+
+class _StageTimer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.name)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            ERRORS.inc(self.name)
+        return False
+
+
+def stage(name: str):
+    """Контекстный менеджер: длительность блока в chocolate_stage_seconds, исключение — в errors"""
+    return _StageTimer(name) if enabled else _NULL
+
+
+def timed(name: str):
+    """Декоратор функции (обычной или async) для замера этапа name"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, items: Iterable) -> Iterator:
+    """Итерация с замером времени получения элементов; время потребителя между ними не входит"""
+    if not enabled:
+        yield from items
+        return
+    iterator = iter(items)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except Exception:
+                ERRORS.inc(name)
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, name)
+
+
+async def timed_aiter(name: str, items: AsyncIterable) -> AsyncIterator:
+    """Асинхронный вариант timed_iter"""
+    if not enabled:
+        async for item in items:
+            yield item
+        return
+    iterator = items.__aiter__()
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                ERRORS.inc(name)
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, name)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """HTTP-сервер с GET /metrics; возвращает runner для остановки (runner.cleanup())"""
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics served on http://{host}:{port}/metrics")
+    return runner
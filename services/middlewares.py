@@ -0,0 +1,30 @@
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Открывает AsyncSession на время обработки одного апдейта и передает ее в обработчик.
+
+    Регистрируется как внутренний middleware событий: сессия открывается только для обработчиков
+    с параметром session, остальные апдейты не трогают БД (и не импортируют SQLAlchemy)"""
+
+    def __init__(self, session_factory: Callable[[], "AsyncSession"]):
+        self.session_factory = session_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is not None and "session" not in handler_object.params:
+            return await handler(event, data)
+        # Соединение берется из пула только при первом запросе и возвращается при закрытии сессии
+        async with self.session_factory() as session:
+            data["session"] = session
+            return await handler(event, data)
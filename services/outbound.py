@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Optional
+from aiogram.exceptions import TelegramRetryAfter
+from config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_CONCURRENCY, SEND_QUEUE_LIMIT, SEND_MAX_RETRIES
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+CHATS_PRUNE_THRESHOLD = 1000
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # ответы на действия оператора
+    BULK = 1  # части отчетов
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Сколько ждать до появления токена"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("factory", "future", "priority", "enqueued", "attempts")
+
+    def __init__(self, factory: Callable[[], Awaitable], future: asyncio.Future, priority: Priority):
+        self.factory = factory
+        self.future = future
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ("lanes", "bucket", "not_before", "busy", "version")
+
+    def __init__(self):
+        self.lanes = {priority: deque() for priority in Priority}
+        self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        self.not_before = 0.0
+        self.busy = False
+        self.version = 0
+
+    def head_priority(self) -> Optional[Priority]:
+        for priority in Priority:
+            if self.lanes[priority]:
+                return priority
+        return None
+
+
+class OutboundDispatcher:
+    """Единая очередь исходящих сообщений Telegram.
+
+    Сообщения одного чата и одного приоритета уходят строго по порядку, чат — не чаще
+    SEND_CHAT_RATE в секунду, все вместе — не чаще SEND_GLOBAL_RATE. Интерактивный ответ
+    обгоняет ждущие части отчетов, в том числе в своем чате, и среди чатов, готовых к отправке,
+    тоже обслуживается первым. На 429 отправка чата откладывается на retry_after.
+    Время от постановки в очередь до доставки и исходы отправок выдаются в /metrics.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        self._chats: dict[int, _Chat] = {}
+        self._lane_slots = {priority: asyncio.Semaphore(SEND_QUEUE_LIMIT) for priority in Priority}
+        self._in_flight = asyncio.Semaphore(SEND_CONCURRENCY)
+        self._delayed = []  # (not_before, seq, chat_id, version)
+        self._eligible = []  # (priority, seq, chat_id, version)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._scheduler = None
+        self._tasks = set()
+
+        self._queued = {priority: 0 for priority in Priority}
+
+    def start(self):
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._run())
+            metrics.SEND_QUEUED.set_function(lambda: sum(self._queued.values()))
+
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди (не дольше timeout) и остановить планировщик"""
+        deadline = time.monotonic() + timeout
+        while sum(self._queued.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            self._scheduler = None
+        for chat in self._chats.values():
+            for lane in chat.lanes.values():
+                for job in lane:
+                    job.future.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, chat_id: int, factory: Callable[[], Awaitable],
+                     priority: Priority = Priority.INTERACTIVE) -> asyncio.Future:
+        """Поставить отправку в очередь; при заполненной очереди ждет места.
+        Возвращает future с результатом вызова factory()"""
+        await self._lane_slots[priority].acquire()
+        future = asyncio.get_running_loop().create_future()
+        if len(self._chats) > CHATS_PRUNE_THRESHOLD:
+            self._prune()
+        chat = self._chats.setdefault(chat_id, _Chat())
+        chat.lanes[priority].append(_Job(factory, future, priority))
+        self._queued[priority] += 1
+        self._schedule(chat_id, chat)
+        return future
+
+    async def send(self, chat_id: int, factory: Callable[[], Awaitable],
+                   priority: Priority = Priority.INTERACTIVE):
+        return await (await self.submit(chat_id, factory, priority))
+
+    async def answer(self, message, text: str, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        return await self.send(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+    async def answer_document(self, message, document, priority: Priority = Priority.INTERACTIVE, **kwargs):
+        return await self.send(message.chat.id, lambda: message.answer_document(document, **kwargs), priority)
+
+    def _schedule(self, chat_id: int, chat: _Chat):
+        """Поставить чат в очередь планировщика; старые записи о нем становятся неактуальными"""
+        priority = chat.head_priority()
+        if chat.busy or priority is None:
+            return
+        chat.version += 1
+        not_before = max(chat.not_before, time.monotonic() + chat.bucket.delay())
+        if not_before <= time.monotonic():
+            heapq.heappush(self._eligible, (priority, next(self._seq), chat_id, chat.version))
+        else:
+            heapq.heappush(self._delayed, (not_before, next(self._seq), chat_id, chat.version))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, chat_id, version = heapq.heappop(self._delayed)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.version == version:
+                    heapq.heappush(self._eligible, (chat.head_priority(), seq, chat_id, version))
+
+            if not self._eligible:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, chat_id, version = heapq.heappop(self._eligible)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.version != version or chat.busy:
+                continue
+            priority = chat.head_priority()
+            if priority is None:
+                continue
+
+            await self._in_flight.acquire()
+            self._global.consume()
+            chat.bucket.delay()
+            chat.bucket.consume()
+            chat.busy = True
+            job = chat.lanes[priority].popleft()
+            task = asyncio.create_task(self._deliver(chat_id, chat, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, chat_id: int, chat: _Chat, job: _Job):
+        done = True
+        try:
+            job.attempts += 1
+            with metrics.stage("send"):
+                result = await job.factory()
+        except TelegramRetryAfter as e:
+            if job.attempts <= SEND_MAX_RETRIES:
+                # Повтор первым в своей полосе, чтобы не нарушить порядок сообщений чата
+                logger.warning(f"Flood control for chat {chat_id}, retry after {e.retry_after}s")
+                metrics.SEND_RESULTS.inc("retry")
+                chat.not_before = time.monotonic() + e.retry_after
+                chat.lanes[job.priority].appendleft(job)
+                done = False
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            metrics.SEND_RESULTS.inc("sent")
+            metrics.SEND_LATENCY.observe(time.monotonic() - job.enqueued, job.priority.name.lower())
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight.release()
+            if done:
+                self._queued[job.priority] -= 1
+                self._lane_slots[job.priority].release()
+            chat.busy = False
+            self._schedule(chat_id, chat)
+
+    def _prune(self):
+        """Забыть простаивающие чаты с полным ведром: их лимит уже восстановился"""
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.busy and chat.head_priority() is None and chat.not_before <= time.monotonic():
+                chat.bucket.delay()
+                if chat.bucket.tokens >= chat.bucket.capacity:
+                    del self._chats[chat_id]
+
+    def _fail(self, job: _Job, error: Exception):
+        metrics.SEND_RESULTS.inc("failed")
+        if not job.future.done():
+            job.future.set_exception(error)
@@ -0,0 +1,87 @@
+import logging
+import os
+import pickle
+from pathlib import Path
+from config import PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Повышается при любом изменении ExcelSheetData, чтобы не читать старые записи
+CACHE_VERSION = 4
+
+
+class ParseCache:
+    """Дисковый кэш результатов разбора книг по хэшу содержимого с LRU-вытеснением"""
+
+    def __init__(self, cache_dir: Path = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.v{CACHE_VERSION}.pkl"
+
+    def contains(self, digest: str) -> bool:
+        """Есть ли запись; обращение учитывается через record, когда известно, прочиталась ли она"""
+        return self.path_for(digest).exists()
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+            metrics.PARSE_CACHE.inc("hit")
+        else:
+            self.misses += 1
+            metrics.PARSE_CACHE.inc("miss")
+
+    @staticmethod
+    def load(path: Path) -> list:
+        """Чтение записи; выполняется в процессе пула"""
+        with open(path, 'rb') as f:
+            sheets = pickle.load(f)
+        try:
+            # mtime служит меткой последнего обращения для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            # Вытеснена после чтения: разбор уже в памяти
+            pass
+        return sheets
+
+    def store(self, digest: str, sheets: list):
+        """Сохранить список (sheet_name, ExcelSheetData) атомарной заменой файла"""
+        path = self.path_for(digest)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(sheets, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error storing parse cache entry: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            Path(path).unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
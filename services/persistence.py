@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Agents, Operators, AgentSessions, Transactions
+from .data_models import ExcelSheetData, _number
+from .rollups import RollupStore
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_COLUMNS = (
+    "agent_session_id", "deposit_id", "deposit_amount", "withdraw_id",
+    "withdraw_amount", "commission", "transaction_type", "exchange_rate"
+)
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value else Decimal(0)
+
+
+def _balance(value, field: str) -> Optional[Decimal]:
+    """Баланс из шапки листа. Текст ("10 000", "1,5") разбирается так же, как суммы транзакций;
+    нераспознанное значение не сохраняется, но и не срывает сохранение книги"""
+    if value is None or value == "":
+        return Decimal(0)
+    try:
+        balance = Decimal(str(_number(value)))
+    except (ValueError, ArithmeticError):
+        balance = None
+    if balance is None or not balance.is_finite():
+        logger.warning(f"Unparseable {field} {value!r}, stored as NULL")
+        return None
+    return balance
+
+
+def _datetime(value) -> Optional[datetime]:
+    # Время в шапке листа бывает строкой ("18:00"), такие значения не сохраняем
+    return value if isinstance(value, datetime) else None
+
+
+class TransactionStore:
+    @staticmethod
+    async def save_workbook(session: AsyncSession, operator_username: str,
+                            sheets: Iterable[ExcelSheetData]) -> list[int]:
+        """Сохранение разобранной книги одной транзакцией вместе с дневными итогами;
+        возвращает id созданных AgentSessions"""
+        sheets = list(sheets)
+        async with session.begin():
+            operator_id = await TransactionStore._upsert_operator(session, operator_username)
+            agent_ids = await TransactionStore._upsert_agents(
+                session, {TransactionStore._agent_name(data) for data in sheets}
+            )
+
+            session_ids = []
+            rollups = []
+            for data in sheets:
+                agent_id = agent_ids[TransactionStore._agent_name(data)]
+                # Время смены без даты в шапке листа — момент сохранения, как у AgentSessions по умолчанию
+                session_start = _datetime(data.start_time) or datetime.now()
+                agent_session_id = await TransactionStore._create_agent_session(
+                    session, data, agent_id, operator_id, session_start
+                )
+                await TransactionStore._copy_transactions(
+                    session, TransactionStore._transaction_rows(agent_session_id, data)
+                )
+                session_ids.append(agent_session_id)
+                rollups.append(TransactionStore._rollup_row(data, operator_id, agent_id, session_start))
+            await RollupStore.add(session, rollups)
+
+        return session_ids
+
+    @staticmethod
+    def _agent_name(data: ExcelSheetData) -> str:
+        return str(data.full_name or getattr(data, "sheet_name", "") or "Без имени")[:255]
+
+    @staticmethod
+    async def _upsert_operator(session: AsyncSession, username: str) -> int:
+        # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул id и для существующей строки
+        stmt = pg_insert(Operators).values(username=username)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Operators.username], set_={"username": stmt.excluded.username}
+        ).returning(Operators.id)
+        return (await session.execute(stmt)).scalar_one()
+
+    @staticmethod
+    async def _upsert_agents(session: AsyncSession, names: set[str]) -> dict[str, int]:
+        if not names:
+            return {}
+        result = await session.execute(select(Agents.full_name, Agents.id).where(Agents.full_name.in_(names)))
+        agent_ids = dict(result.all())
+
+        # Одновременное сохранение может вставить того же агента раньше: DO NOTHING ждет его
+        # транзакцию, и такой агент читается повторно. Имена по порядку, чтобы вставки не взаимоблокировались
+        missing = sorted(name for name in names if name not in agent_ids)
+        if missing:
+            stmt = pg_insert(Agents).values([{"full_name": name} for name in missing])
+            stmt = stmt.on_conflict_do_nothing(index_elements=[Agents.full_name])
+            result = await session.execute(stmt.returning(Agents.full_name, Agents.id))
+            agent_ids.update(result.all())
+
+            raced = [name for name in missing if name not in agent_ids]
+            if raced:
+                result = await session.execute(
+                    select(Agents.full_name, Agents.id).where(Agents.full_name.in_(raced))
+                )
+                agent_ids.update(result.all())
+
+        return agent_ids
+
+    @staticmethod
+    async def _create_agent_session(session: AsyncSession, data: ExcelSheetData,
+                                    agent_id: int, operator_id: int, session_start: datetime) -> int:
+        values = {
+            "agent_id": agent_id,
+            "operator_id": operator_id,
+            "session_start": session_start,
+            "session_end": _datetime(data.end_time),
+            "start_balance": _balance(data.start_balance, "start_balance"),
+            "stop_balance": _balance(data.stop_balance, "stop_balance"),
+            "agent_percent": _decimal(data.agent_percent),
+            "agent_payment": _decimal(data.agent_payment),
+            "turnover": _decimal(data.turnover),
+        }
+        result = await session.execute(insert(AgentSessions).values(**values).returning(AgentSessions.id))
+        return result.scalar_one()
+
+    @staticmethod
+    def _rollup_row(data: ExcelSheetData, operator_id: int, agent_id: int, session_start: datetime) -> dict:
+        return {
+            "operator_id": operator_id,
+            "day": session_start.date(),
+            "agent_id": agent_id,
+            "sessions": 1,
+            "turnover": _decimal(data.turnover),
+            "agent_payment": _decimal(data.agent_payment),
+            "operator_payment": _decimal(data.operator_payment),
+            "commissions": _decimal(data.total_commission()),
+            # Повторы не сохраняются в transactions и не входят в счетчики
+            "inflow_count": len(data.inflows) - len(data.inflow_duplicates),
+            "outflow_count": len(data.outflows) - len(data.outflow_duplicates),
+            "baibit_count": len(data.baibit),
+        }
+
+    @staticmethod
+    def _transaction_rows(agent_session_id: int, data: ExcelSheetData) -> Iterator[tuple]:
+        zero = Decimal(0)
+        one = Decimal(1)
+        # Чтение прямо из колонок, без сборки объекта Transaction на строку
+        inflows, outflows, baibit = data.inflows, data.outflows, data.baibit
+        # Повторы прошлых загрузок уже сохранены с ними
+        inflow_duplicates, outflow_duplicates = data.inflow_duplicates, data.outflow_duplicates
+        for i, (transaction_id, amount) in enumerate(zip(inflows.ids(), inflows.amounts)):
+            if i in inflow_duplicates:
+                continue
+            yield agent_session_id, transaction_id, _decimal(amount), None, zero, zero, "inflow", one
+        for i, (transaction_id, amount, commission) in enumerate(
+                zip(outflows.ids(), outflows.amounts, outflows.commissions)):
+            if i in outflow_duplicates:
+                continue
+            yield agent_session_id, None, zero, transaction_id, _decimal(amount), _decimal(commission), \
+                "outflow", one
+        for amount, rate in zip(baibit.amounts, baibit.rates):
+            yield agent_session_id, None, zero, None, _decimal(amount), zero, "baibit", _decimal(rate)
+
+    @staticmethod
+    async def _copy_transactions(session: AsyncSession, rows: Iterable[tuple]):
+        """COPY строк в transactions через соединение текущей транзакции"""
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+
+        if hasattr(driver_connection, "copy_records_to_table"):
+            await driver_connection.copy_records_to_table(
+                Transactions.__tablename__, records=rows, columns=TRANSACTION_COLUMNS
+            )
+        else:
+            # Драйверы без COPY: один executemany вместо ORM-объекта на строку
+            rows = [dict(zip(TRANSACTION_COLUMNS, row)) for row in rows]
+            if rows:
+                await session.execute(insert(Transactions), rows)
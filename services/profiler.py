@@ -0,0 +1,174 @@
+"""Профилирование отдельных загрузок: cProfile + tracemalloc с дампами в STORAGE_DIR/profiles.
+
+Профилируются все загрузки (PROFILE_UPLOADS=1) или только загрузки операторов из PROFILE_OPERATORS
+и включенных командой /profile. Каждая загрузка пишет каталог <время>_<оператор>_<задача> с парами
+<часть>.pstats / <часть>.alloc.json: main — процесс бота (загрузка, отчет, отправка), parse-N —
+разбор в процессах пула. Хранятся последние PROFILE_KEEP каталогов.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import shutil
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from config import PROFILES_DIR, PROFILE_UPLOADS, PROFILE_OPERATORS, PROFILE_KEEP
+
+logger = logging.getLogger(__name__)
+
+OPERATORS_FILE = ".operators.json"
+ALLOC_TOP = 50
+TRACEMALLOC_FRAMES = 1
+
+
+def _dump(base: Path, profile: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak: int):
+    profile.dump_stats(base.with_suffix(".pstats"))
+    sites = [
+        {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:ALLOC_TOP]
+    ]
+    base.with_suffix(".alloc.json").write_text(json.dumps({"peak": peak, "sites": sites}))
+
+
+@contextmanager
+def _profiling(base: Path):
+    """cProfile и tracemalloc на время блока, дамп в base.pstats/base.alloc.json"""
+    profile = cProfile.Profile()
+    # Процесс пула, выполняющий задачи в том же процессе (тесты), уже может трассировать память
+    owner = not tracemalloc.is_tracing()
+    if owner:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if owner:
+            tracemalloc.stop()
+        try:
+            _dump(base, profile, snapshot, peak)
+        except OSError as e:
+            logger.error(f"Error saving profile {base}: {e}")
+
+
+def profile_call(base: str, func, *args):
+    """Выполнить func(*args) под профилировщиком; вызывается в процессе пула"""
+    with _profiling(Path(base)):
+        return func(*args)
+
+
+class Profiler:
+    def __init__(self, profiles_dir: Path = PROFILES_DIR, keep: int = PROFILE_KEEP):
+        self.profiles_dir = profiles_dir
+        self.keep = keep
+        self._active = False
+        self._operators: set[int] = set()
+        self._operators_mtime = None
+
+    def enabled_for(self, operator_id: int) -> bool:
+        return PROFILE_UPLOADS or operator_id in PROFILE_OPERATORS or operator_id in self._toggled()
+
+    def set_operator(self, operator_id: int, enabled: bool):
+        """Включение профилирования оператора; список лежит в каталоге профилей и общий для копий бота"""
+        operators = set(self._toggled())
+        if enabled:
+            operators.add(operator_id)
+        else:
+            operators.discard(operator_id)
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.profiles_dir / f"{OPERATORS_FILE}.tmp"
+        tmp_path.write_text(json.dumps(sorted(operators)))
+        tmp_path.replace(self.profiles_dir / OPERATORS_FILE)
+
+    def _toggled(self) -> set[int]:
+        path = self.profiles_dir / OPERATORS_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if mtime != self._operators_mtime:
+            try:
+                self._operators = set(json.loads(path.read_text()))
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading profiled operators: {e}")
+            self._operators_mtime = mtime
+        return self._operators
+
+    @contextmanager
+    def profile(self, operator_id: int, job_id: str) -> Iterator[Optional[Path]]:
+        """Профиль загрузки; отдает каталог для дампов процессов пула или None, если профиль не снимается.
+
+        В процессе бота cProfile видит весь event loop, поэтому одновременно снимается один профиль.
+        """
+        if not self.enabled_for(operator_id) or self._active:
+            yield None
+            return
+
+        profile_dir = self.profiles_dir / f"{time.strftime('%Y%m%d_%H%M%S')}_{operator_id}_{job_id}"
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        self._active = True
+        try:
+            with _profiling(profile_dir / "main"):
+                yield profile_dir
+        finally:
+            self._active = False
+            self._rotate()
+            logger.info(f"Upload profile saved to {profile_dir}")
+
+    def recent(self, count: Optional[int] = None) -> list[Path]:
+        if not self.profiles_dir.exists():
+            return []
+        dirs = sorted((path for path in self.profiles_dir.iterdir() if path.is_dir()),
+                      key=lambda path: path.name, reverse=True)
+        return dirs[:count]
+
+    def summary(self, count: int, top: int = 10) -> dict:
+        """Самые горячие функции (по собственному времени) и места выделения памяти за последние count загрузок"""
+        dirs = self.recent(count)
+        stats = None
+        allocations = defaultdict(int)
+        peak = 0
+        for profile_dir in dirs:
+            for path in profile_dir.glob("*.pstats"):
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(str(path))
+                    else:
+                        stats.add(str(path))
+                except (OSError, EOFError, TypeError) as e:
+                    logger.warning(f"Skipping profile {path}: {e}")
+            for path in profile_dir.glob("*.alloc.json"):
+                try:
+                    data = json.loads(path.read_text())
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping allocations {path}: {e}")
+                    continue
+                peak = max(peak, data["peak"])
+                for site in data["sites"]:
+                    allocations[site["site"]] += site["size"]
+
+        functions = []
+        if stats is not None:
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+            functions = [
+                {"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+                 "tottime": tottime, "cumtime": cumtime}
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+            ]
+        return {
+            "uploads": [path.name for path in dirs],
+            "functions": functions,
+            "allocations": sorted(allocations.items(), key=lambda item: item[1], reverse=True)[:top],
+            "peak": peak
+        }
+
+    def _rotate(self):
+        for path in self.recent()[self.keep:]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,111 @@
+import csv
+import io
+import re
+from typing import Iterator
+from .data_models import ExcelSheetData
+
+SUMMARY_TITLE = "Итоги"
+SUMMARY_HEADER = [
+    "Лист", "ФИО", "Банк", "Процент агента", "Оборот", "Оплата агента", "Оплата оператора",
+    "Комиссии", "Стартовый баланс", "Стоп баланс", "Старт", "Стоп", "Тг"
+]
+TRANSACTIONS_HEADER = ["Тип", "№", "Сумма", "ID", "Комиссия", "Курс", "Повтор"]
+CSV_HEADER = ["Лист", "ФИО"] + TRANSACTIONS_HEADER
+
+# Ограничения Excel на имена листов
+_INVALID_TITLE_CHARS = re.compile(r"[\[\]:*?/\\]")
+_MAX_TITLE_LENGTH = 31
+
+
+def _cell(value):
+    # Время и прочие значения шапки листа бывают любого типа; в ячейку пишем как есть, кроме None
+    return "" if value is None else value
+
+
+class ReportExporter:
+    """Сводный отчет по книге одним файлом: XLSX (лист итогов + лист на агента) или CSV"""
+
+    @staticmethod
+    def export(sheets: list, fmt: str) -> bytes:
+        if fmt == "xlsx":
+            return ReportExporter.to_xlsx(sheets)
+        if fmt == "csv":
+            return ReportExporter.to_csv(sheets)
+        raise ValueError(f"Unknown report format: {fmt}")
+
+    @staticmethod
+    def to_xlsx(sheets: list) -> bytes:
+        """Книга в write-only режиме: строки пишутся потоком, без DOM листа в памяти"""
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+
+        summary = wb.create_sheet(SUMMARY_TITLE)
+        summary.append(SUMMARY_HEADER)
+        for sheet_name, data in sheets:
+            summary.append(ReportExporter._summary_row(sheet_name, data))
+        summary.append([
+            "Всего", "", "", "",
+            sum(data.turnover for _, data in sheets),
+            sum(data.agent_payment for _, data in sheets),
+            sum(data.operator_payment for _, data in sheets),
+            sum(data.total_commission() for _, data in sheets),
+        ])
+
+        used_titles = {SUMMARY_TITLE.lower()}
+        for sheet_name, data in sheets:
+            ws = wb.create_sheet(ReportExporter._sheet_title(sheet_name, used_titles))
+            ws.append(["ФИО", _cell(data.full_name)])
+            ws.append(["Банк", _cell(data.bank)])
+            ws.append(["Покупки, прогревы", f"{data.warm_up_rub}/{data.warm_up_purchases}"])
+            ws.append(["Процент агента", data.agent_percent])
+            ws.append(["Оборот", data.turnover])
+            ws.append([])
+            ws.append(TRANSACTIONS_HEADER)
+            for row in ReportExporter._transaction_rows(data):
+                ws.append(row)
+
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def to_csv(sheets: list) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        for sheet_name, data in sheets:
+            prefix = [sheet_name, _cell(data.full_name)]
+            writer.writerows(prefix + row for row in ReportExporter._transaction_rows(data))
+        # utf-8-sig: Excel открывает кириллицу без выбора кодировки
+        return buffer.getvalue().encode("utf-8-sig")
+
+    @staticmethod
+    def _summary_row(sheet_name: str, data: ExcelSheetData) -> list:
+        return [
+            sheet_name, _cell(data.full_name), _cell(data.bank), data.agent_percent, data.turnover,
+            data.agent_payment, data.operator_payment, data.total_commission(),
+            _cell(data.start_balance), _cell(data.stop_balance), _cell(data.start_time),
+            _cell(data.end_time), _cell(data.operator)
+        ]
+
+    @staticmethod
+    def _transaction_rows(data: ExcelSheetData) -> Iterator[list]:
+        inflow_duplicates, outflow_duplicates = data.inflow_duplicates, data.outflow_duplicates
+        for i, t in enumerate(data.inflows, 1):
+            yield ["Вход", i, t.amount, t.transaction_id, "", "", "да" if i - 1 in inflow_duplicates else ""]
+        for i, t in enumerate(data.outflows, 1):
+            yield ["Выход", i, t.amount, t.transaction_id, t.commission or "", "",
+                   "да" if i - 1 in outflow_duplicates else ""]
+        for i, t in enumerate(data.baibit, 1):
+            yield ["Байбит", i, t.amount, "", "", t.rate, ""]
+
+    @staticmethod
+    def _sheet_title(sheet_name: str, used_titles: set) -> str:
+        base = _INVALID_TITLE_CHARS.sub("_", str(sheet_name))[:_MAX_TITLE_LENGTH] or "Лист"
+        title, n = base, 1
+        while title.lower() in used_titles:
+            n += 1
+            suffix = f" ({n})"
+            title = base[:_MAX_TITLE_LENGTH - len(suffix)] + suffix
+        used_titles.add(title.lower())
+        return title
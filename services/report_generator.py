@@ -1,5 +1,11 @@
+from typing import Iterator
 from .data_models import ExcelSheetData
 
+# Отметка транзакции, ID которой уже учтен (в прошлой загрузке оператора или выше в листе)
+DUPLICATE_MARK = " ⚠️ повтор"
+# Сколько нечисловых ячеек перечислить в отчете
+BAD_CELLS_SHOWN = 20
+
 
 class ReportGenerator:
     @staticmethod
@@ -11,7 +17,12 @@ class ReportGenerator:
 
     @staticmethod
     def generate(data: ExcelSheetData) -> str:
-        report = [
+        return "\n".join(ReportGenerator.iter_lines(data))
+
+    @staticmethod
+    def iter_lines(data: ExcelSheetData) -> Iterator[str]:
+        """Отчет по листу построчно; строки транзакций формируются по мере чтения"""
+        yield from [
             f"=== Отчет по листу: {data.sheet_name} ===",
             f"ФИО: {data.full_name}",
             f"Банк: {data.bank}",
@@ -23,34 +34,52 @@ class ReportGenerator:
             "\n📌 Входные транзакции:"
         ]
 
-        report.extend(
+        inflow_duplicates, outflow_duplicates = data.inflow_duplicates, data.outflow_duplicates
+        yield from (
             f"{i}. {ReportGenerator.format_number(t.amount)} {t.transaction_id}"
+            f"{DUPLICATE_MARK if i - 1 in inflow_duplicates else ''}"
             for i, t in enumerate(data.inflows, 1)
         )
 
-        report.append("\n\n📌 Выходные транзакции:")
-        report.extend(
+        yield "\n\n📌 Выходные транзакции:"
+        yield from (
             f"{i}. {ReportGenerator.format_number(t.amount)} {t.transaction_id}"
             f"{f' ({t.commission} комса)' if t.commission else ''}"
+            f"{DUPLICATE_MARK if i - 1 in outflow_duplicates else ''}"
             for i, t in enumerate(data.outflows, 1)
         )
 
         if data.baibit:
-            report.append("\n\n📌 Выход Байбит:")
-            report.extend(
+            yield "\n\n📌 Выход Байбит:"
+            yield from (
                 f"{i}. {ReportGenerator.format_number(t.amount)} ({t.rate})"
                 for i, t in enumerate(data.baibit, 1)
             )
 
-        report.extend([
-            f"\n\nИтоги:",
-            f"Оборот: {ReportGenerator.format_number(data.turnover)}",
+        if data.bad_cells:
+            yield f"\n\n⚠️ Нечисловые суммы, строки не учтены: {len(data.bad_cells)}"
+            yield from (f"{address}: {value}" for address, value in data.bad_cells[:BAD_CELLS_SHOWN])
+
+        yield "\n\nИтоги:"
+        yield f"Оборот: {ReportGenerator.format_number(data.turnover)}"
+        duplicates = len(inflow_duplicates) + len(outflow_duplicates)
+        if duplicates:
+            yield (f"Повторы ID (не учтены): {duplicates}, "
+                   f"входных на {ReportGenerator.format_number(data.duplicate_amount())}")
+        yield from [
             f"Оплата агента ({data.agent_percent}%): {ReportGenerator.format_number(data.agent_payment)}",
             f"Оплата оператора (0.5%): {ReportGenerator.format_number(data.operator_payment)}",
-            f"Общие комиссии: {ReportGenerator.format_number(sum(t.commission for t in data.outflows))}",
+            f"Общие комиссии: {ReportGenerator.format_number(data.total_commission())}",
             f"Стоп баланс: {ReportGenerator.format_number(data.stop_balance)}",
             f"Тг: {data.operator or 'Нет данных'}",
             "=" * 40
-        ])
+        ]
 
-        return "\n".join(report)
+    @staticmethod
+    def file_summary_lines(turnover_total: float, operator_total: float) -> list[str]:
+        return [
+            "=== ИТОГИ ПО ФАЙЛУ ===",
+            f"Общий оборот: {ReportGenerator.format_number(turnover_total)}",
+            f"Оплата оператора (0.5%): {ReportGenerator.format_number(operator_total)}",
+            "=" * 40
+        ]
@@ -0,0 +1,79 @@
+from datetime import datetime
+from sqlalchemy import Select, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AgentSessions, AgentPhones, Transactions
+
+
+class Repository:
+    """Запросы к истории транзакций; каждый опирается на индекс из миграции 5c2e9a7d41b3"""
+
+    @staticmethod
+    def operator_sessions_query(operator_id: int, date_from: datetime, date_to: datetime) -> Select:
+        # ix_agent_sessions_operator_id_session_start
+        return (
+            select(AgentSessions)
+            .where(AgentSessions.operator_id == operator_id,
+                   AgentSessions.session_start >= date_from,
+                   AgentSessions.session_start < date_to)
+            .order_by(AgentSessions.session_start)
+        )
+
+    @staticmethod
+    def agent_sessions_query(agent_id: int, date_from: datetime, date_to: datetime) -> Select:
+        # ix_agent_sessions_agent_id_session_start
+        return (
+            select(AgentSessions)
+            .where(AgentSessions.agent_id == agent_id,
+                   AgentSessions.session_start >= date_from,
+                   AgentSessions.session_start < date_to)
+            .order_by(AgentSessions.session_start)
+        )
+
+    @staticmethod
+    def session_transactions_query(agent_session_id: int) -> Select:
+        # ix_transactions_agent_session_id_id
+        return (
+            select(Transactions)
+            .where(Transactions.agent_session_id == agent_session_id)
+            .order_by(Transactions.id)
+        )
+
+    @staticmethod
+    def transaction_by_external_id_query(external_id: str) -> Select:
+        # Равенство подразумевает IS NOT NULL, поэтому работают частичные индексы
+        # ix_transactions_deposit_id и ix_transactions_withdraw_id (BitmapOr)
+        return select(Transactions).where(
+            or_(Transactions.deposit_id == external_id, Transactions.withdraw_id == external_id)
+        )
+
+    @staticmethod
+    def agent_phones_query(agent_id: int) -> Select:
+        # ix_agent_phones_agent_id
+        return select(AgentPhones).where(AgentPhones.agent_id == agent_id)
+
+    @staticmethod
+    async def get_operator_sessions(session: AsyncSession, operator_id: int,
+                                    date_from: datetime, date_to: datetime) -> list[AgentSessions]:
+        result = await session.scalars(Repository.operator_sessions_query(operator_id, date_from, date_to))
+        return list(result)
+
+    @staticmethod
+    async def get_agent_sessions(session: AsyncSession, agent_id: int,
+                                 date_from: datetime, date_to: datetime) -> list[AgentSessions]:
+        result = await session.scalars(Repository.agent_sessions_query(agent_id, date_from, date_to))
+        return list(result)
+
+    @staticmethod
+    async def get_session_transactions(session: AsyncSession, agent_session_id: int) -> list[Transactions]:
+        result = await session.scalars(Repository.session_transactions_query(agent_session_id))
+        return list(result)
+
+    @staticmethod
+    async def find_transactions(session: AsyncSession, external_id: str) -> list[Transactions]:
+        result = await session.scalars(Repository.transaction_by_external_id_query(external_id))
+        return list(result)
+
+    @staticmethod
+    async def get_agent_phones(session: AsyncSession, agent_id: int) -> list[AgentPhones]:
+        result = await session.scalars(Repository.agent_phones_query(agent_id))
+        return list(result)
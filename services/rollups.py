@@ -0,0 +1,185 @@
+"""Дневные итоги (daily_rollups): оператор × агент × день.
+
+Сохранение книги прибавляет к ним итоги листов в той же транзакции (TransactionStore.save_workbook),
+сводки за период читают только их, поэтому время ответа не зависит от объема истории.
+Заполнение по истории и пересчет: python -m services.rollups rebuild [--from 2025-01-01] [--to 2025-02-01]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+from sqlalchemy import Date, Numeric, Select, cast, delete, func, insert, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Agents, AgentSessions, DailyRollups, Operators, Transactions
+from .data_models import OPERATOR_SHARE
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ("operator_id", "day", "agent_id")
+SUM_COLUMNS = (
+    "sessions", "turnover", "agent_payment", "operator_payment", "commissions",
+    "inflow_count", "outflow_count", "baibit_count"
+)
+
+
+def period_bounds(period: str, day: date) -> tuple[date, date]:
+    """Границы [начало, конец) дня, недели (с понедельника) или месяца, содержащих day"""
+    if period == "day":
+        return day, day + timedelta(days=1)
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == "month":
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+class RollupStore:
+    @staticmethod
+    async def add(session: AsyncSession, rows: Iterable[dict]):
+        """Прибавить итоги листов (словари KEY_COLUMNS + SUM_COLUMNS) к дневным строкам.
+        Вызывается внутри транзакции сохранения книги"""
+        totals = defaultdict(lambda: dict.fromkeys(SUM_COLUMNS, 0))
+        for row in rows:
+            target = totals[tuple(row[column] for column in KEY_COLUMNS)]
+            for column in SUM_COLUMNS:
+                target[column] += row[column]
+        if not totals:
+            return
+
+        stmt = pg_insert(DailyRollups)
+        # Одновременные сохранения за тот же день складываются на стороне БД
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(DailyRollups, column) for column in KEY_COLUMNS],
+            set_={column: getattr(DailyRollups, column) + stmt.excluded[column] for column in SUM_COLUMNS}
+        )
+        await session.execute(stmt, [dict(zip(KEY_COLUMNS, key), **sums) for key, sums in totals.items()])
+
+    @staticmethod
+    async def rebuild(session: AsyncSession, date_from: Optional[date] = None,
+                      date_to: Optional[date] = None) -> int:
+        """Пересчитать дневные итоги за [date_from, date_to) по agent_sessions и transactions;
+        возвращает число строк. Выполняется одной транзакцией"""
+        conditions = [AgentSessions.session_start.is_not(None)]
+        rollup_conditions = []
+        if date_from is not None:
+            conditions.append(AgentSessions.session_start >= datetime.combine(date_from, time.min))
+            rollup_conditions.append(DailyRollups.day >= date_from)
+        if date_to is not None:
+            conditions.append(AgentSessions.session_start < datetime.combine(date_to, time.min))
+            rollup_conditions.append(DailyRollups.day < date_to)
+
+        transactions = (
+            select(
+                Transactions.agent_session_id,
+                func.sum(Transactions.commission).label("commissions"),
+                func.count().filter(Transactions.transaction_type == "inflow").label("inflow_count"),
+                func.count().filter(Transactions.transaction_type == "outflow").label("outflow_count"),
+                func.count().filter(Transactions.transaction_type == "baibit").label("baibit_count"),
+            )
+            .join(AgentSessions, AgentSessions.id == Transactions.agent_session_id)
+            .where(*conditions)
+            .group_by(Transactions.agent_session_id)
+            .subquery()
+        )
+        day = cast(AgentSessions.session_start, Date)
+        turnover = func.coalesce(func.sum(AgentSessions.turnover), 0)
+        source = (
+            select(
+                AgentSessions.operator_id, day, AgentSessions.agent_id,
+                func.count(), turnover, func.coalesce(func.sum(AgentSessions.agent_payment), 0),
+                # Без явного типа доля приводится к Numeric(18, 2) оборота и округляется до 0.01
+                turnover * literal(Decimal(str(OPERATOR_SHARE)), Numeric()),
+                func.coalesce(func.sum(transactions.c.commissions), 0),
+                func.coalesce(func.sum(transactions.c.inflow_count), 0),
+                func.coalesce(func.sum(transactions.c.outflow_count), 0),
+                func.coalesce(func.sum(transactions.c.baibit_count), 0),
+            )
+            .outerjoin(transactions, transactions.c.agent_session_id == AgentSessions.id)
+            .where(*conditions)
+            .group_by(AgentSessions.operator_id, day, AgentSessions.agent_id)
+        )
+
+        async with session.begin():
+            # Сохранения книг ждут пересчета: иначе их прибавка к итогам потерялась бы при удалении
+            # или была бы учтена дважды
+            await session.execute(text(f"LOCK TABLE {DailyRollups.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+            await session.execute(delete(DailyRollups).where(*rollup_conditions))
+            result = await session.execute(insert(DailyRollups).from_select(KEY_COLUMNS + SUM_COLUMNS, source))
+        return result.rowcount
+
+    @staticmethod
+    def operator_period_query(operator_username: str, date_from: date, date_to: date) -> Select:
+        # Первичный ключ daily_rollups: диапазон (operator_id, day)
+        return (
+            select(Agents.full_name, *(func.sum(getattr(DailyRollups, column)).label(column)
+                                       for column in SUM_COLUMNS))
+            .join(Operators, Operators.id == DailyRollups.operator_id)
+            .join(Agents, Agents.id == DailyRollups.agent_id)
+            .where(Operators.username == operator_username,
+                   DailyRollups.day >= date_from,
+                   DailyRollups.day < date_to)
+            .group_by(Agents.id, Agents.full_name)
+            .order_by(func.sum(DailyRollups.turnover).desc())
+        )
+
+    @staticmethod
+    def agent_period_query(agent_id: int, date_from: date, date_to: date) -> Select:
+        # ix_daily_rollups_agent_id_day
+        return (
+            select(*(func.sum(getattr(DailyRollups, column)).label(column) for column in SUM_COLUMNS))
+            .where(DailyRollups.agent_id == agent_id,
+                   DailyRollups.day >= date_from,
+                   DailyRollups.day < date_to)
+        )
+
+    @staticmethod
+    async def operator_summary(session: AsyncSession, operator_username: str,
+                               date_from: date, date_to: date) -> dict:
+        """Итоги оператора за период и агенты по убыванию оборота"""
+        rows = (await session.execute(
+            RollupStore.operator_period_query(operator_username, date_from, date_to)
+        )).all()
+        return {
+            **{column: sum(getattr(row, column) for row in rows) for column in SUM_COLUMNS},
+            "agents": [row._asdict() for row in rows]
+        }
+
+    @staticmethod
+    async def agent_summary(session: AsyncSession, agent_id: int, date_from: date, date_to: date) -> dict:
+        row = (await session.execute(RollupStore.agent_period_query(agent_id, date_from, date_to))).one()
+        return {column: getattr(row, column) or 0 for column in SUM_COLUMNS}
+
+
+async def run_rebuild(date_from: Optional[date], date_to: Optional[date]) -> int:
+    from database import Database
+    db = Database()
+    try:
+        async with db.session() as session:
+            return await RollupStore.rebuild(session, date_from, date_to)
+    finally:
+        await db.dispose()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Дневные итоги операторов по агентам")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="пересчитать итоги по agent_sessions и transactions")
+    rebuild.add_argument("--from", dest="date_from", type=date.fromisoformat, help="первый день, ГГГГ-ММ-ДД")
+    rebuild.add_argument("--to", dest="date_to", type=date.fromisoformat, help="день после последнего")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    rows = asyncio.run(run_rebuild(args.date_from, args.date_to))
+    logger.info(f"Daily rollups rebuilt: {rows} rows")
+    print(json.dumps({"rows": rows}))
+
+
+if __name__ == "__main__":
+    main()
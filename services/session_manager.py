@@ -1,47 +1,232 @@
+import asyncio
+import fcntl
+import heapq
 import json
+import logging
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
-from config import STORAGE_DIR, OPERATOR_PERCENT
+from typing import AsyncIterator, Optional
+from config import STORAGE_DIR, OPERATOR_PERCENT, SESSION_SNAPSHOT_EVERY, TOP_AGENTS_K
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_operator_locks = defaultdict(asyncio.Lock)
+# Сессии операторов в памяти процесса и отметка их файлов после последнего использования
+_managers: dict[int, tuple[tuple, "SessionManager"]] = {}
+
 
 class SessionManager:
-    def __init__(self, operator_id: int):
+    """Сессия оператора: журнал событий с fsync на каждую запись и периодический снимок.
+    Методы, пишущие на диск (add_agent, finish), обработчики вызывают через asyncio.to_thread
+    внутри open_session.
+
+    operator_<id>.json — снимок состояния с номером последнего учтенного события (seq),
+    operator_<id>.journal — события после снимка, по одному JSON на строку.
+    """
+
+    def __init__(self, operator_id: int, snapshot_every: int = SESSION_SNAPSHOT_EVERY, top_k: int = TOP_AGENTS_K):
         self.operator_id = operator_id
         self.session_file = STORAGE_DIR / f"operator_{operator_id}.json"
+        self.journal_file = STORAGE_DIR / f"operator_{operator_id}.journal"
+        self.snapshot_every = snapshot_every
         self.data = {
             "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "agents": [],
             "total_turnover": 0.0,
-            "operator_payment": 0.0
+            "operator_payment": 0.0,
+            "seq": 0
         }
+        self.top_k = top_k
+        # Лидеры по обороту: min-куча из top_k элементов (turnover, порядковый номер, агент)
+        self._top = []
+        self._by_percent = {}
+        self._by_bank = {}
+        self._journal = None
+        self._journal_events = 0
+        self.finished = False
         self._load()
 
-    def add_agent(self, agent_name: str, turnover: float, agent_percent: float):
-        self.data["agents"].append({
+    @metrics.timed("session")
+    def add_agent(self, agent_name: str, turnover: float, agent_percent: float, bank: str = None):
+        agent = {
             "name": agent_name,
             "turnover": turnover,
-            "percent": agent_percent
-        })
-        self._update_totals()
-        self._save()
+            "percent": agent_percent,
+            "bank": bank
+        }
+        self.data["seq"] += 1
+        self._append({"seq": self.data["seq"], "event": "agent", "agent": agent})
+        self._apply_agent(agent)
+
+        if self._journal_events >= self.snapshot_every:
+            self._save()
 
-    def _update_totals(self):
-        self.data["total_turnover"] = sum(a["turnover"] for a in self.data["agents"])
+    def _apply_agent(self, agent: dict):
+        self.data["agents"].append(agent)
+        self._update_totals(agent)
+
+    def _update_totals(self, agent: dict):
+        """Итоги, лидеры и разбивки обновляются на одного агента, без пересчета всей сессии"""
+        turnover = agent["turnover"]
+        self.data["total_turnover"] += turnover
         self.data["operator_payment"] = self.data["total_turnover"] * OPERATOR_PERCENT / 100
 
+        entry = (turnover, len(self.data["agents"]), agent)
+        if len(self._top) < self.top_k:
+            heapq.heappush(self._top, entry)
+        elif turnover > self._top[0][0]:
+            heapq.heapreplace(self._top, entry)
+
+        for breakdown, key in ((self._by_percent, agent["percent"]), (self._by_bank, agent.get("bank"))):
+            group = breakdown.setdefault(key, {"agents_count": 0, "turnover": 0.0})
+            group["agents_count"] += 1
+            group["turnover"] += turnover
+
+    def _rebuild_totals(self):
+        agents = self.data["agents"]
+        self.data["agents"] = []
+        self.data["total_turnover"] = 0.0
+        self._top, self._by_percent, self._by_bank = [], {}, {}
+        for agent in agents:
+            self._apply_agent(agent)
+
     def get_summary(self):
         return {
             "start_time": self.data["start_time"],
             "total_turnover": self.data["total_turnover"],
             "operator_payment": self.data["operator_payment"],
             "agents_count": len(self.data["agents"]),
-            "agents": sorted(self.data["agents"], key=lambda x: x["turnover"], reverse=True)
+            "top_agents": [agent for _, _, agent in sorted(self._top, key=lambda e: (-e[0], e[1]))],
+            "by_percent": self._by_percent,
+            "by_bank": self._by_bank
         }
 
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def finish(self):
+        """Завершение сессии: снимок и журнал удаляются, следующий /start начнет новую"""
+        self.close()
+        self.session_file.unlink(missing_ok=True)
+        self.journal_file.unlink(missing_ok=True)
+        self.finished = True
+
+    def stamp(self) -> tuple:
+        """Отметка снимка и журнала: по ней видно, что сессию меняла другая копия бота"""
+        return self._file_stamp(self.session_file), self._file_stamp(self.journal_file)
+
+    @staticmethod
+    def _file_stamp(path: Path) -> Optional[tuple]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
     def _load(self):
         if self.session_file.exists():
             with open(self.session_file, 'r') as f:
                 self.data = json.load(f)
+            self.data.setdefault("seq", 0)
+            self._rebuild_totals()
+
+        if not self.journal_file.exists():
+            if not self.session_file.exists():
+                # Новая сессия: время начала фиксируется первой записью журнала
+                self._append({"seq": 0, "event": "start", "start_time": self.data["start_time"]})
+            return
+
+        valid_size = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная запись после сбоя: все, что дальше, отбрасывается
+                    logger.warning(f"Truncated journal record in {self.journal_file}, discarding tail")
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+                self._journal_events += 1
+                self._replay(record)
+
+        if valid_size < self.journal_file.stat().st_size:
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(valid_size)
+
+    def _replay(self, record: dict):
+        if record["event"] == "start":
+            self.data["start_time"] = record["start_time"]
+        elif record["seq"] > self.data["seq"]:
+            # События со seq не больше снимка уже в нем учтены (сбой до очистки журнала)
+            self.data["seq"] = record["seq"]
+            self._apply_agent(record["agent"])
+
+    def _append(self, record: dict):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'ab')
+        self._journal.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_events += 1
 
     def _save(self):
-        with open(self.session_file, 'w') as f:
-            json.dump(self.data, f, indent=2)
\ No newline at end of file
+        """Снимок через временный файл и атомарное переименование, затем очистка журнала"""
+        tmp_file = self.session_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.session_file)
+        self._fsync_dir(self.session_file.parent)
+
+        self.close()
+        with open(self.journal_file, 'wb') as f:
+            os.fsync(f.fileno())
+        self._journal_events = 0
+
+    @staticmethod
+    def _fsync_dir(path: Path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _session_manager(operator_id: int) -> SessionManager:
+    """Сессия из памяти процесса; с диска загружается заново, только если ее файлы изменились.
+    Читает и может обрезать журнал: вызывается в потоке"""
+    cached = _managers.get(operator_id)
+    if cached is not None and cached[1].stamp() == cached[0]:
+        return cached[1]
+    return SessionManager(operator_id)
+
+
+@asynccontextmanager
+async def open_session(operator_id: int) -> AsyncIterator[SessionManager]:
+    """Сессия оператора на время изменения или чтения. Журнал пишет один владелец:
+    параллельные апдейты оператора ждут asyncio-блокировку, другие копии бота — flock.
+    Блокировка держится только внутри блока, поэтому отправку сообщений в нем не ждут"""
+    async with _operator_locks[operator_id]:
+        with open(STORAGE_DIR / f"operator_{operator_id}.lock", 'a') as lock_file:
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            manager = await asyncio.to_thread(_session_manager, operator_id)
+            completed = False
+            try:
+                yield manager
+                completed = True
+            finally:
+                manager.close()
+                if completed and not manager.finished:
+                    _managers[operator_id] = (await asyncio.to_thread(manager.stamp), manager)
+                else:
+                    # После сбоя состояние в памяти могло разойтись с журналом: следующий вход читает диск
+                    _managers.pop(operator_id, None)
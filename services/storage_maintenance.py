@@ -0,0 +1,347 @@
+"""Обслуживание storage/: сжатие старых файлов, квоты с LRU-вытеснением, индекс отчетов.
+
+Запуск вручную: python -m services.storage_maintenance [--dry-run]
+"""
+import argparse
+import asyncio
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+from config import (
+    ensure_storage_dirs, USER_FILES_DIR, REPORTS_DIR, STORAGE_COMPRESS_AFTER_DAYS, STORAGE_USER_QUOTA_BYTES,
+    STORAGE_GLOBAL_QUOTA_BYTES, STORAGE_EVICT_GRACE, STORAGE_MAINTENANCE_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".manifest.jsonl"
+LOCK_NAME = ".manifest.lock"
+# Текстовые отчеты хорошо сжимаются; .xlsx уже zip-архив, его не трогаем
+COMPRESSIBLE_SUFFIXES = {".txt", ".csv"}
+COMPRESSED_SUFFIX = ".gz"
+# Недокачанные загрузки (FileManager.save_user_file) старше суток считаются брошенными
+STALE_PART_AGE = 24 * 3600
+_READ_BLOCK = 64 * 1024
+
+
+class ReportManifest:
+    """Индекс отчетов пользователя: по строке JSON на файл в порядке создания.
+
+    Новые отчеты дописываются в конец, поэтому страница последних отчетов читается
+    с хвоста файла без обхода и stat всего каталога.
+    """
+
+    def __init__(self, reports_dir: Path):
+        self.reports_dir = reports_dir
+        self.path = reports_dir / MANIFEST_NAME
+
+    @contextmanager
+    def lock(self):
+        """Межпроцессная блокировка: бот и CLI могут работать одновременно"""
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.reports_dir / LOCK_NAME, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, report_path: Path):
+        stat = report_path.stat()
+        record = json.dumps({"name": report_path.name, "size": stat.st_size, "mtime": stat.st_mtime},
+                            ensure_ascii=False)
+        with self.lock():
+            if not self.path.exists():
+                self._rebuild()
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(record + "\n")
+
+    def page(self, offset: int = 0, limit: int = 20) -> list[Path]:
+        """Отчеты от новых к старым, начиная с offset"""
+        if not self.path.exists():
+            if not self.reports_dir.exists():
+                return []
+            with self.lock():
+                if not self.path.exists():
+                    self._rebuild()
+
+        result, seen = [], set()
+        for record in self._iter_reversed():
+            if record["name"] in seen:
+                continue
+            seen.add(record["name"])
+            if offset:
+                offset -= 1
+                continue
+            result.append(self.reports_dir / record["name"])
+            if len(result) >= limit:
+                break
+        return result
+
+    def records(self) -> list[dict]:
+        """Все записи без повторов, от старых к новым"""
+        if not self.path.exists():
+            return []
+        latest = {}
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                latest.pop(record["name"], None)
+                latest[record["name"]] = record
+        return list(latest.values())
+
+    def rewrite(self, records: list[dict]):
+        """Атомарная замена индекса; вызывается под lock()"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _rebuild(self):
+        """Индекс по содержимому каталога (каталоги, созданные до появления индекса)"""
+        records = []
+        for entry in os.scandir(self.reports_dir):
+            if entry.is_file() and entry.name.startswith("report_"):
+                stat = entry.stat()
+                records.append({"name": entry.name, "size": stat.st_size, "mtime": stat.st_mtime})
+        records.sort(key=lambda r: r["mtime"])
+        self.rewrite(records)
+
+    def _iter_reversed(self) -> Iterator[dict]:
+        """Записи с конца файла, блоками, без чтения файла целиком"""
+        with open(self.path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            tail = b""
+            while position > 0:
+                size = min(_READ_BLOCK, position)
+                position -= size
+                f.seek(position)
+                lines = (f.read(size) + tail).split(b"\n")
+                tail = lines.pop(0)
+                for line in reversed(lines):
+                    if line:
+                        yield from self._decode(line)
+            if tail:
+                yield from self._decode(tail)
+
+    @staticmethod
+    def _decode(line: bytes) -> Iterator[dict]:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Оборванная запись после сбоя
+            pass
+
+
+@dataclass
+class MaintenanceStats:
+    compressed: int = 0
+    bytes_saved: int = 0
+    evicted: int = 0
+    bytes_evicted: int = 0
+    stale_removed: int = 0
+    errors: list = field(default_factory=list)
+
+
+@dataclass
+class _StoredFile:
+    path: Path
+    size: int
+    mtime: float
+
+
+class StorageMaintainer:
+    """Проход обслуживания по USER_FILES_DIR и REPORTS_DIR.
+
+    1. Отчеты старше compress_after_days сжимаются gzip (mtime сохраняется).
+    2. Файлы пользователя сверх user_quota вытесняются от давно не использованных (mtime).
+    3. То же для всего хранилища сверх global_quota.
+    Файлы моложе grace секунд не трогаются: они могут быть в обработке.
+    """
+
+    def __init__(self, user_files_dir: Path = USER_FILES_DIR, reports_dir: Path = REPORTS_DIR,
+                 compress_after_days: float = STORAGE_COMPRESS_AFTER_DAYS,
+                 user_quota: int = STORAGE_USER_QUOTA_BYTES, global_quota: int = STORAGE_GLOBAL_QUOTA_BYTES,
+                 grace: float = STORAGE_EVICT_GRACE, dry_run: bool = False):
+        self.user_files_dir = user_files_dir
+        self.reports_dir = reports_dir
+        self.compress_after = compress_after_days * 86400
+        self.user_quota = user_quota
+        self.global_quota = global_quota
+        self.grace = grace
+        self.dry_run = dry_run
+
+    async def run_periodically(self, interval: float = STORAGE_MAINTENANCE_INTERVAL):
+        """Фоновая задача бота: проход раз в interval секунд в отдельном потоке"""
+        while True:
+            try:
+                stats = await asyncio.to_thread(self.run_once)
+                logger.info(f"Storage maintenance: {stats}")
+            except Exception as e:
+                logger.error(f"Storage maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    def run_once(self) -> MaintenanceStats:
+        stats = MaintenanceStats()
+        now = time.time()
+        users = self._user_ids()
+
+        for user_id in users:
+            self._compress_reports(user_id, now, stats)
+
+        remaining = []
+        for user_id in users:
+            files = self._user_files(user_id, now, stats)
+            remaining.extend(self._evict(files, self.user_quota, now, stats))
+
+        self._evict(remaining, self.global_quota, now, stats)
+
+        if not self.dry_run:
+            for user_id in users:
+                self._sync_manifest(user_id)
+        return stats
+
+    def _user_ids(self) -> list[str]:
+        ids = set()
+        for root in (self.user_files_dir, self.reports_dir):
+            if root.exists():
+                ids.update(entry.name for entry in os.scandir(root) if entry.is_dir())
+        return sorted(ids)
+
+    def _user_files(self, user_id: str, now: float, stats: MaintenanceStats) -> list[_StoredFile]:
+        files = []
+        for root in (self.user_files_dir, self.reports_dir):
+            user_dir = root / user_id
+            if not user_dir.exists():
+                continue
+            for entry in os.scandir(user_dir):
+                if not entry.is_file() or entry.name in (MANIFEST_NAME, LOCK_NAME):
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith(".part"):
+                    if now - stat.st_mtime > STALE_PART_AGE:
+                        self._remove(Path(entry.path), stat.st_size, stats, stale=True)
+                    continue
+                files.append(_StoredFile(Path(entry.path), stat.st_size, stat.st_mtime))
+        return files
+
+    def _evict(self, files: list[_StoredFile], quota: int, now: float, stats: MaintenanceStats) -> list[_StoredFile]:
+        """Удалить самые давние файлы, пока сумма не уложится в quota; вернуть оставшиеся"""
+        total = sum(f.size for f in files)
+        files = sorted(files, key=lambda f: f.mtime)
+        kept = []
+        for f in files:
+            if total > quota and now - f.mtime > self.grace:
+                self._remove(f.path, f.size, stats)
+                total -= f.size
+            else:
+                kept.append(f)
+        return kept
+
+    def _remove(self, path: Path, size: int, stats: MaintenanceStats, stale: bool = False):
+        if not self.dry_run:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                stats.errors.append(f"{path}: {e}")
+                return
+        if stale:
+            stats.stale_removed += 1
+        else:
+            stats.evicted += 1
+            stats.bytes_evicted += size
+
+    def _compress_reports(self, user_id: str, now: float, stats: MaintenanceStats):
+        user_dir = self.reports_dir / user_id
+        if not user_dir.exists():
+            return
+        for entry in os.scandir(user_dir):
+            path = Path(entry.path)
+            if not entry.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime < self.compress_after:
+                continue
+            if self.dry_run:
+                stats.compressed += 1
+                continue
+            try:
+                saved = self._gzip(path, stat)
+            except OSError as e:
+                stats.errors.append(f"{path}: {e}")
+                continue
+            stats.compressed += 1
+            stats.bytes_saved += saved
+
+    @staticmethod
+    def _gzip(path: Path, stat: os.stat_result) -> int:
+        target = path.with_name(path.name + COMPRESSED_SUFFIX)
+        tmp_path = path.with_name(path.name + ".gz.tmp")
+        try:
+            with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            # Сжатие не должно делать файл "свежим" для LRU
+            os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+            os.replace(tmp_path, target)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        path.unlink()
+        return stat.st_size - target.stat().st_size
+
+    def _sync_manifest(self, user_id: str):
+        """Привести индекс в соответствие с диском после сжатия и вытеснения"""
+        user_dir = self.reports_dir / user_id
+        if not user_dir.exists():
+            return
+        manifest = ReportManifest(user_dir)
+        with manifest.lock():
+            if not manifest.path.exists():
+                manifest._rebuild()
+                return
+            records = []
+            for record in manifest.records():
+                path = user_dir / record["name"]
+                if not path.exists():
+                    path = path.with_name(record["name"] + COMPRESSED_SUFFIX)
+                    if not path.exists():
+                        continue
+                stat = path.stat()
+                records.append({"name": path.name, "size": stat.st_size, "mtime": stat.st_mtime})
+            manifest.rewrite(records)
+
+
+def open_report(path: Path) -> bytes:
+    """Содержимое отчета, в том числе уже сжатого"""
+    if path.suffix == COMPRESSED_SUFFIX:
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    return path.read_bytes()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Обслуживание storage/: сжатие, квоты, индексы отчетов")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не менять")
+    args = parser.parse_args(argv)
+
+    ensure_storage_dirs()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    stats = StorageMaintainer(dry_run=args.dry_run).run_once()
+    print(json.dumps(stats.__dict__, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Прием апдейтов через webhook на aiohttp.
+
+    POST WEBHOOK_PATH — апдейт от Telegram (проверяется секретный токен, тело не из JSON-объекта — 400).
+    Ответ 200 уходит сразу, обработка идет в фоне; одновременно обрабатывается не больше max_concurrency
+    апдейтов, следующие запросы ждут свободного места (Telegram повторит доставку при таймауте).
+    GET /healthz — процесс жив, GET /readyz — принимает апдейты (503 во время остановки).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+                 drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, **data):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.drain_timeout = drain_timeout
+        self.data = data
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self._accepting = False
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.on_startup.append(self._on_startup)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/readyz", self.handle_ready)
+        return app
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        self._runner = web.AppRunner(self.build_app(), handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def stop(self):
+        """Плавная остановка: новые апдейты отклоняются, начатые дорабатываются
+        не дольше drain_timeout, затем сервер закрывается"""
+        self._accepting = False
+        if self._tasks:
+            logger.info(f"Draining {len(self._tasks)} webhook updates")
+            done, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} updates after drain timeout")
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _on_startup(self, app: web.Application):
+        self._accepting = True
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401, text="Unauthorized")
+        if not self._accepting:
+            # Telegram повторит доставку, апдейт достанется другой копии или этой после перезапуска
+            return web.Response(status=503, text="Shutting down")
+
+        # Тело читается уже в слоте: ожидающие запросы не держат разобранные апдейты в памяти
+        await self._slots.acquire()
+        task = None
+        try:
+            try:
+                update = await request.json()
+            except ValueError:
+                update = None
+            if not isinstance(update, dict):
+                return web.Response(status=400, text="Bad update")
+            if not self._accepting:
+                return web.Response(status=503, text="Shutting down")
+            task = asyncio.create_task(self._feed(update))
+        finally:
+            # Слот принятого апдейта освобождает _feed; здесь — отклоненного или оборванного клиентом
+            if task is None:
+                self._slots.release()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        if not self._accepting:
+            return web.json_response({"status": "draining"}, status=503)
+        return web.json_response({"status": "ready", "in_flight": len(self._tasks)})
+
+    async def _feed(self, update: dict):
+        try:
+            await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+        except Exception as e:
+            logger.error(f"Error handling webhook update: {e}", exc_info=True)
+        finally:
+            self._slots.release()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    """Запуск в режиме webhook до SIGINT/SIGTERM"""
+    if not WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+    server = WebhookServer(dispatcher, bot)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await dispatcher.emit_startup(bot=bot)
+    await server.start()
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+                max_connections=WEBHOOK_MAX_CONCURRENCY
+            )
+        await stop_event.wait()
+        logger.info("Stopping webhook server")
+    finally:
+        # Webhook в Telegram не снимается: апдейты копятся и дойдут до следующей копии
+        await server.stop()
+        await dispatcher.emit_shutdown(bot=bot)
+        await bot.session.close()
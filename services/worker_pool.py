@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from config import WORKER_PROCESSES, WORKER_MAX_QUEUE, WORKER_JOB_TIMEOUT
+from services.excel_processor import ExcelProcessor
+from services.parse_cache import ParseCache
+from services.report_generator import ReportGenerator
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusyError(Exception):
+    """Очередь пула заполнена"""
+
+
+def parse_workbook(file_path: Path, agent_percent: float, sheet_names: Optional[list] = None) -> list:
+    """Разбор книги (или части ее листов); выполняется в процессе пула"""
+    results = []
+    for sheet_name, sheet_data in ExcelProcessor.iter_workbook(file_path, agent_percent, sheet_names):
+        sheet_data.sheet_name = sheet_name
+        results.append((sheet_name, sheet_data))
+    return results
+
+
+def load_cached(cache_path: Path, agent_percent: float) -> list:
+    """Закэшированный разбор: пересчитываются только поля, зависящие от процента"""
+    results = []
+    for sheet_name, sheet_data in ParseCache.load(cache_path):
+        sheet_data.sheet_name = sheet_name
+        sheet_data.agent_percent = agent_percent
+        # В кэш лист попадает уже с отметками повторов прошлой проверки
+        sheet_data.clear_duplicates()
+        sheet_data.calculate_payments()
+        results.append((sheet_name, sheet_data))
+    return results
+
+
+def render_report(sheet_data) -> list[str]:
+    """Строки отчета по листу; выполняется в процессе пула, в event loop остаются нарезка и отправка"""
+    return list(ReportGenerator.iter_lines(sheet_data))
+
+
+def warm_up() -> int:
+    """Пустая задача прогрева: запускает процесс пула и загружает в нем openpyxl"""
+    import openpyxl  # noqa: F401
+    return os.getpid()
+
+
+def split_sheets(sheet_names: list, parts: int) -> list:
+    """Разбиение листов на непрерывные группы: каждый процесс читает общие строки книги один раз"""
+    size, extra = divmod(len(sheet_names), parts)
+    chunks, start = [], 0
+    for i in range(min(parts, len(sheet_names))):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(sheet_names[start:end])
+        start = end
+    return chunks
+
+
+class WorkerPool:
+    def __init__(self, workers: int = WORKER_PROCESSES, max_queue: int = WORKER_MAX_QUEUE,
+                 job_timeout: float = WORKER_JOB_TIMEOUT):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.job_timeout = job_timeout
+        self._executor = None
+        self._pending = 0
+
+    def start(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют сокеты и состояние event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Worker pool started: {self.workers} processes, queue {self.max_queue}")
+
+    async def run(self, func, *args):
+        """Выполнить func(*args) в пуле, не блокируя event loop"""
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not started")
+
+        if self._pending >= self.workers + self.max_queue:
+            raise PoolBusyError(f"{self._pending} jobs in flight")
+
+        future, = self._submit(func, [args])
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Worker job {getattr(func, '__name__', func)} timed out after {self.job_timeout}s")
+            raise
+        finally:
+            future.cancel()
+
+    async def imap(self, func, args_list: list) -> AsyncIterator:
+        """Выполнить func для каждого набора аргументов параллельно; результаты отдаются
+        в порядке аргументов, каждый — как только готов он и все предыдущие"""
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not started")
+
+        # Веер задач одного файла занимает в очереди одно место
+        if self._pending >= self.workers + self.max_queue:
+            raise PoolBusyError(f"{self._pending} jobs in flight")
+
+        loop = asyncio.get_running_loop()
+        futures = self._submit(func, args_list)
+        deadline = loop.time() + self.job_timeout
+        try:
+            for future in futures:
+                yield await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                             timeout=max(0.0, deadline - loop.time()))
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _submit(self, func, args_list: list) -> list[Future]:
+        """Задачи в процессы пула; вместе они занимают одно место в очереди, пока не завершится
+        последняя. Таймаут или отмена снимают только ожидание и еще не начатые задачи: начатую
+        процесс доведет до конца, и до тех пор она учитывается, чтобы зависший разбор
+        не пропускал за собой новые файлы сверх лимита очереди"""
+        loop = asyncio.get_running_loop()
+        futures = [self._executor.submit(func, *args) for args in args_list]
+        self._pending += 1
+        remaining = len(futures)
+
+        def finished():
+            nonlocal remaining
+            remaining -= 1
+            if not remaining:
+                self._pending -= 1
+
+        def done(_):
+            # Вызывается в потоке исполнителя
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(finished)
+
+        for future in futures:
+            future.add_done_callback(done)
+        return futures
+
+    async def warm_up(self):
+        """Запустить все процессы пула заранее (spawn стартует их по требованию),
+        чтобы первый файл не ждал запуска интерпретатора и импорта openpyxl"""
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not started")
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, warm_up) for _ in range(self.workers)))
+        logger.info(f"Worker pool warmed up: {len(set(pids))} processes")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logger.info("Worker pool stopped")
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("aiogram")
+openpyxl = pytest.importorskip("openpyxl")
+
+from services import bot_handler, file_manager  # noqa: E402
+from services.bot_handler import BotHandler  # noqa: E402
+from services.dedup import DedupIndex  # noqa: E402
+from services.jobs import FileJob  # noqa: E402
+from services.parse_cache import ParseCache  # noqa: E402
+from services.worker_pool import WorkerPool  # noqa: E402
+
+OPERATOR_ID = 42
+
+
+class FakeBot:
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=file_id)
+
+
+class FakeOutbound:
+    def __init__(self):
+        self.documents = []
+
+    async def answer_document(self, message, document, **kwargs):
+        self.documents.append(kwargs["caption"])
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def make_handler(tmp_path, monkeypatch, content: bytes) -> tuple:
+    """Обработчик с пулом, кэшем и индексом повторов в tmp_path; запись в сессию и БД подменена"""
+    monkeypatch.setattr(file_manager, "USER_FILES_DIR", tmp_path / "user_files")
+    monkeypatch.setattr(file_manager, "REPORTS_DIR", tmp_path / "reports")
+    monkeypatch.setattr(bot_handler, "REPORT_OUTPUT_MODE", "xlsx")
+
+    async def download(bot, file_path):
+        yield content
+
+    monkeypatch.setattr(bot_handler.FileManager, "iter_telegram_file", staticmethod(download))
+
+    handler = BotHandler.__new__(BotHandler)
+    handler.bot, handler.outbound, handler.main_keyboard = FakeBot(), FakeOutbound(), None
+    handler.session_factory = FakeSession
+    handler.pool = WorkerPool(workers=1)
+    handler.parse_cache = ParseCache(tmp_path / "cache")
+    handler.parse_cache.cache_dir.mkdir()
+    (tmp_path / "dedup").mkdir()
+    handler.dedup = DedupIndex(tmp_path / "dedup")
+
+    agents, persisted = [], []
+
+    async def record_agent(operator_id, sheet_name, sheet_data):
+        agents.append((sheet_name, sheet_data.turnover))
+
+    async def persist(session, operator_id, sheets_data):
+        persisted.append([sheet_name for sheet_name, _ in sheets_data])
+
+    handler._record_agent, handler._persist_workbook = record_agent, persist
+    return handler, agents, persisted
+
+
+def test_repeated_upload_not_counted_twice(tmp_path, monkeypatch):
+    wb = openpyxl.Workbook()
+    wb.active.title = "Agent"
+    wb.active["A2"], wb.active["B2"] = 1000, "D1"
+    wb.active["A3"], wb.active["B3"] = 500, "D2"
+    wb.save(tmp_path / "book.xlsx")
+    handler, agents, persisted = make_handler(tmp_path, monkeypatch, (tmp_path / "book.xlsx").read_bytes())
+
+    def process(percent: float) -> FileJob:
+        message = SimpleNamespace(document=SimpleNamespace(file_id="book"), chat=SimpleNamespace(id=1))
+        job = FileJob(OPERATOR_ID, message, percent)
+        asyncio.run(handler._process_file(job))
+        return job
+
+    handler.pool.start()
+    try:
+        first = process(3)
+        # Та же книга еще раз (например, с другим процентом): отчет есть, итоги не удваиваются
+        second = process(5)
+    finally:
+        handler.pool.shutdown()
+
+    assert (first.recorded, second.recorded) == (False, True)
+    assert agents == [("Agent", 1500)]
+    assert persisted == [["Agent"]]
+    assert len(handler.outbound.documents) == 2
+    # В отчете повтора транзакции не помечены как уже учтенные
+    assert all("Общий оборот: 1 500" in caption for caption in handler.outbound.documents)
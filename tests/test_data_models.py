@@ -0,0 +1,75 @@
+from datetime import datetime, time
+import pytest
+from services.data_models import BaibitColumns, TransactionColumns, _number
+from services.excel_processor import ROW_WIDTH, ExcelProcessor
+from services.report_generator import ReportGenerator
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1000, 1000),
+    (92.5, 92.5),
+    ("1000", 1000),
+    ("92,5", 92.5),
+    ("92.5", 92.5),
+    ("500 р", 500),
+    ("1 000,50", 1000.5),
+    ("1 000", 1000),
+    ("1,000.50", 1000.5),
+    ("1.000,50", 1000.5),
+    ("1.000.000", 1000000),
+    ("0,125", 0.125),
+    ("-15", -15),
+    ("100 руб.", 100),
+])
+def test_number_from_text(value, expected):
+    result = _number(value)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+@pytest.mark.parametrize("value", [
+    "нет", "", "12abc", "1.000", "1,000", "1,2,3", "1.000,50,1", True, datetime(2025, 3, 1), time(18, 0),
+])
+def test_number_rejects_ambiguous_cells(value):
+    with pytest.raises(ValueError):
+        _number(value)
+
+
+def test_columns_keep_text_cells():
+    inflows = TransactionColumns()
+    inflows.add("500 р", "A1", "10")
+    assert (inflows[0].amount, inflows[0].commission) == (500, 10)
+
+    baibit = BaibitColumns()
+    baibit.add(100, "92,5")
+    assert baibit[0].rate == 92.5
+    assert baibit.weighted_average_rate() == 92.5
+
+
+def row(*cells) -> tuple:
+    return cells + (None,) * (ROW_WIDTH - len(cells))
+
+
+def test_parse_rows_with_text_numbers():
+    data = ExcelProcessor.parse_rows([
+        row("500 р", "IN1", "300", "OUT1", "5,5", 100, "92,5"),
+        row(1000, "IN2"),
+    ], agent_percent=3)
+    assert data.turnover == 1500
+    assert data.agent_payment == 45
+    assert data.outflows[0].commission == 5.5
+    assert data.baibit[0].rate == 92.5
+
+
+def test_parse_rows_skips_non_numeric_amounts():
+    data = ExcelProcessor.parse_rows([
+        row(1000, "IN1", "300", "OUT1", "пять"),
+        row(datetime(2025, 3, 1), "IN2", None, None, None, "1.000", 92.5),
+        row("1.000,50", "IN3"),
+    ], agent_percent=3)
+    assert data.turnover == 2000.5
+    assert [t.transaction_id for t in data.inflows] == ["IN1", "IN3"]
+    assert (len(data.outflows), len(data.baibit)) == (0, 0)
+    assert data.bad_cells == [("E2", "пять"), ("A3", "2025-03-01 00:00:00"), ("F3", "1.000")]
+    data.sheet_name = "Agent"
+    assert "A3: 2025-03-01 00:00:00" in ReportGenerator.generate(data)
@@ -0,0 +1,123 @@
+import asyncio
+from pathlib import Path
+import pytest
+from services.data_models import ExcelSheetData
+from services.dedup import INFLOW, BloomFilter, DedupIndex, _false_positive_rate, plan
+
+OPERATOR_ID = 1
+
+
+def sheet(*ids: str, amount: int = 100) -> ExcelSheetData:
+    data = ExcelSheetData(*(None,) * 9, agent_percent=3)
+    for transaction_id in ids:
+        data.inflows.add(amount, transaction_id)
+    data.turnover = data.inflows.total_amount()
+    data.calculate_payments()
+    return data
+
+
+def check(index: DedupIndex, batch, data: ExcelSheetData) -> int:
+    return asyncio.run(index.mark_duplicates(batch, data))
+
+
+def upload(index: DedupIndex, digest: str, *sheets: ExcelSheetData) -> list[int]:
+    """Проверить листы загрузки и записать ее ID, как после успешной задачи"""
+    batch = index.batch(OPERATOR_ID, digest)
+    duplicates = [check(index, batch, data) for data in sheets]
+    asyncio.run(index.record(batch))
+    return duplicates
+
+
+@pytest.mark.parametrize("rate", [0.01, 0.001])
+def test_plan_meets_target_rate(rate):
+    bits_per_key, k = plan(rate)
+    assert _false_positive_rate(bits_per_key, k) <= rate
+    assert bits_per_key < 32
+
+
+@pytest.mark.parametrize("rate", [0.01, 0.001])
+def test_false_positive_rate_at_capacity(rate):
+    capacity, queries = 20_000, 200_000
+    bloom = BloomFilter(capacity, rate)
+    bloom.update(INFLOW, (f"D{i}".encode() for i in range(capacity)))
+    assert len(bloom.hits(INFLOW, [f"D{i}".encode() for i in range(capacity)])) == capacity
+
+    false_positives = len(bloom.hits(INFLOW, [f"X{i}".encode() for i in range(queries)]))
+    assert false_positives / queries <= rate * 1.5
+
+
+def test_filter_roundtrip(tmp_path: Path):
+    bloom = BloomFilter(1000, 0.01)
+    bloom.update(INFLOW, [b"a", b"b"])
+    bloom.dump(tmp_path / "f.bloom")
+    loaded = BloomFilter.load(tmp_path / "f.bloom")
+    assert (loaded.k, loaded.capacity, loaded.count, loaded.words) == (bloom.k, 1000, 2, bloom.words)
+
+
+def test_other_upload_is_duplicate(tmp_path: Path):
+    index = DedupIndex(tmp_path)
+    assert upload(index, "first", sheet("A", "B")) == [0]
+
+    data = sheet("A", "C", amount=50)
+    assert upload(index, "second", data) == [1]
+    assert data.inflow_duplicates == {0}
+    assert data.turnover == 50
+    assert data.agent_payment == 50 * 3 / 100
+
+
+def test_same_upload_is_not_duplicate(tmp_path: Path):
+    # Та же книга, отправленная заново (другой процент, сбой на середине), считается целиком
+    index = DedupIndex(tmp_path)
+    upload(index, "book", sheet("A", "B"))
+    assert upload(index, "book", sheet("A", "B")) == [0]
+    assert upload(index, "other", sheet("B")) == [1]
+
+
+def test_unrecorded_upload_leaves_no_ids(tmp_path: Path):
+    # Задача отменена или упала до record: ее ID остаются новыми
+    index = DedupIndex(tmp_path)
+    batch = index.batch(OPERATOR_ID, "failed")
+    assert check(index, batch, sheet("A", "B")) == 0
+    assert not (tmp_path / f"operator_{OPERATOR_ID}.bloom").exists()
+    assert upload(index, "retry", sheet("A", "B")) == [0]
+
+
+def test_recorded_upload(tmp_path: Path):
+    index = DedupIndex(tmp_path)
+    batch = index.batch(OPERATOR_ID, "book")
+    check(index, batch, sheet("A", "B"))
+    # Проверка листов загрузку не записывает
+    assert not asyncio.run(index.recorded(batch))
+    asyncio.run(index.record(batch))
+    assert asyncio.run(index.recorded(index.batch(OPERATOR_ID, "book")))
+    assert not asyncio.run(index.recorded(index.batch(OPERATOR_ID + 1, "book")))
+
+    # Книга без новых ID тоже запоминается
+    upload(index, "empty", sheet())
+    upload(index, "repeats", sheet("A"))
+    assert asyncio.run(index.recorded(index.batch(OPERATOR_ID, "empty")))
+    assert asyncio.run(index.recorded(index.batch(OPERATOR_ID, "repeats")))
+
+
+def test_repeat_within_upload(tmp_path: Path):
+    index = DedupIndex(tmp_path)
+    first, second = sheet("A", "B", "A"), sheet("B", "C")
+    assert upload(index, "book", first, second) == [1, 1]
+    assert first.inflow_duplicates == {2}
+    assert second.inflow_duplicates == {0}
+
+
+def test_false_positive_is_not_duplicate(tmp_path: Path):
+    # Фильтр на один блок срабатывает почти на все ключи: решает SQLite
+    index = DedupIndex(tmp_path, capacity=1, rate=0.5)
+    upload(index, "first", sheet(*(f"A{i}" for i in range(200))))
+    assert upload(index, "second", sheet(*(f"B{i}" for i in range(200)))) == [0]
+
+
+def test_index_survives_restart(tmp_path: Path):
+    upload(DedupIndex(tmp_path), "first", sheet("A"))
+    assert upload(DedupIndex(tmp_path), "second", sheet("A", "B")) == [1]
+
+    # Потерянный фильтр строится заново по SQLite
+    (tmp_path / f"operator_{OPERATOR_ID}.bloom").unlink()
+    assert upload(DedupIndex(tmp_path), "third", sheet("A", "B")) == [2]
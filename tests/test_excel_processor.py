@@ -0,0 +1,95 @@
+import re
+import zipfile
+from pathlib import Path
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+from services.data_models import BaibitTransaction, ExcelSheetData, Transaction  # noqa: E402
+from services.excel_processor import ExcelProcessor  # noqa: E402
+
+HEADER = {"K2": "Иванов", "L2": "Сбер", "M2": 3, "N2": 1500, "P2": "@operator", "Q2": 1000, "R2": 2500,
+          "S2": "10:00", "T2": "18:00"}
+
+
+def baseline_parse(file_path: Path, agent_percent: float) -> dict:
+    """Исходный парсер: полная загрузка книги и чтение ячеек шапки по адресам"""
+    wb = openpyxl.load_workbook(file_path)
+    sheets_data = {}
+    for sheet_name in wb.sheetnames:
+        sheet = wb[sheet_name]
+        data = ExcelSheetData(
+            full_name=sheet['K2'].value, bank=sheet['L2'].value, warm_up_purchases=sheet['M2'].value,
+            warm_up_rub=sheet['N2'].value, start_balance=sheet['Q2'].value, stop_balance=sheet['R2'].value,
+            start_time=sheet['S2'].value, end_time=sheet['T2'].value, operator=sheet['P2'].value,
+            inflows=[], outflows=[], baibit=[], agent_percent=agent_percent
+        )
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            if row[0] and row[1]:
+                data.inflows.append(Transaction(amount=row[0], transaction_id=str(row[1])))
+                data.turnover += row[0]
+            if row[2] and row[3]:
+                commission = row[4] if len(row) > 4 and row[4] else 0
+                data.outflows.append(Transaction(amount=row[2], transaction_id=str(row[3]), commission=commission))
+            if row[5] and row[6]:
+                data.baibit.append(BaibitTransaction(amount=row[5], rate=row[6]))
+        data.calculate_payments()
+        sheets_data[sheet_name] = data
+    return sheets_data
+
+
+def fill(ws, cells: dict):
+    for address, value in cells.items():
+        ws[address] = value
+
+
+def write_fixture(path: Path):
+    wb = openpyxl.Workbook()
+    transactions = {"A2": 1000, "B2": "D1", "C2": 300, "D2": "W1", "E2": 15, "F2": 200, "G2": 92.5,
+                    "A3": 500, "B3": 12345}
+
+    ws = wb.active
+    ws.title = "Обычный"
+    fill(ws, {**HEADER, **transactions})
+
+    # Строка 2 пуста: шапки нет, транзакции ниже
+    fill(wb.create_sheet("Пустая шапка"), {"A3": 700, "B3": "D7", "C4": 50, "D4": "W7"})
+
+    fill(wb.create_sheet("Только шапка"), HEADER)
+
+    # Пропуски строк между транзакциями и строка без ID
+    fill(wb.create_sheet("Пропуски"), {**HEADER, "A2": 100, "B2": "D1", "A6": 200, "B6": "D2", "A9": 300,
+                                        "A12": 50.5, "B12": "D3"})
+
+    fill(wb.create_sheet("Пустой лист"), {})
+    wb.save(path)
+
+
+def shrink_dimensions(path: Path, ref: str = "A1:B3"):
+    """Неверный размер листа в файле: read-only режим по нему обрезает колонки (шапку K..T) и строки"""
+    with zipfile.ZipFile(path) as src:
+        items = [(info, src.read(info)) for info in src.infolist()]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info, content in items:
+            if info.filename.startswith("xl/worksheets/sheet"):
+                content = re.sub(rb'<dimension ref="[^"]*"\s*/>', f'<dimension ref="{ref}"/>'.encode(), content)
+            dst.writestr(info, content)
+
+
+@pytest.mark.parametrize("broken_dimensions", [False, True])
+def test_iter_workbook_matches_baseline(tmp_path, broken_dimensions):
+    path = tmp_path / "book.xlsx"
+    write_fixture(path)
+    expected = baseline_parse(path, 3)
+    if broken_dimensions:
+        shrink_dimensions(path)
+
+    parsed = dict(ExcelProcessor.iter_workbook(path, 3))
+    assert list(parsed) == list(expected)
+    for sheet_name, data in expected.items():
+        assert parsed[sheet_name] == data, sheet_name
+
+    assert parsed["Обычный"].inflows[1].transaction_id == "12345"
+    assert parsed["Пустая шапка"].full_name is None
+    assert parsed["Пропуски"].turnover == 350.5
+    assert parsed["Только шапка"].stop_balance == 2500
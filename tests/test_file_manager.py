@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import os
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("aiofiles")
+
+from services import file_manager  # noqa: E402
+from services.file_manager import FileManager  # noqa: E402
+
+CONTENT = [b"PK\x03\x04", b"x" * 1000, b"end"]
+
+
+@pytest.fixture
+def user_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manager, "USER_FILES_DIR", tmp_path)
+    return tmp_path / "42"
+
+
+async def iter_chunks(chunks, on_chunk=None):
+    for chunk in chunks:
+        if on_chunk is not None:
+            on_chunk()
+        await asyncio.sleep(0)
+        yield chunk
+
+
+def test_saved_under_content_digest(user_dir):
+    seen = []
+
+    def on_chunk():
+        # Пока файл пишется, он лежит только во временном .part
+        seen.append(sorted(path.suffix for path in user_dir.iterdir()))
+
+    path = asyncio.run(FileManager.save_user_file(42, iter_chunks(CONTENT, on_chunk)))
+    assert path == user_dir / f"{hashlib.sha256(b''.join(CONTENT)).hexdigest()}.xlsx"
+    assert path.read_bytes() == b"".join(CONTENT)
+    assert seen == [[".part"]] * len(CONTENT)
+    assert list(user_dir.iterdir()) == [path]
+
+
+def test_failed_download_leaves_no_part(user_dir):
+    async def broken():
+        yield CONTENT[0]
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(FileManager.save_user_file(42, broken()))
+    assert list(user_dir.iterdir()) == []
+
+
+def test_repeated_upload_reuses_file(user_dir):
+    first = asyncio.run(FileManager.save_user_file(42, iter_chunks(CONTENT)))
+    os.utime(first, (1, 1))
+
+    second = asyncio.run(FileManager.save_user_file(42, iter_chunks(CONTENT)))
+    assert second == first
+    assert list(user_dir.iterdir()) == [first]
+    # Повтор продлевает срок хранения файла
+    assert first.stat().st_mtime > 1
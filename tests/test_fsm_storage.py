@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from services import fsm_storage  # noqa: E402
+from services.fsm_storage import KeyValueStorage, LazyKeyValue, LocalKeyValue  # noqa: E402
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+def test_local_key_value_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(fsm_storage.time, "monotonic", lambda: now[0])
+
+    async def run():
+        client = LocalKeyValue()
+        await client.set("a", "1", ex=10)
+        await client.set("b", "2")
+        assert (await client.get("a"), await client.get("b")) == ("1", "2")
+        now[0] += 10
+        assert await client.get("a") is None
+        assert await client.get("b") == "2"
+        assert await client.delete("a", "b", "c") == 1
+        assert await client.get("b") is None
+
+    asyncio.run(run())
+
+
+def test_key_value_storage_roundtrip():
+    async def run():
+        storage = KeyValueStorage(LocalKeyValue())
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+
+        await storage.set_state(KEY, "Form:waiting_for_file")
+        await storage.set_data(KEY, {"agent_percent": 3.5, "session_active": True})
+        assert await storage.get_state(KEY) == "Form:waiting_for_file"
+        assert await storage.get_data(KEY) == {"agent_percent": 3.5, "session_active": True}
+
+        # Пустые данные и состояние None удаляют ключи
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        assert storage.client._values == {}
+        await storage.close()
+
+    asyncio.run(run())
+
+
+def test_lazy_client_created_once_on_first_use():
+    created = []
+
+    async def factory():
+        await asyncio.sleep(0)
+        created.append(LocalKeyValue())
+        return created[-1]
+
+    async def run():
+        client = LazyKeyValue(factory)
+        await client.aclose()
+        assert created == []
+
+        await asyncio.gather(client.set("a", "1"), client.get("a"), client.connect())
+        assert await client.get("a") == "1"
+        assert await client.delete("a", "b") == 1
+        await client.aclose()
+
+    asyncio.run(run())
+    assert len(created) == 1
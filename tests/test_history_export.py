@@ -0,0 +1,109 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("sqlalchemy")
+
+from config import EXPORT_BATCH_ROWS  # noqa: E402
+from services.history_export import (  # noqa: E402
+    SESSIONS_HEADER, SESSIONS_TITLE, TRANSACTIONS_HEADER, TRANSACTIONS_TITLE, HistoryExporter
+)
+
+START = datetime(2026, 1, 5, 10)
+SESSIONS = [
+    [(1, "operator", "Иванов", START, None, Decimal("1000.00"), Decimal("2500.00"), Decimal("3.00"),
+      Decimal("45.00"), Decimal("1500.00"))],
+    [(2, "operator", "Петров", START.replace(hour=15), START.replace(hour=18), Decimal(0), Decimal(0),
+      Decimal("2.50"), Decimal("0.00"), Decimal("0.00"))],
+]
+TRANSACTIONS = [
+    [(1, START, "operator", "Иванов", "inflow", "D1", Decimal("1000.00"), None, Decimal(0), Decimal(0), Decimal(1)),
+     (1, START, "operator", "Иванов", "outflow", None, Decimal(0), "W1", Decimal("300.00"), Decimal("5.00"),
+      Decimal(1))],
+    [(1, START, "operator", "Иванов", "baibit", None, Decimal("100.00"), None, Decimal(0), Decimal(0),
+      Decimal("92.50000000"))],
+]
+
+
+class FakeResult:
+    def __init__(self, batches: list):
+        self.batches = batches
+        self.closed = False
+
+    async def partitions(self):
+        for rows in self.batches:
+            await asyncio.sleep(0)
+            yield rows
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Курсор на стороне сервера: каждый stream отдает следующую выгрузку пачками"""
+    def __init__(self, *exports: list):
+        self.exports = list(exports)
+        self.results = []
+        self.queries = []
+
+    async def stream(self, query):
+        self.queries.append(query)
+        self.results.append(FakeResult(self.exports.pop(0)))
+        return self.results[-1]
+
+
+def read_sheets(path) -> dict:
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    finally:
+        wb.close()
+
+
+def expected_rows(header: list, batches: list) -> list:
+    return [header] + [[float(v) if isinstance(v, Decimal) else v for v in row]
+                       for rows in batches for row in rows]
+
+
+def test_spooled_export_writes_streamed_rows(monkeypatch):
+    session = FakeSession(SESSIONS, TRANSACTIONS)
+    workbooks = []
+    workbook = openpyxl.Workbook
+
+    def spy(*args, **kwargs):
+        workbooks.append(workbook(*args, **kwargs))
+        return workbooks[-1]
+
+    monkeypatch.setattr(openpyxl, "Workbook", spy)
+
+    async def run():
+        async with HistoryExporter.spooled(session, date(2026, 1, 1), date(2026, 2, 1)) as (path, counts):
+            # Книга уже на диске, пока вызывающий ее отправляет
+            assert path.is_file() and path.stat().st_size > 0
+            return path, counts, read_sheets(path)
+
+    path, counts, sheets = asyncio.run(run())
+    assert [wb.write_only for wb in workbooks] == [True]
+    assert counts == {SESSIONS_TITLE: 2, TRANSACTIONS_TITLE: 3}
+    assert list(sheets) == [SESSIONS_TITLE, TRANSACTIONS_TITLE]
+    assert sheets[SESSIONS_TITLE] == expected_rows(SESSIONS_HEADER, SESSIONS)
+    assert sheets[TRANSACTIONS_TITLE] == expected_rows(TRANSACTIONS_HEADER, TRANSACTIONS)
+    assert all(result.closed for result in session.results)
+    assert all(query.get_execution_options()["yield_per"] == EXPORT_BATCH_ROWS for query in session.queries)
+    # Временный файл удаляется при выходе из блока
+    assert not path.exists()
+
+
+def test_spooled_file_removed_on_error():
+    class Failed(Exception):
+        pass
+
+    async def run():
+        async with HistoryExporter.spooled(FakeSession([], []), date(2026, 1, 1), date(2026, 2, 1)) as (path, _):
+            raise Failed(path)
+
+    with pytest.raises(Failed) as error:
+        asyncio.run(run())
+    assert not error.value.args[0].exists()
@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiogram")
+
+from services.jobs import FileJob, JobQueue, JobStatus  # noqa: E402
+
+
+def make_queue(run, errors: list, **kwargs) -> JobQueue:
+    async def on_error(job, error):
+        errors.append((job.id, error))
+    return JobQueue(run, on_error, **{"workers": 2, "per_operator": 1, "max_pending": 10,
+                                      "max_retries": 2, "retry_delay": 0, **kwargs})
+
+
+async def wait_for(predicate, timeout: float = 5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_transient_failure_retried():
+    errors = []
+
+    async def run(job):
+        if job.attempts == 1:
+            raise ConnectionError("reset")
+
+    async def main():
+        queue = make_queue(run, errors)
+        queue.start()
+        job = FileJob(1, None, 3)
+        queue.submit(job)
+        await wait_for(lambda: job.status == JobStatus.DONE)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert job.attempts == 2
+    assert errors == []
+
+
+def test_no_retry_after_report_started():
+    errors = []
+
+    async def run(job):
+        job.retriable = False
+        raise ConnectionError("reset")
+
+    async def main():
+        queue = make_queue(run, errors)
+        queue.start()
+        job = FileJob(1, None, 3)
+        queue.submit(job)
+        await wait_for(lambda: job.status == JobStatus.FAILED)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert job.attempts == 1
+    assert [job_id for job_id, _ in errors] == [job.id]
+
+
+def test_cancel_running_and_pending_jobs():
+    errors, started = [], []
+
+    async def run(job):
+        started.append(job.id)
+        await asyncio.Event().wait()
+
+    async def main():
+        queue = make_queue(run, errors)
+        queue.start()
+        running, pending, other = FileJob(1, None, 3), FileJob(1, None, 3), FileJob(2, None, 3)
+        queue.submit(running)
+        # Задачи оператора идут по одной: вторая ждет первую
+        assert queue.submit(pending) == 1
+        queue.submit(other)
+        await wait_for(lambda: len(started) == 2)
+
+        cancelled = queue.cancel(1)
+        await wait_for(lambda: not queue.operator_jobs(1))
+        assert other.status == JobStatus.RUNNING
+        queue.cancel(2)
+        await queue.stop()
+        return running, pending, cancelled
+
+    running, pending, cancelled = asyncio.run(main())
+    assert {job.id for job in cancelled} == {running.id, pending.id}
+    assert running.status == pending.status == JobStatus.CANCELLED
+    assert pending.id not in started
+    assert errors == []
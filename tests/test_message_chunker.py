@@ -0,0 +1,40 @@
+from services.message_chunker import MessageChunker, utf16_len
+
+
+def chunk(sections: list, limit: int) -> list[str]:
+    chunker = MessageChunker(limit)
+    messages = []
+    for lines in sections:
+        messages.extend(chunker.feed(lines))
+    messages.extend(chunker.flush())
+    return messages
+
+
+def test_utf16_len_counts_surrogate_pairs():
+    assert utf16_len("abc") == 3
+    assert utf16_len("📌") == 2
+    assert utf16_len("Ёж📊") == 4
+
+
+def test_messages_fit_limit_in_utf16_units():
+    # 10 символов Python, но 20 единиц UTF-16 на строку
+    lines = ["📌" * 10 for _ in range(20)]
+    messages = chunk([lines], limit=50)
+    assert all(utf16_len(message) <= 50 for message in messages)
+    assert "\n".join(messages).split("\n") == lines
+
+
+def test_section_moves_whole_to_next_message():
+    messages = chunk([["a" * 10, "b" * 10], ["c" * 10, "d" * 10]], limit=30)
+    assert messages == ["a" * 10 + "\n" + "b" * 10, "c" * 10 + "\n" + "d" * 10]
+
+
+def test_sections_share_message_with_separator():
+    assert chunk([["a"], ["b"]], limit=100) == ["a\n\nb"]
+
+
+def test_long_line_split_without_breaking_surrogate_pairs():
+    line = "📊" * 30
+    messages = chunk([[line]], limit=25)
+    assert all(utf16_len(message) <= 25 for message in messages)
+    assert "".join(messages) == line
@@ -0,0 +1,96 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from services import outbound  # noqa: E402
+from services.outbound import OutboundDispatcher, Priority  # noqa: E402
+
+CHAT_ID = 1
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(outbound, "SEND_CHAT_RATE", 1000)
+    monkeypatch.setattr(outbound, "SEND_CHAT_BURST", 1000)
+
+
+def test_interactive_overtakes_queued_bulk_in_order():
+    delivered = []
+
+    async def run():
+        dispatcher = OutboundDispatcher()
+        dispatcher.start()
+        release = asyncio.Event()
+
+        async def first():
+            await release.wait()
+            delivered.append("bulk 0")
+
+        def message(name: str):
+            async def send():
+                delivered.append(name)
+                return name
+            return send
+
+        futures = [await dispatcher.submit(CHAT_ID, first, Priority.BULK)]
+        await asyncio.sleep(0.01)
+        for i in (1, 2):
+            futures.append(await dispatcher.submit(CHAT_ID, message(f"bulk {i}"), Priority.BULK))
+        futures.append(await dispatcher.submit(CHAT_ID, message("interactive"), Priority.INTERACTIVE))
+        release.set()
+        await asyncio.gather(*futures)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    # Первая часть уже отправлялась; ответ оператору обгоняет остальные, они идут по порядку
+    assert delivered == ["bulk 0", "interactive", "bulk 1", "bulk 2"]
+
+
+def test_retry_after_delays_chat_and_keeps_order():
+    attempts = []
+
+    async def run():
+        dispatcher = OutboundDispatcher()
+        dispatcher.start()
+
+        async def flooded():
+            attempts.append(("first", time.monotonic()))
+            if len(attempts) == 1:
+                raise TelegramRetryAfter(SendMessage(chat_id=CHAT_ID, text="x"), "Too Many Requests", 1)
+            return "first"
+
+        async def second():
+            attempts.append(("second", time.monotonic()))
+            return "second"
+
+        futures = [await dispatcher.submit(CHAT_ID, flooded, Priority.BULK),
+                   await dispatcher.submit(CHAT_ID, second, Priority.BULK)]
+        results = await asyncio.gather(*futures)
+        await dispatcher.stop()
+        return results
+
+    assert asyncio.run(run()) == ["first", "second"]
+    assert [name for name, _ in attempts] == ["first", "first", "second"]
+    assert attempts[1][1] - attempts[0][1] >= 0.9
+
+
+def test_failure_is_reported_to_sender():
+    async def run():
+        dispatcher = OutboundDispatcher()
+        dispatcher.start()
+
+        async def broken():
+            raise ValueError("bad request")
+
+        try:
+            with pytest.raises(ValueError):
+                await dispatcher.send(CHAT_ID, broken)
+            assert await dispatcher.send(CHAT_ID, lambda: asyncio.sleep(0, "ok")) == "ok"
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import pytest
+from services import metrics
+from services.parse_cache import ParseCache
+
+
+def test_lookups_exported_as_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(metrics.PARSE_CACHE, "_values", {})
+    cache = ParseCache(tmp_path)
+
+    assert not cache.contains("book")
+    cache.record(hit=False)
+    cache.store("book", [("Agent", None)])
+    assert cache.contains("book")
+    # Проверка наличия сама по себе не считается обращением
+    assert cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+    assert cache.load(cache.path_for("book")) == [("Agent", None)]
+    cache.record(hit=True)
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert set(metrics.PARSE_CACHE.render()) >= {
+        'chocolate_parse_cache_lookups_total{result="hit"} 1',
+        'chocolate_parse_cache_lookups_total{result="miss"} 1',
+    }
+
+
+def test_load_marks_entry_used(tmp_path):
+    cache = ParseCache(tmp_path)
+    cache.store("book", [])
+    path = cache.path_for("book")
+    os.utime(path, (1, 1))
+    cache.load(path)
+    assert path.stat().st_mtime > 1
+
+
+def test_unreadable_entry_counted_as_miss(tmp_path):
+    pytest.importorskip("aiogram")
+    openpyxl = pytest.importorskip("openpyxl")
+    from services.bot_handler import BotHandler
+    from services.jobs import FileJob
+    from services.worker_pool import WorkerPool
+
+    file_path = tmp_path / "book.xlsx"
+    wb = openpyxl.Workbook()
+    wb.active.title = "Agent"
+    wb.active["A2"], wb.active["B2"] = 1000, "D1"
+    wb.save(file_path)
+
+    cache = ParseCache(tmp_path / "cache")
+    cache.cache_dir.mkdir()
+    # Оборванная запись: файл есть, но не читается
+    cache.path_for("book").write_bytes(b"")
+
+    handler = BotHandler.__new__(BotHandler)
+    handler.parse_cache = cache
+    handler.pool = WorkerPool(workers=1)
+
+    async def load():
+        return [name async for name, _ in handler._load_sheets(FileJob(1, None, 3), file_path)]
+
+    handler.pool.start()
+    try:
+        assert asyncio.run(load()) == ["Agent"]
+        assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 0
+        # Разбор записан заново и читается при следующей загрузке
+        assert asyncio.run(load()) == ["Agent"]
+    finally:
+        handler.pool.shutdown()
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
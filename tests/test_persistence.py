@@ -0,0 +1,111 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from sqlalchemy import delete, func, select  # noqa: E402
+from benchmarks.bench_persistence import cleanup  # noqa: E402
+from database import create_engine, create_session_factory  # noqa: E402
+from models import Agents, AgentSessions, DailyRollups, Transactions  # noqa: E402
+from services.data_models import ExcelSheetData  # noqa: E402
+from services.persistence import TransactionStore, _balance  # noqa: E402
+
+OPERATOR = "test_persistence"
+# Сохранения одного оператора упорядочивает блокировка его строки: гонка агентов — между операторами
+RACING_OPERATORS = tuple(f"{OPERATOR}_{i}" for i in range(4))
+AGENTS = ("Test Persistence Agent", "Test Persistence Race")
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, Decimal(0)),
+    (2500, Decimal(2500)),
+    (92.5, Decimal("92.5")),
+    ("10 000", Decimal(10000)),
+    ("1,5", Decimal("1.5")),
+    ("нет данных", None),
+])
+def test_balance_from_header_cell(value, expected):
+    assert _balance(value, "start_balance") == expected
+
+
+def sheet(full_name: str, start_balance=None) -> ExcelSheetData:
+    data = ExcelSheetData(full_name, "Bank", 0, 0, start_balance, "1 000,50", datetime(2026, 1, 5, 10), None,
+                          OPERATOR, agent_percent=3)
+    data.inflows.add(1000, "D1")
+    data.inflows.add(500, "D2")
+    data.outflows.add(300, "W1", 5)
+    data.baibit.add(100, 92.5)
+    data.turnover = data.inflows.total_amount()
+    data.mark_duplicates({1}, set())
+    return data
+
+
+def with_database(test):
+    """Тест на БД из DB_* с примененными миграциями; без нее пропускается"""
+    async def run():
+        engine = create_engine()
+        session_factory = create_session_factory(engine)
+        try:
+            try:
+                async with engine.connect():
+                    pass
+            except (OSError, asyncio.TimeoutError) as e:
+                pytest.skip(f"Database is not available: {e}")
+            try:
+                await test(session_factory)
+            finally:
+                await cleanup(session_factory, (OPERATOR, *RACING_OPERATORS))
+                async with session_factory() as session, session.begin():
+                    await session.execute(delete(Agents).where(Agents.full_name.in_(AGENTS)))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_save_workbook():
+    async def test(session_factory):
+        async with session_factory() as session:
+            session_id, = await TransactionStore.save_workbook(session, OPERATOR, [sheet(AGENTS[0], "10 000")])
+
+        async with session_factory() as session:
+            agent_session = await session.get(AgentSessions, session_id)
+            assert (agent_session.start_balance, agent_session.stop_balance) == (10000, Decimal("1000.50"))
+            assert agent_session.turnover == 1000
+
+            rows = (await session.execute(
+                select(Transactions.transaction_type, Transactions.deposit_id, Transactions.withdraw_id)
+                .where(Transactions.agent_session_id == session_id).order_by(Transactions.id)
+            )).all()
+            # Повтор D2 не сохраняется
+            assert rows == [("inflow", "D1", None), ("outflow", None, "W1"), ("baibit", None, None)]
+
+            rollup = (await session.execute(
+                select(DailyRollups).where(DailyRollups.agent_id == agent_session.agent_id)
+            )).scalar_one()
+            assert (rollup.day, rollup.sessions, rollup.turnover) == (date(2026, 1, 5), 1, 1000)
+            assert (rollup.inflow_count, rollup.outflow_count, rollup.baibit_count) == (1, 1, 1)
+
+    with_database(test)
+
+
+def test_concurrent_saves_create_one_agent():
+    async def test(session_factory):
+        async def save(operator: str):
+            async with session_factory() as session:
+                await TransactionStore.save_workbook(session, operator, [sheet(AGENTS[1])])
+
+        await asyncio.gather(*map(save, RACING_OPERATORS))
+        async with session_factory() as session:
+            agents = (await session.execute(
+                select(func.count()).select_from(Agents).where(Agents.full_name == AGENTS[1])
+            )).scalar_one()
+            sessions = (await session.execute(
+                select(func.count()).select_from(AgentSessions).join(Agents).where(Agents.full_name == AGENTS[1])
+            )).scalar_one()
+        assert (agents, sessions) == (1, 4)
+
+    with_database(test)
@@ -0,0 +1,52 @@
+import json
+import pstats
+from services.profiler import Profiler, profile_call
+
+OPERATOR = 7
+
+
+def busy(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def test_profile_writes_dumps(tmp_path):
+    profiler = Profiler(tmp_path, keep=5)
+    with profiler.profile(OPERATOR, "job") as profile_dir:
+        assert profile_dir is None
+
+    profiler.set_operator(OPERATOR, True)
+    with profiler.profile(OPERATOR, "job") as profile_dir:
+        # Второй профиль одновременно не снимается
+        with profiler.profile(OPERATOR, "other") as nested:
+            assert nested is None
+        busy(10000)
+        assert profile_call(str(profile_dir / "parse-0"), busy, 1000) == busy(1000)
+
+    assert profile_dir.name.endswith(f"_{OPERATOR}_job")
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        "main.alloc.json", "main.pstats", "parse-0.alloc.json", "parse-0.pstats"
+    ]
+    functions = {name for _, _, name in pstats.Stats(str(profile_dir / "main.pstats")).stats}
+    assert "busy" in functions
+    allocations = json.loads((profile_dir / "main.alloc.json").read_text())
+    assert allocations["peak"] > 0 and isinstance(allocations["sites"], list)
+
+    summary = profiler.summary(1)
+    assert summary["uploads"] == [profile_dir.name]
+    assert any("(busy)" in row["function"] for row in summary["functions"])
+
+
+def test_rotate_keeps_latest(tmp_path):
+    profiler = Profiler(tmp_path, keep=2)
+    old = [tmp_path / f"20000101_00000{i}_{OPERATOR}_old{i}" for i in range(3)]
+    for path in old:
+        path.mkdir()
+        (path / "main.pstats").write_bytes(b"")
+
+    profiler.set_operator(OPERATOR, True)
+    with profiler.profile(OPERATOR, "new") as profile_dir:
+        pass
+
+    assert profiler.recent() == [profile_dir, old[2]]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([".operators.json", profile_dir.name,
+                                                                       old[2].name])
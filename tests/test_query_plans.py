@@ -0,0 +1,16 @@
+import asyncio
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from benchmarks import check_query_plans  # noqa: E402
+
+
+def test_queries_use_expected_indexes(capsys):
+    """Нужна БД с примененными миграциями (DB_* из окружения); без нее тест пропускается"""
+    try:
+        ok = asyncio.run(check_query_plans.main(sample=True))
+    except (OSError, asyncio.TimeoutError) as e:
+        pytest.skip(f"Database is not available: {e}")
+    assert ok, capsys.readouterr().out
@@ -0,0 +1,101 @@
+import codecs
+import csv
+import io
+import re
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+from services.data_models import ExcelSheetData  # noqa: E402
+from services.report_exporter import (  # noqa: E402
+    CSV_HEADER, SUMMARY_HEADER, SUMMARY_TITLE, TRANSACTIONS_HEADER, ReportExporter
+)
+from services.report_generator import ReportGenerator  # noqa: E402
+
+fmt = ReportGenerator.format_number
+
+
+def make_sheets() -> list:
+    first = ExcelSheetData("Иванов", "Сбер", 3, 1500, 1000, 2500, "10:00", "18:00", "@operator", agent_percent=3)
+    first.inflows.add(1000, "D1")
+    first.inflows.add(500.5, "D2")
+    first.inflows.add(700, "D3")
+    first.outflows.add(300, "W1", 15)
+    first.outflows.add(200, "W2", 7)
+    first.baibit.add(100, 92.5)
+    first.turnover = first.inflows.total_amount()
+    # D3 и W2 учтены в прошлой загрузке
+    first.mark_duplicates({2}, {1})
+
+    second = ExcelSheetData("Петров", "Тинькофф", 0, 0, 0, 0, None, None, None, agent_percent=2.5)
+    second.inflows.add(2000, "D9")
+    second.outflows.add(150, "W9")
+    second.turnover = second.inflows.total_amount()
+    second.calculate_payments()
+
+    sheets = [("Агент 1", first), ("Агент: 2/б", second)]
+    for sheet_name, data in sheets:
+        data.sheet_name = sheet_name
+    return sheets
+
+
+def report_totals(data: ExcelSheetData) -> dict:
+    """Итоги из текстового отчета: подпись -> значение"""
+    text = ReportGenerator.generate(data).split("Итоги:", 1)[1]
+    totals = dict(re.findall(r"^(Оборот|Оплата агента|Оплата оператора|Общие комиссии)[^:]*: (.+)$", text, re.M))
+    assert len(totals) == 4
+    return totals
+
+
+def test_xlsx_matches_text_report():
+    sheets = make_sheets()
+    wb = openpyxl.load_workbook(io.BytesIO(ReportExporter.export(sheets, "xlsx")), read_only=True)
+    rows = {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    wb.close()
+
+    assert list(rows) == [SUMMARY_TITLE, "Агент 1", "Агент_ 2_б"]
+    summary = [dict(zip(SUMMARY_HEADER, row)) for row in rows[SUMMARY_TITLE][1:]]
+    assert rows[SUMMARY_TITLE][0] == SUMMARY_HEADER
+
+    for (sheet_name, data), row in zip(sheets, summary):
+        assert row["Лист"] == sheet_name
+        assert report_totals(data) == {
+            "Оборот": fmt(row["Оборот"]),
+            "Оплата агента": fmt(row["Оплата агента"]),
+            "Оплата оператора": fmt(row["Оплата оператора"]),
+            "Общие комиссии": fmt(row["Комиссии"]),
+        }
+
+    total = summary[-1]
+    assert total["Лист"] == "Всего"
+    assert ReportGenerator.file_summary_lines(total["Оборот"], total["Оплата оператора"]) == \
+        ReportGenerator.file_summary_lines(sum(data.turnover for _, data in sheets),
+                                           sum(data.operator_payment for _, data in sheets))
+
+    transactions = rows["Агент 1"][rows["Агент 1"].index(TRANSACTIONS_HEADER) + 1:]
+    assert [(row[0], row[3], row[6]) for row in transactions] == [
+        ("Вход", "D1", None), ("Вход", "D2", None), ("Вход", "D3", "да"),
+        ("Выход", "W1", None), ("Выход", "W2", "да"), ("Байбит", None, None),
+    ]
+
+
+def test_csv_matches_text_report():
+    sheets = make_sheets()
+    content = ReportExporter.export(sheets, "csv")
+    assert content.startswith(codecs.BOM_UTF8)
+    reader = csv.reader(io.StringIO(content.decode("utf-8-sig")))
+    assert next(reader) == CSV_HEADER
+    rows = [dict(zip(CSV_HEADER, row)) for row in reader]
+
+    for sheet_name, data in sheets:
+        counted = [row for row in rows if row["Лист"] == sheet_name and not row["Повтор"]]
+        assert {row["ФИО"] for row in counted} == {data.full_name}
+        turnover = sum(float(row["Сумма"]) for row in counted if row["Тип"] == "Вход")
+        commissions = sum(float(row["Комиссия"] or 0) for row in counted if row["Тип"] == "Выход")
+        totals = report_totals(data)
+        assert (fmt(turnover), fmt(commissions)) == (totals["Оборот"], totals["Общие комиссии"])
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        ReportExporter.export(make_sheets(), "pdf")
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from sqlalchemy import delete, select, update  # noqa: E402
+from benchmarks.bench_persistence import cleanup  # noqa: E402
+from database import create_engine, create_session_factory  # noqa: E402
+from models import Agents, DailyRollups  # noqa: E402
+from services.data_models import ExcelSheetData  # noqa: E402
+from services.persistence import TransactionStore  # noqa: E402
+from services.rollups import SUM_COLUMNS, RollupStore, period_bounds  # noqa: E402
+
+OPERATOR = "test_rollups"
+AGENT = "Test Rollups Agent"
+# День, в который больше ничего не сохраняется: пересчет за него затрагивает только строки теста
+DAY = date(2001, 3, 14)
+
+
+@pytest.mark.parametrize("period, day, expected", [
+    ("day", date(2026, 2, 28), (date(2026, 2, 28), date(2026, 3, 1))),
+    ("week", date(2026, 1, 7), (date(2026, 1, 5), date(2026, 1, 12))),
+    ("week", date(2026, 1, 5), (date(2026, 1, 5), date(2026, 1, 12))),
+    ("week", date(2025, 12, 31), (date(2025, 12, 29), date(2026, 1, 5))),
+    ("month", date(2026, 1, 31), (date(2026, 1, 1), date(2026, 2, 1))),
+    ("month", date(2024, 2, 29), (date(2024, 2, 1), date(2024, 3, 1))),
+    ("month", date(2025, 12, 15), (date(2025, 12, 1), date(2026, 1, 1))),
+])
+def test_period_bounds(period, day, expected):
+    assert period_bounds(period, day) == expected
+
+
+def test_period_bounds_unknown_period():
+    with pytest.raises(ValueError):
+        period_bounds("year", date(2026, 1, 1))
+
+
+def sheet(hour: int, amount: int) -> ExcelSheetData:
+    data = ExcelSheetData(AGENT, "Bank", 0, 0, 0, 0, datetime(DAY.year, DAY.month, DAY.day, hour), None,
+                          OPERATOR, agent_percent=3)
+    data.inflows.add(amount, f"D{hour}")
+    data.outflows.add(100, f"W{hour}", 5)
+    data.turnover = data.inflows.total_amount()
+    data.calculate_payments()
+    return data
+
+
+def with_database(test):
+    """Тест на БД из DB_* с примененными миграциями; без нее пропускается"""
+    async def run():
+        engine = create_engine()
+        session_factory = create_session_factory(engine)
+        try:
+            try:
+                async with engine.connect():
+                    pass
+            except (OSError, asyncio.TimeoutError) as e:
+                pytest.skip(f"Database is not available: {e}")
+            try:
+                await test(session_factory)
+            finally:
+                await cleanup(session_factory, (OPERATOR,))
+                async with session_factory() as session, session.begin():
+                    await session.execute(delete(Agents).where(Agents.full_name == AGENT))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+async def day_rollup(session_factory) -> dict:
+    async with session_factory() as session:
+        row = (await session.execute(
+            select(*(getattr(DailyRollups, column) for column in SUM_COLUMNS))
+            .join(Agents, Agents.id == DailyRollups.agent_id)
+            .where(Agents.full_name == AGENT, DailyRollups.day == DAY)
+        )).one()
+    return row._asdict()
+
+
+def test_add_accumulates_and_rebuild_matches():
+    async def test(session_factory):
+        # Каждое сохранение прибавляет свой лист к той же дневной строке
+        for hour, amount in ((10, 1000), (15, 500)):
+            async with session_factory() as session:
+                await TransactionStore.save_workbook(session, OPERATOR, [sheet(hour, amount)])
+
+        saved = await day_rollup(session_factory)
+        assert saved["sessions"] == 2
+        assert saved["turnover"] == 1500
+        assert saved["commissions"] == 10
+        assert (saved["inflow_count"], saved["outflow_count"], saved["baibit_count"]) == (2, 2, 0)
+
+        async with session_factory() as session, session.begin():
+            key = (await session.execute(
+                select(DailyRollups.operator_id, DailyRollups.agent_id)
+                .join(Agents, Agents.id == DailyRollups.agent_id)
+                .where(Agents.full_name == AGENT, DailyRollups.day == DAY)
+            )).one()
+            await RollupStore.add(session, [
+                {"operator_id": key.operator_id, "day": DAY, "agent_id": key.agent_id,
+                 **dict.fromkeys(SUM_COLUMNS, 0), "sessions": 1, "turnover": Decimal(250)},
+            ])
+        added = await day_rollup(session_factory)
+        assert (added["sessions"], added["turnover"]) == (3, 1750)
+
+        # Пересчет по agent_sessions и transactions возвращает итоги сохранений
+        async with session_factory() as session, session.begin():
+            await session.execute(
+                update(DailyRollups).where(DailyRollups.day == DAY, DailyRollups.agent_id == key.agent_id)
+                .values(turnover=0)
+            )
+        async with session_factory() as session:
+            rows = await RollupStore.rebuild(session, *period_bounds("day", DAY))
+        assert rows == 1
+        assert await day_rollup(session_factory) == saved
+
+    with_database(test)
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+import pytest
+from services import session_manager
+from services.session_manager import SessionManager, open_session
+
+OPERATOR_ID = 1
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_manager, "STORAGE_DIR", tmp_path)
+    monkeypatch.setattr(session_manager, "_managers", {})
+    monkeypatch.setattr(session_manager, "_operator_locks", defaultdict(asyncio.Lock))
+    return tmp_path
+
+
+async def add(name: str, turnover: float) -> SessionManager:
+    async with open_session(OPERATOR_ID) as manager:
+        await asyncio.to_thread(manager.add_agent, name, turnover, 3, "Сбер")
+    return manager
+
+
+def test_open_session_reuses_manager():
+    async def run():
+        first = await add("A", 100)
+        second = await add("B", 200)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert second.get_summary()["total_turnover"] == 300
+    assert SessionManager(OPERATOR_ID).get_summary()["total_turnover"] == 300
+
+
+def test_open_session_reloads_changed_files():
+    async def run():
+        first = await add("A", 100)
+        # Другая копия бота дописала журнал
+        other = SessionManager(OPERATOR_ID)
+        other.add_agent("B", 200, 3)
+        other.close()
+        return first, await add("C", 300)
+
+    first, second = asyncio.run(run())
+    assert first is not second
+    assert second.get_summary()["total_turnover"] == 600
+
+
+def test_finish_and_failure_drop_cached_manager():
+    async def run():
+        manager = await add("A", 100)
+        async with open_session(OPERATOR_ID) as same:
+            assert same is manager
+            same.finish()
+        async with open_session(OPERATOR_ID) as fresh:
+            assert fresh is not manager
+            assert fresh.get_summary()["agents_count"] == 0
+
+        with pytest.raises(RuntimeError):
+            async with open_session(OPERATOR_ID) as failed:
+                raise RuntimeError
+        async with open_session(OPERATOR_ID) as reloaded:
+            assert reloaded is not failed
+
+    asyncio.run(run())
+
+
+def test_journal_torn_tail_is_discarded(storage):
+    manager = SessionManager(OPERATOR_ID)
+    manager.add_agent("A", 100, 3)
+    manager.add_agent("B", 200, 3)
+    manager.close()
+
+    journal = storage / f"operator_{OPERATOR_ID}.journal"
+    intact = journal.stat().st_size
+    with open(journal, 'ab') as f:
+        f.write(b'{"seq": 3, "event": "agent", "agent": {"name": "C", "tur')
+
+    restored = SessionManager(OPERATOR_ID)
+    assert restored.get_summary()["agents_count"] == 2
+    assert restored.get_summary()["total_turnover"] == 300
+    assert journal.stat().st_size == intact
+
+    # После обрезки журнал снова дописывается с целой строки
+    restored.add_agent("C", 300, 3)
+    restored.close()
+    assert [json.loads(line)["seq"] for line in journal.read_bytes().splitlines()] == [0, 1, 2, 3]
+    assert SessionManager(OPERATOR_ID).get_summary()["total_turnover"] == 600
+
+
+def test_snapshot_skips_replayed_events(storage):
+    manager = SessionManager(OPERATOR_ID, snapshot_every=3)
+    for i in range(5):
+        manager.add_agent(f"agent {i}", 100, 3)
+    manager.close()
+    assert (storage / f"operator_{OPERATOR_ID}.json").exists()
+
+    # Сбой между снимком и очисткой журнала: события из снимка не учитываются дважды
+    journal = storage / f"operator_{OPERATOR_ID}.journal"
+    stale = json.dumps({"seq": 1, "event": "agent", "agent": {"name": "agent 0", "turnover": 100,
+                                                               "percent": 3, "bank": None}})
+    journal.write_bytes(stale.encode() + b"\n" + journal.read_bytes())
+
+    restored = SessionManager(OPERATOR_ID)
+    assert restored.get_summary()["agents_count"] == 5
+    assert restored.get_summary()["total_turnover"] == 500
+
+
+def test_session_loaded_off_event_loop(monkeypatch):
+    threads = []
+
+    class Recording(SessionManager):
+        def _load(self):
+            threads.append(threading.current_thread())
+            super()._load()
+
+    monkeypatch.setattr(session_manager, "SessionManager", Recording)
+    asyncio.run(add("A", 100))
+    assert threads and threading.main_thread() not in threads
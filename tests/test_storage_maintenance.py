@@ -0,0 +1,91 @@
+import os
+import time
+from services.storage_maintenance import (
+    COMPRESSED_SUFFIX, MANIFEST_NAME, ReportManifest, StorageMaintainer, open_report
+)
+
+DAY = 86400
+
+
+def write(path, size: int, age: float, now: float, content: bytes = None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content if content is not None else b"x" * size)
+    os.utime(path, (now - age, now - age))
+    return path
+
+
+def maintainer(tmp_path, **kwargs) -> StorageMaintainer:
+    options = {"compress_after_days": 7, "user_quota": 10 ** 9, "global_quota": 10 ** 9, "grace": 3600,
+               **kwargs}
+    return StorageMaintainer(tmp_path / "user_files", tmp_path / "reports", **options)
+
+
+def test_user_quota_evicts_least_recently_used(tmp_path):
+    now = time.time()
+    files = tmp_path / "user_files" / "1"
+    oldest = write(files / "a.xlsx", 100, 5 * DAY, now)
+    older = write(files / "b.xlsx", 100, 4 * DAY, now)
+    old = write(files / "c.xlsx", 100, 3 * DAY, now)
+    recent = write(files / "d.xlsx", 100, 2 * DAY, now)
+    # Моложе grace: может быть в обработке, не вытесняется даже сверх квоты
+    fresh = write(files / "e.xlsx", 100, 60, now)
+    # Другой пользователь в своей квоте
+    other = write(tmp_path / "user_files" / "2" / "a.xlsx", 100, 10 * DAY, now)
+
+    stats = maintainer(tmp_path, user_quota=250).run_once()
+    assert (stats.evicted, stats.bytes_evicted) == (3, 300)
+    assert [path.exists() for path in (oldest, older, old, recent, fresh, other)] == \
+        [False, False, False, True, True, True]
+
+
+def test_global_quota_evicts_across_users(tmp_path):
+    now = time.time()
+    first = write(tmp_path / "user_files" / "1" / "a.xlsx", 100, 3 * DAY, now)
+    second = write(tmp_path / "user_files" / "2" / "a.xlsx", 100, 2 * DAY, now)
+    third = write(tmp_path / "reports" / "1" / "report_1.xlsx", 100, 1 * DAY, now)
+
+    stats = maintainer(tmp_path, global_quota=150).run_once()
+    assert stats.evicted == 2
+    assert [path.exists() for path in (first, second, third)] == [False, False, True]
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    now = time.time()
+    stored = write(tmp_path / "user_files" / "1" / "a.xlsx", 100, 3 * DAY, now)
+    report = write(tmp_path / "reports" / "1" / "report_1.txt", 100, 30 * DAY, now)
+
+    stats = maintainer(tmp_path, user_quota=0, dry_run=True).run_once()
+    assert (stats.compressed, stats.evicted) == (1, 2)
+    assert stored.exists() and report.exists()
+
+
+def test_manifest_follows_compression_and_eviction(tmp_path):
+    now = time.time()
+    reports = tmp_path / "reports" / "1"
+    manifest = ReportManifest(reports)
+    content = "Оборот: 1 000\n".encode() * 200
+    old = write(reports / "report_old.txt", 0, 30 * DAY, now, content)
+    manifest.append(old)
+    stale = write(reports / "report_stale.xlsx", 5000, 40 * DAY, now)
+    manifest.append(stale)
+    new = write(reports / "report_new.txt", 0, DAY, now, b"new")
+    manifest.append(new)
+
+    # Квота вмещает сжатые отчеты, но не старый xlsx
+    stats = maintainer(tmp_path, user_quota=4000).run_once()
+    assert stats.compressed == 1 and stats.bytes_saved > 0
+    assert stats.evicted == 1 and not stale.exists()
+
+    compressed = reports / ("report_old.txt" + COMPRESSED_SUFFIX)
+    assert not old.exists()
+    # Сжатие не освежает файл для LRU
+    assert abs(compressed.stat().st_mtime - (now - 30 * DAY)) < 1
+    assert open_report(compressed) == content
+
+    records = manifest.records()
+    assert [record["name"] for record in records] == [compressed.name, new.name]
+    assert all(record["size"] == (reports / record["name"]).stat().st_size for record in records)
+    assert manifest.page() == [new, compressed]
+    assert sorted(path.name for path in reports.iterdir() if not path.name.startswith(".")) == \
+        sorted([compressed.name, new.name])
+    assert (reports / MANIFEST_NAME).exists()
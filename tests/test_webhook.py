@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+from services.webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+SECRET = "test-secret"
+PATH = "/telegram/webhook"
+HEADERS = {SECRET_HEADER: SECRET}
+
+
+class FakeDispatcher:
+    """Апдейты обрабатываются, пока открыт gate"""
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.updates = []
+
+    async def feed_raw_update(self, bot, update: dict, **data):
+        await self.gate.wait()
+        self.updates.append(update)
+
+
+def with_client(test, **kwargs):
+    async def run():
+        dispatcher = FakeDispatcher()
+        server = WebhookServer(dispatcher, None, secret=SECRET, path=PATH, **{"drain_timeout": 5, **kwargs})
+        async with TestClient(TestServer(server.build_app())) as client:
+            await asyncio.wait_for(test(client, server, dispatcher), timeout=10)
+
+    asyncio.run(run())
+
+
+async def wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)
+
+
+def test_secret_checked_before_body():
+    async def test(client, server, dispatcher):
+        for headers in ({}, {SECRET_HEADER: "wrong"}):
+            response = await client.post(PATH, data="not json", headers=headers)
+            assert response.status == 401
+
+        response = await client.post(PATH, json={"update_id": 1}, headers=HEADERS)
+        assert response.status == 200
+        await wait_for(lambda: dispatcher.updates)
+        assert dispatcher.updates == [{"update_id": 1}]
+
+    with_client(test)
+
+
+def test_malformed_body_rejected_and_slot_released():
+    async def test(client, server, dispatcher):
+        for body in ("{", "[1, 2]", ""):
+            response = await client.post(PATH, data=body, headers=HEADERS)
+            assert response.status == 400
+        # Единственный слот свободен: отклоненные запросы его не удерживают
+        response = await client.post(PATH, json={"update_id": 2}, headers=HEADERS)
+        assert response.status == 200
+        await wait_for(lambda: dispatcher.updates)
+
+    with_client(test, max_concurrency=1)
+
+
+def test_health_and_ready():
+    async def test(client, server, dispatcher):
+        response = await client.get("/healthz")
+        assert (response.status, await response.json()) == (200, {"status": "ok"})
+        response = await client.get("/readyz")
+        assert (response.status, await response.json()) == (200, {"status": "ready", "in_flight": 0})
+
+    with_client(test)
+
+
+def test_draining_finishes_started_updates():
+    async def test(client, server, dispatcher):
+        dispatcher.gate.clear()
+        response = await client.post(PATH, json={"update_id": 3}, headers=HEADERS)
+        assert response.status == 200
+        assert (await (await client.get("/readyz")).json())["in_flight"] == 1
+
+        stopping = asyncio.create_task(server.stop())
+        await asyncio.sleep(0.05)
+        assert not stopping.done()
+        response = await client.get("/readyz")
+        assert (response.status, await response.json()) == (503, {"status": "draining"})
+        response = await client.post(PATH, json={"update_id": 4}, headers=HEADERS)
+        assert response.status == 503
+        # Жив, пока дорабатывает начатое
+        assert (await client.get("/healthz")).status == 200
+
+        dispatcher.gate.set()
+        await stopping
+        assert dispatcher.updates == [{"update_id": 3}]
+
+    with_client(test)
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pytest
+from services.data_models import ExcelSheetData
+from services.report_generator import DUPLICATE_MARK, ReportGenerator
+from services.worker_pool import PoolBusyError, WorkerPool, render_report, split_sheets
+
+
+def test_timed_out_job_keeps_its_slot():
+    pool = WorkerPool(workers=1, max_queue=0, job_timeout=0.5)
+    pool.start()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(time.sleep, 1.5)
+        # Процесс еще выполняет задачу: новая в очередь не проходит
+        assert pool.pending == 1
+        with pytest.raises(PoolBusyError):
+            await pool.run(time.sleep, 0)
+
+        deadline = time.monotonic() + 10
+        while pool.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert pool.pending == 0
+        assert await pool.run(divmod, 7, 2) == (3, 1)
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_report_rendered_in_pool():
+    data = ExcelSheetData(*(None,) * 9, agent_percent=3)
+    data.sheet_name = "Agent"
+    data.inflows.add(1500, "A1")
+    data.inflows.add(700, "A2")
+    data.turnover = data.inflows.total_amount()
+    data.calculate_payments()
+    data.mark_duplicates({1}, set())
+
+    pool = WorkerPool(workers=1)
+    pool.start()
+    try:
+        lines = asyncio.run(pool.run(render_report, data))
+    finally:
+        pool.shutdown()
+    assert lines == list(ReportGenerator.iter_lines(data))
+    assert any(line.endswith(DUPLICATE_MARK) for line in lines)
+
+
+def test_split_sheets_keeps_order():
+    names = [f"S{i}" for i in range(7)]
+    groups = split_sheets(names, 3)
+    assert groups == [["S0", "S1", "S2"], ["S3", "S4"], ["S5", "S6"]]
+    assert split_sheets(names[:2], 4) == [["S0"], ["S1"]]
+
+
+def write_workbook(path, sheet_names: list):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.title = sheet_names[0]
+    for name in sheet_names[1:]:
+        wb.create_sheet(name)
+    for i, ws in enumerate(wb.worksheets):
+        ws["K2"] = ws.title
+        ws["A2"], ws["B2"] = 100 * (i + 1), f"D{i}"
+    wb.save(path)
+
+
+def parse_with_handler(monkeypatch, file_path, workers: int) -> tuple:
+    """Разбор через BotHandler._parse_workbook; возвращает листы и число вызовов imap"""
+    pytest.importorskip("aiogram")
+    from services import bot_handler
+    from services.jobs import FileJob
+
+    monkeypatch.setattr(bot_handler, "PARALLEL_SHEETS_THRESHOLD", 2)
+    pool = WorkerPool(workers=workers)
+    fanouts = []
+    imap = pool.imap
+
+    def spy(func, args_list):
+        fanouts.append(len(args_list))
+        return imap(func, args_list)
+
+    pool.imap = spy
+    handler = bot_handler.BotHandler.__new__(bot_handler.BotHandler)
+    handler.pool = pool
+
+    async def run():
+        return [item async for item in handler._parse_workbook(FileJob(1, None, 3), file_path)]
+
+    pool.start()
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    return results, fanouts
+
+
+def test_fanned_out_sheets_merge_in_workbook_order(tmp_path, monkeypatch):
+    # Имена не по алфавиту: порядок задает книга, а не сортировка
+    sheet_names = ["Яна", "Борис", "Анна", "Виктор", "Глеб"]
+    file_path = tmp_path / "book.xlsx"
+    write_workbook(file_path, sheet_names)
+
+    results, fanouts = parse_with_handler(monkeypatch, file_path, workers=2)
+    assert fanouts == [2]
+    assert [name for name, _ in results] == sheet_names
+    assert [data.full_name for _, data in results] == sheet_names
+    assert [data.turnover for _, data in results] == [100, 200, 300, 400, 500]
+
+
+def test_single_sheet_skips_fan_out(tmp_path, monkeypatch):
+    file_path = tmp_path / "book.xlsx"
+    write_workbook(file_path, ["Один"])
+
+    results, fanouts = parse_with_handler(monkeypatch, file_path, workers=2)
+    assert fanouts == []
+    assert [name for name, _ in results] == ["Один"]